@@ -9,7 +9,7 @@ from modeltranslation.admin import TranslationAdmin
 from simple_history.admin import SimpleHistoryAdmin
 
 from .models import (AcademicField, AcademicLevel, ActionToken, Domain,
-                     Organization, TemporaryToken, User)
+                     Organization, Outbox, TemporaryToken, User)
 from .resources import (AcademicFieldResource, AcademicLevelResource,
                         OrganizationResource, UserResource)
 
@@ -99,6 +99,16 @@ class AcademicLevelAdmin(SimpleHistoryAdmin, TranslationAdmin,
     resource_class = AcademicLevelResource
 
 
+class OutboxAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'recipients', 'status', 'attempts',
+                    'next_attempt', 'created', 'sent',)
+    search_fields = ('subject', 'recipients', 'reference',)
+    list_filter = (
+        'status',
+        'created',
+    )
+
+
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(Organization, CustomOrganizationAdmin)
 admin.site.register(Domain, SimpleHistoryAdmin)
@@ -106,3 +116,4 @@ admin.site.register(ActionToken, ActionTokenAdmin)
 admin.site.register(TemporaryToken, TemporaryTokenAdmin)
 admin.site.register(AcademicField, AcademicFieldAdmin)
 admin.site.register(AcademicLevel, AcademicLevelAdmin)
+admin.site.register(Outbox, OutboxAdmin)
@@ -0,0 +1,55 @@
+from django.core.cache.backends import db
+from django.db import connections, router, transaction
+
+
+class DatabaseCache(db.DatabaseCache):
+    """
+    Database cache whose increments lock the row of the key, so concurrent
+    workers don't lose increments. Queries are sent to the database routed
+    by CacheRouter, outside of the transactions of requests.
+    """
+
+    def incr(self, key, delta=1, version=None):
+        using = router.db_for_write(self.cache_model_class)
+        connection = connections[using]
+
+        with transaction.atomic(using=using):
+            if connection.features.has_select_for_update:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT cache_key FROM %s WHERE cache_key = %%s %s" % (
+                            connection.ops.quote_name(self._table),
+                            connection.ops.for_update_sql(),
+                        ),
+                        [self.make_key(key, version=version)],
+                    )
+            return super().incr(key, delta, version)
+
+
+class CacheRouter:
+    """
+    Sends the queries of database caches to the 'cache' connection. It
+    autocommits, so cached values survive the rollback of a request.
+    """
+
+    app_label = 'django_cache'
+    using = 'cache'
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == self.app_label:
+            return self.using
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == self.app_label:
+            return self.using
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # The 'cache' connection reaches the default database, whose tables
+        # are created through the 'default' connection.
+        if app_label == self.app_label:
+            return True
+        if db == self.using:
+            return False
+        return None
@@ -0,0 +1,139 @@
+import base64
+from smtplib import SMTPRecipientsRefused
+
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.backends.locmem import EmailBackend as LocMemBackend
+
+# Provider specific attributes (ie: Anymail's) kept with outbox emails
+PROVIDER_ATTRIBUTES = (
+    'template_id',
+    'merge_data',
+    'merge_global_data',
+    'merge_metadata',
+    'metadata',
+    'tags',
+    'track_clicks',
+    'track_opens',
+)
+
+
+def serialize_email_message(message):
+    """
+    Returns a JSON serializable dict of an EmailMessage. Attachments must be
+    given as (filename, content, mimetype) tuples.
+    """
+    data = {
+        'subject': message.subject,
+        'body': message.body,
+        'from_email': message.from_email,
+        'to': list(message.to),
+        'cc': list(message.cc),
+        'bcc': list(message.bcc),
+        'reply_to': list(message.reply_to),
+        'headers': dict(message.extra_headers),
+        'alternatives': [
+            list(alternative)
+            for alternative in getattr(message, 'alternatives', [])
+        ],
+        'attachments': list(),
+        'content_subtype': message.content_subtype,
+    }
+
+    for filename, content, mimetype in message.attachments:
+        if isinstance(content, str):
+            content = content.encode()
+        data['attachments'].append([
+            filename,
+            base64.b64encode(content).decode(),
+            mimetype,
+        ])
+
+    for attribute in PROVIDER_ATTRIBUTES:
+        if attribute in message.__dict__:
+            data[attribute] = message.__dict__[attribute]
+
+    return data
+
+
+def deserialize_email_message(data, connection=None):
+    """
+    Returns an EmailMultiAlternatives built from serialize_email_message().
+    """
+    message = EmailMultiAlternatives(
+        subject=data['subject'],
+        body=data['body'],
+        from_email=data['from_email'],
+        to=data['to'],
+        cc=data['cc'],
+        bcc=data['bcc'],
+        reply_to=data['reply_to'],
+        headers=data['headers'],
+        alternatives=[tuple(alternative) for alternative in
+                      data['alternatives']],
+        connection=connection,
+    )
+    # Anymail templates require an empty sender, which the constructor
+    # replaces by DEFAULT_FROM_EMAIL.
+    message.from_email = data['from_email']
+    message.content_subtype = data['content_subtype']
+
+    for filename, content, mimetype in data['attachments']:
+        message.attach(filename, base64.b64decode(content), mimetype)
+
+    for attribute in PROVIDER_ATTRIBUTES:
+        if attribute in data:
+            setattr(message, attribute, data[attribute])
+
+    return message
+
+
+class OutboxEmailBackend(BaseEmailBackend):
+    """
+    Saves emails in the outbox instead of sending them. Emails are written
+    with the default database connection, thus in the current transaction:
+    they are discarded if it is rolled back. The send_outbox command or
+    scheduled event sends them with settings.OUTBOX['EMAIL_BACKEND'].
+    Notifications use it when settings.OUTBOX['ENABLED'] is set, see
+    blitz_api.services.get_notification_connection().
+
+    The optional reference is saved with every email of the connection.
+    """
+
+    def __init__(self, reference='', **kwargs):
+        super(OutboxEmailBackend, self).__init__(**kwargs)
+        self.reference = reference
+
+    def send_messages(self, email_messages):
+        from .models import Outbox
+
+        outbox = [
+            Outbox(
+                subject=message.subject or '',
+                recipients=message.recipients(),
+                reference=self.reference,
+                message=serialize_email_message(message),
+            )
+            for message in email_messages if message.recipients()
+        ]
+        Outbox.objects.bulk_create(outbox)
+
+        return len(outbox)
+
+
+class LocalEmailBackend(LocMemBackend):
+    """
+    Stand-in for a mail server, used by tests of the outbox. Emails are kept
+    in django.core.mail.outbox and emails to failing_recipients are refused.
+    """
+    failing_recipients = set()
+
+    def send_messages(self, messages):
+        for message in messages:
+            refused = set(message.recipients()) & self.failing_recipients
+            if refused:
+                raise SMTPRecipientsRefused({
+                    recipient: (550, b"Mailbox unavailable")
+                    for recipient in refused
+                })
+        return super(LocalEmailBackend, self).send_messages(messages)
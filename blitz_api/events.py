@@ -0,0 +1,24 @@
+"""
+Functions called by the scheduled events of zappa_settings.json.
+"""
+from django.conf import settings
+
+from .services import flush_outbox
+
+
+def send_outbox(event, context):
+    """
+    Sends the pending emails of the outbox. No other batch is started once
+    less than OUTBOX['TIME_MARGIN'] seconds are left before the function
+    times out.
+    """
+    time_limit = None
+    if context is not None:
+        time_limit = (
+            context.get_remaining_time_in_millis() / 1000 -
+            settings.OUTBOX['TIME_MARGIN']
+        )
+
+    sent, failed = flush_outbox(time_limit)
+
+    return {'sent': sent, 'failed': failed}
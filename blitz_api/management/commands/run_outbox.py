@@ -0,0 +1,5 @@
+from .send_outbox import Command as SendOutboxCommand
+
+
+class Command(SendOutboxCommand):
+    help = 'Send the pending emails of the outbox (alias of send_outbox)'
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blitz_api.services import flush_outbox
+
+
+class Command(BaseCommand):
+    help = 'Send the pending emails of the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=settings.OUTBOX['BATCH_SIZE'],
+            help='Maximum number of emails sent per connection',
+        )
+        parser.add_argument(
+            '--time_limit',
+            type=float,
+            default=None,
+            help='Seconds after which no other batch is started',
+        )
+
+    def handle(self, *args, **options):
+        sent, failed = flush_outbox(
+            options['time_limit'],
+            options['batch_size'],
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{sent} email(s) sent, "
+            f"{failed} email(s) failed"))
@@ -0,0 +1,23 @@
+# Generated by Django 2.0.8 on 2026-10-18 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blitz_api', '0019_merge_20190524_1719'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='actiontoken',
+            name='type',
+            field=models.CharField(choices=[('account_activation', 'Account activation'), ('password_change', 'Password change'), ('email_change', 'Email change'), ('calendar_feed', 'Calendar feed')], max_length=100, verbose_name='Type of action'),
+        ),
+        migrations.AlterField(
+            model_name='historicalactiontoken',
+            name='type',
+            field=models.CharField(choices=[('account_activation', 'Account activation'), ('password_change', 'Password change'), ('email_change', 'Email change'), ('calendar_feed', 'Calendar feed')], max_length=100, verbose_name='Type of action'),
+        ),
+    ]
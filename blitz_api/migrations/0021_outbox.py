@@ -0,0 +1,38 @@
+# Generated by Django 2.0.8 on 2026-10-18 22:25
+
+from django.db import migrations, models
+import django.utils.timezone
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blitz_api', '0020_actiontoken_calendar_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Outbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.TextField(blank=True, verbose_name='Subject')),
+                ('recipients', jsonfield.fields.JSONField(verbose_name='Recipients')),
+                ('message', jsonfield.fields.JSONField(verbose_name='Message')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Next attempt')),
+                ('last_error', models.TextField(blank=True, null=True, verbose_name='Last error')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Creation date')),
+                ('sent', models.DateTimeField(blank=True, null=True, verbose_name='Sent date')),
+            ],
+            options={
+                'verbose_name': 'Outbox email',
+                'verbose_name_plural': 'Outbox emails',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='outbox',
+            index_together={('status', 'next_attempt')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0.8 on 2026-10-18 22:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blitz_api', '0021_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outbox',
+            name='reference',
+            field=models.CharField(blank=True, db_index=True, max_length=255, verbose_name='Reference'),
+        ),
+    ]
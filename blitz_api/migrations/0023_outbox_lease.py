@@ -0,0 +1,23 @@
+# Generated by Django 2.0.8 on 2026-10-19 00:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blitz_api', '0022_outbox_reference'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outbox',
+            name='lease',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Lease'),
+        ),
+        migrations.AlterField(
+            model_name='outbox',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10, verbose_name='Status'),
+        ),
+    ]
@@ -167,6 +167,7 @@ class ActionToken(models.Model):
         ('account_activation', _('Account activation')),
         ('password_change', _('Password change')),
         ('email_change', _('Email change')),
+        ('calendar_feed', _('Calendar feed')),
     ]
 
     key = models.CharField(
@@ -392,3 +393,96 @@ class ExportMedia(models.Model):
 
     def __str__(self):
         return self.file.name
+
+
+class Outbox(models.Model):
+    """
+    Email saved in the same transaction as the change that triggered it and
+    sent afterwards by the send_outbox command or scheduled event.
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+
+    STATUS = (
+        (STATUS_PENDING, _("Pending")),
+        (STATUS_SENDING, _("Sending")),
+        (STATUS_SENT, _("Sent")),
+        (STATUS_FAILED, _("Failed")),
+    )
+
+    class Meta:
+        verbose_name = _("Outbox email")
+        verbose_name_plural = _("Outbox emails")
+        index_together = (('status', 'next_attempt'),)
+
+    subject = models.TextField(
+        verbose_name=_("Subject"),
+        blank=True,
+    )
+
+    recipients = JSONField(
+        verbose_name=_("Recipients"),
+    )
+
+    # Groups the emails of a single operation (ie: a coupon notification) to
+    # follow their delivery.
+    reference = models.CharField(
+        verbose_name=_("Reference"),
+        max_length=255,
+        blank=True,
+        db_index=True,
+    )
+
+    # Serialized EmailMessage (body, alternatives, headers and provider
+    # specific attributes such as Anymail's template_id).
+    message = JSONField(
+        verbose_name=_("Message"),
+    )
+
+    status = models.CharField(
+        verbose_name=_("Status"),
+        max_length=10,
+        choices=STATUS,
+        default=STATUS_PENDING,
+    )
+
+    attempts = models.PositiveIntegerField(
+        verbose_name=_("Attempts"),
+        default=0,
+    )
+
+    next_attempt = models.DateTimeField(
+        verbose_name=_("Next attempt"),
+        default=timezone.now,
+    )
+
+    # Time until which the email is claimed by the worker sending it. The
+    # email is claimed again once it expires, if the worker was interrupted.
+    lease = models.DateTimeField(
+        verbose_name=_("Lease"),
+        blank=True,
+        null=True,
+    )
+
+    last_error = models.TextField(
+        verbose_name=_("Last error"),
+        blank=True,
+        null=True,
+    )
+
+    created = models.DateTimeField(
+        verbose_name=_("Creation date"),
+        auto_now_add=True,
+    )
+
+    sent = models.DateTimeField(
+        verbose_name=_("Sent date"),
+        blank=True,
+        null=True,
+    )
+
+    def __str__(self):
+        return '{0} ({1})'.format(self.subject, ', '.join(self.recipients))
@@ -309,7 +309,8 @@ class UserUpdateSerializer(serializers.HyperlinkedModelSerializer):
             message = EmailMessage(
                 subject=None,  # required for SendinBlue templates
                 body='',  # required for SendinBlue templates
-                to=[new_email]
+                to=[new_email],
+                connection=services.get_notification_connection(),
             )
             message.from_email = None  # required for SendinBlue templates
             # use this SendinBlue template
@@ -1,17 +1,32 @@
-from datetime import datetime
+import heapq
+
+from collections import Counter, OrderedDict
+
+from datetime import datetime, timedelta
+from itertools import chain
 
 import pytz
 import re
+import time
 
+from anymail.exceptions import AnymailRecipientsRefused
 from django.apps import apps
 from django.conf import settings
-from django.core.mail import EmailMessage
+from django.core.mail import (EmailMessage, EmailMultiAlternatives,
+                              get_connection)
+from django.db import transaction
+from django.db.models import F, Max, Q
 from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.text import slugify
 from django.utils.translation import ugettext_lazy as _
-from django.template.loader import render_to_string
+from django.template import Context, Variable, VariableDoesNotExist
+from django.template.base import render_value_in_context
+from django.template.loader import get_template
 
 from rest_framework.pagination import PageNumberPagination
 
+from .email_backends import OutboxEmailBackend, deserialize_email_message
 from .exceptions import MailServiceError
 from django.core.mail import send_mail as django_send_mail
 
@@ -20,33 +35,91 @@ from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 LOCAL_TIMEZONE = pytz.timezone(settings.TIME_ZONE)
 
+# Anymail status of recipients to which an email was not sent
+SEND_MAIL_FAILED_STATUS = ('rejected', 'failed', 'invalid')
+
+
+def get_notification_connection(**kwargs):
+    """
+    Returns the connection sending the notifications of the application: the
+    outbox when OUTBOX['ENABLED'] is set, EMAIL_BACKEND otherwise. Emails of
+    mail_admins and error reports are always sent through EMAIL_BACKEND, not
+    lost with the transaction of a failing request.
+    """
+    if settings.OUTBOX.get('ENABLED', False):
+        return OutboxEmailBackend(**kwargs)
+    return get_connection(**kwargs)
+
 
-def send_mail(users, context, template):
+def send_mail(users, context, template, merge_data=None):
     """
     Uses Anymail to send templated emails.
+    Recipients are sent in batches of settings.ANYMAIL['BATCH_SIZE'], with
+    one provider request per batch. Each recipient still receives its own
+    email: batches rely on the batch sending (merge_data) of the provider.
+    Keep a BATCH_SIZE of 1 with providers without it, such as Sendinblue.
+
+    users:      Iterable of User model instances
+    context:    Dict of values shared by every recipient
+    template:   Name of the template in settings.ANYMAIL['TEMPLATES']
+    merge_data: Optional dict of values specific to each recipient, by email
+
     Returns a list of email addresses to which emails failed to be delivered.
+    It is always empty when the outbox is enabled: emails are only saved,
+    their failures are retried and recorded by send_outbox().
     """
     if settings.LOCAL_SETTINGS['EMAIL_SERVICE'] is False:
         raise MailServiceError(_(
             "Email service is disabled."
         ))
     MAIL_SERVICE = settings.ANYMAIL
+    batch_size = MAIL_SERVICE.get('BATCH_SIZE', 1)
+    merge_data = merge_data or dict()
+
+    emails = list(OrderedDict.fromkeys(user.email for user in users))
+    connection = get_notification_connection()
 
     failed_emails = list()
-    for user in users:
+    for index in range(0, len(emails), batch_size):
+        batch = emails[index:index + batch_size]
         message = EmailMessage(
             subject=None,  # required for SendinBlue templates
             body='',  # required for SendinBlue templates
-            to=[user.email]
+            to=batch,
+            connection=connection,
         )
         message.from_email = None  # required for SendinBlue templates
         # use this SendinBlue template
         message.template_id = MAIL_SERVICE["TEMPLATES"].get(template)
-        message.merge_global_data = context
-        response = message.send()  # return number of successfully sent emails
+        if batch_size > 1:
+            message.merge_global_data = context
+            message.merge_data = {
+                email: merge_data.get(email, dict()) for email in batch
+            }
+        else:
+            message.merge_global_data = dict(
+                context,
+                **merge_data.get(batch[0], dict())
+            )
+        try:
+            # return number of successfully sent emails
+            response = message.send()
+        except AnymailRecipientsRefused:
+            response = 0
 
         if not response:
-            failed_emails.append(user.email)
+            failed_emails += batch
+            continue
+
+        # The status of each recipient is not known when the email is only
+        # saved in the outbox.
+        anymail_status = getattr(message, 'anymail_status', None)
+        recipients_status = getattr(anymail_status, 'recipients', None) or {}
+        failed_emails += [
+            email for email in batch
+            if email in recipients_status and
+            recipients_status[email].status in SEND_MAIL_FAILED_STATUS
+        ]
 
     return failed_emails
 
@@ -118,6 +191,545 @@ def get_model_from_name(model_name):
             continue
 
 
+# Sources of the entries of a user's schedule, in tie-breaking order. Each
+# source is: (kind, app label, reservation model, event field, related
+# objects loaded with the reservation)
+SCHEDULE_SOURCES = (
+    ('retirement', 'retirement', 'Reservation', 'retirement',
+     'retirement'),
+    ('timeslot', 'workplace', 'Reservation', 'timeslot',
+     'timeslot__period__workplace'),
+)
+
+
+def get_schedule(user, start=None, end=None, after=None, limit=20):
+    """
+    Returns the active workplace and retirement reservations of a user,
+    ordered by start time. Each source is read with a single query and the
+    results are merged with a heap.
+
+    user:   User model instance
+    start:  Optional datetime, only events starting at or after it are listed
+    end:    Optional datetime, only events starting before it are listed
+    after:  Optional (start_time, kind, id) key of the last entry of the
+            previous page
+    limit:  Maximum number of entries
+
+    Returns a tuple (entries, has_more) where entries is a list of
+    (start_time, kind, reservation) tuples.
+    """
+    iterables = list()
+    kinds = [source[0] for source in SCHEDULE_SOURCES]
+    for rank, (kind, app_label, model_name, event, related) in \
+            enumerate(SCHEDULE_SOURCES):
+        model = apps.get_model(app_label, model_name)
+        start_field = event + '__start_time'
+
+        queryset = model.objects.filter(
+            user=user,
+            is_active=True,
+        ).select_related(related)
+        if start is not None:
+            queryset = queryset.filter(**{start_field + '__gte': start})
+        if end is not None:
+            queryset = queryset.filter(**{start_field + '__lt': end})
+        if after is not None:
+            after_start, after_kind, after_id = after
+            after_rank = kinds.index(after_kind)
+            same_start = Q(**{start_field: after_start})
+            if rank == after_rank:
+                same_start &= Q(id__gt=after_id)
+            elif rank < after_rank:
+                same_start = Q(pk__in=[])
+            queryset = queryset.filter(
+                Q(**{start_field + '__gt': after_start}) | same_start
+            )
+
+        queryset = queryset.order_by(start_field, 'id')[:limit + 1]
+        iterables.append([
+            (
+                getattr(reservation, event).start_time,
+                rank,
+                reservation.id,
+                kind,
+                reservation,
+            )
+            for reservation in queryset
+        ])
+
+    entries = [
+        (start_time, kind, reservation)
+        for start_time, rank, id, kind, reservation
+        in heapq.merge(*iterables)
+    ]
+
+    return entries[:limit], len(entries) > limit
+
+
+def get_calendar_last_modified(user):
+    """
+    Returns the date of the latest change to the reservations of a user or
+    to their reserved events, read from the history tables, or None if the
+    user never had a reservation.
+    """
+    dates = list()
+    for kind, app_label, model_name, event, related in SCHEDULE_SOURCES:
+        model = apps.get_model(app_label, model_name)
+        event_model = model._meta.get_field(event).related_model
+        # Changes to the reserved events (ie: a rescheduled timeslot) must
+        # also invalidate the feed.
+        histories = [
+            model.history.filter(user_id=user.id),
+            event_model.history.filter(
+                id__in=model.objects.filter(
+                    user_id=user.id,
+                ).values(event + '_id'),
+            ),
+        ]
+        for history in histories:
+            dates.append(
+                history.aggregate(
+                    last_modified=Max('history_date'),
+                )['last_modified']
+            )
+    dates = [date for date in dates if date is not None]
+    return max(dates) if dates else None
+
+
+def escape_calendar_text(value):
+    """Escapes a TEXT value of an iCalendar property (RFC 5545 3.3.11)."""
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+
+def format_calendar_line(name, value):
+    """
+    Returns an iCalendar content line, folded to lines of 75 octets at most
+    (RFC 5545 3.1).
+    """
+    line = (name + ':' + value).encode()
+    chunks = list()
+    # Continuation lines start with a space
+    limit = 75
+    while len(line) > limit:
+        # Avoid cutting in the middle of an UTF-8 character
+        cut = limit
+        while (line[cut] & 0xC0) == 0x80:
+            cut -= 1
+        chunks.append(line[:cut])
+        line = line[cut:]
+        limit = 74
+    chunks.append(line)
+    return b'\r\n '.join(chunks).decode() + '\r\n'
+
+
+def iter_calendar(user):
+    """
+    Generates the iCalendar feed of the active reservations of a user, line
+    by line, so that it can be streamed without building it in memory.
+    """
+    def format_date(value):
+        return value.astimezone(pytz.utc).strftime('%Y%m%dT%H%M%SZ')
+
+    organization = settings.LOCAL_SETTINGS['ORGANIZATION']
+    dtstamp = format_date(timezone.now())
+
+    yield 'BEGIN:VCALENDAR\r\n'
+    yield 'VERSION:2.0\r\n'
+    yield format_calendar_line(
+        'PRODID', '-//' + organization + '//Reservations//EN'
+    )
+    yield 'CALSCALE:GREGORIAN\r\n'
+    yield format_calendar_line(
+        'X-WR-CALNAME', escape_calendar_text(organization)
+    )
+
+    for kind, app_label, model_name, event, related in SCHEDULE_SOURCES:
+        model = apps.get_model(app_label, model_name)
+        reservations = model.objects.filter(
+            user_id=user.id,
+            is_active=True,
+        ).select_related(related).order_by(event + '__start_time')
+
+        for reservation in reservations.iterator():
+            instance = getattr(reservation, event)
+            if kind == 'timeslot':
+                place = instance.period.workplace
+                name = place.name if place else instance.period.name
+            else:
+                place = instance
+                name = instance.name
+
+            yield 'BEGIN:VEVENT\r\n'
+            yield format_calendar_line(
+                'UID',
+                '{0}-reservation-{1}@{2}'.format(
+                    kind, reservation.id, slugify(organization)
+                ),
+            )
+            yield 'DTSTAMP:' + dtstamp + '\r\n'
+            yield 'DTSTART:' + format_date(instance.start_time) + '\r\n'
+            yield 'DTEND:' + format_date(instance.end_time) + '\r\n'
+            yield format_calendar_line('SUMMARY', escape_calendar_text(name))
+            if place:
+                location = ', '.join(
+                    str(value) for value in [
+                        place.place_name,
+                        place.address_line1,
+                        place.address_line2,
+                        place.city,
+                        place.state_province,
+                        place.postal_code,
+                        place.country,
+                    ] if value
+                )
+                yield format_calendar_line(
+                    'LOCATION', escape_calendar_text(location)
+                )
+            yield 'END:VEVENT\r\n'
+
+    yield 'END:VCALENDAR\r\n'
+
+
+def bulk_history_update(instances, history_user=None, batch_size=None):
+    """
+    Creates "changed" history records for instances modified with
+    QuerySet.update(), which bypasses the signals used by simple_history.
+    All records are saved with a single bulk insert.
+
+    instances:      Instances of a model with HistoricalRecords, holding
+                    their new values
+    history_user:   User that made the changes
+
+    Returns the list of created history records.
+    """
+    instances = list(instances)
+    if not instances:
+        return list()
+
+    history_model = type(instances[0]).history.model
+    excluded_fields = history_model._history_excluded_fields
+    history_date = timezone.now()
+
+    records = [
+        history_model(
+            history_date=history_date,
+            history_user=history_user,
+            history_type='~',
+            **{
+                field.attname: getattr(instance, field.attname)
+                for field in instance._meta.fields
+                if field.name not in excluded_fields
+            }
+        )
+        for instance in instances
+    ]
+
+    return history_model.objects.bulk_create(records, batch_size=batch_size)
+
+
+def get_notification_templates(template_name):
+    """
+    Returns the compiled plain text and HTML templates of a notification
+    (ie: "reminder" for reminder.txt and reminder.html). Compiled templates
+    are kept by Django's cached template loader unless DEBUG is set.
+    """
+    return (
+        get_template(template_name + '.txt'),
+        get_template(template_name + '.html'),
+    )
+
+
+def render_notification(template_name, context):
+    """
+    Renders a notification with its compiled templates.
+    Returns a tuple of the plain text and HTML messages.
+    """
+    plain_template, html_template = get_notification_templates(template_name)
+    return plain_template.render(context), html_template.render(context)
+
+
+class RecipientPlaceholder:
+    """
+    Stands for a per-recipient value while rendering a notification once for
+    many recipients. Attribute lookups return nested placeholders and the
+    placeholder is rendered as a marker replaced by the value afterwards.
+
+    Other uses of the placeholder (ie: in a condition, a loop or a
+    comparison) can't give the value of a recipient, they are recorded in
+    the rendering to render the notification per recipient instead.
+    """
+    MARKER = '\x00{0}\x00'
+
+    def __init__(self, path, rendering):
+        self._path = path
+        self._rendering = rendering
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return RecipientPlaceholder(self._path + '.' + name, self._rendering)
+
+    def __str__(self):
+        self._rendering['markers'][self._path] += 1
+        return self.MARKER.format(self._path)
+
+    def _invalidate(self, *args):
+        self._rendering['valid'] = False
+        return NotImplemented
+
+    def __bool__(self):
+        self._invalidate()
+        return True
+
+    def __iter__(self):
+        self._invalidate()
+        return iter(())
+
+    __eq__ = __ne__ = __lt__ = __le__ = __gt__ = __ge__ = _invalidate
+    __hash__ = object.__hash__
+
+
+RECIPIENT_MARKER = re.compile(
+    RecipientPlaceholder.MARKER.format(r'([\w.]+)')
+)
+
+
+def render_notifications(template_name, context, recipient_contexts):
+    """
+    Renders a notification for many recipients. Templates are rendered once
+    with the shared context, per-recipient values are then substituted in
+    the rendered messages.
+
+    Per-recipient values output as is (ie: {{USER.first_name}}) are
+    substituted. If they are used in tags or filters, or if a value can't be
+    resolved for a recipient, the notification is rendered per recipient.
+
+    template_name:      Name of the templates without extension
+    context:            Dict of values shared by every recipient
+    recipient_contexts: List of dicts of per-recipient values, all with the
+                        same keys (ie: [{'USER': user}, ...])
+
+    Yields a tuple of the plain text and HTML messages per recipient.
+    """
+    if not recipient_contexts:
+        return
+
+    rendering = {'markers': Counter(), 'valid': True}
+    shared_context = dict(context)
+    for key in recipient_contexts[0]:
+        shared_context[key] = RecipientPlaceholder(key, rendering)
+
+    # Split rendered messages into literal text at even positions and paths
+    # of recipient values at odd positions.
+    parts = [
+        RECIPIENT_MARKER.split(message)
+        for message in render_notification(template_name, shared_context)
+    ]
+
+    # Every marker must come out of the templates as rendered, filters
+    # change or drop them.
+    markers = Counter(chain.from_iterable(
+        message_parts[1::2] for message_parts in parts
+    ))
+    if not rendering['valid'] or markers != rendering['markers']:
+        parts = None
+
+    escape_context = Context(autoescape=True)
+
+    for recipient_context in recipient_contexts:
+        messages = None
+        if parts is not None:
+            values = dict()
+            try:
+                for path in markers:
+                    values[path] = render_value_in_context(
+                        Variable(path).resolve(recipient_context),
+                        escape_context,
+                    )
+            except VariableDoesNotExist:
+                pass
+            else:
+                messages = tuple(
+                    ''.join(
+                        values[part] if index % 2 else part
+                        for index, part in enumerate(message_parts)
+                    )
+                    for message_parts in parts
+                )
+        if messages is None:
+            messages = render_notification(
+                template_name,
+                dict(context, **recipient_context),
+            )
+        yield tuple(messages)
+
+
+def send_notifications(subject, messages, emails, connection=None):
+    """
+    Sends rendered notifications through a single connection.
+
+    subject:    Subject of every email
+    messages:   Iterable of tuples of the plain text and HTML messages, one
+                per email address
+    emails:     Iterable of email addresses
+    connection: Optional email backend instance, the notification one
+                otherwise
+
+    Returns the number of successfully sent emails.
+    """
+    connection = connection or get_notification_connection()
+
+    email_messages = list()
+    for (plain_msg, msg_html), email in zip(messages, emails):
+        email_message = EmailMultiAlternatives(
+            subject,
+            plain_msg,
+            settings.DEFAULT_FROM_EMAIL,
+            [email],
+            connection=connection,
+        )
+        email_message.attach_alternative(msg_html, "text/html")
+        email_messages.append(email_message)
+
+    if not email_messages:
+        return 0
+
+    return connection.send_messages(email_messages)
+
+
+def send_outbox(batch_size=None):
+    """
+    Sends a batch of pending emails of the outbox through a single
+    connection. Emails are first claimed in a short transaction, with
+    SELECT ... FOR UPDATE SKIP LOCKED so that concurrent workers claim
+    different emails, and leased for OUTBOX['LEASE'] seconds. They are sent
+    outside of any transaction and the result of each email is saved as soon
+    as it is known. Emails of an interrupted worker are claimed again once
+    their lease expires. Failed emails are retried with an exponential
+    backoff until OUTBOX['MAX_ATTEMPTS'] is reached.
+
+    batch_size: Maximum number of emails sent, defaults to
+                OUTBOX['BATCH_SIZE']
+
+    Returns a tuple of the numbers of sent and failed emails.
+    """
+    Outbox = apps.get_model('blitz_api', 'Outbox')
+    OUTBOX_SETTINGS = settings.OUTBOX
+
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            Outbox.objects.select_for_update(skip_locked=True).filter(
+                Q(status=Outbox.STATUS_PENDING, next_attempt__lte=now) |
+                Q(status=Outbox.STATUS_SENDING, lease__lte=now)
+            ).order_by('next_attempt')[
+                :batch_size or OUTBOX_SETTINGS['BATCH_SIZE']
+            ]
+        )
+        if not emails:
+            return 0, 0
+
+        lease = now + timedelta(seconds=OUTBOX_SETTINGS['LEASE'])
+        Outbox.objects.filter(
+            id__in=[email.id for email in emails],
+        ).update(
+            status=Outbox.STATUS_SENDING,
+            attempts=F('attempts') + 1,
+            lease=lease,
+        )
+
+    def record_error(email, error):
+        email.attempts += 1
+        fields = {
+            'status': Outbox.STATUS_PENDING,
+            'last_error': error,
+            'lease': None,
+        }
+        if email.attempts >= OUTBOX_SETTINGS['MAX_ATTEMPTS']:
+            fields['status'] = Outbox.STATUS_FAILED
+        else:
+            fields['next_attempt'] = now + timedelta(
+                seconds=OUTBOX_SETTINGS['RETRY_DELAY'] *
+                2 ** (email.attempts - 1)
+            )
+        Outbox.objects.filter(id=email.id).update(**fields)
+
+    connection = get_connection(OUTBOX_SETTINGS['EMAIL_BACKEND'])
+    try:
+        connection.open()
+    except Exception as err:
+        for email in emails:
+            record_error(email, repr(err))
+        return 0, len(emails)
+
+    failed = 0
+    try:
+        for email in emails:
+            message = deserialize_email_message(
+                email.message,
+                connection=connection,
+            )
+            try:
+                sent = connection.send_messages([message])
+            except Exception as err:
+                error = repr(err)
+            else:
+                # Anymail reports recipients refused by the provider
+                status = getattr(message, 'anymail_status', None)
+                if not sent or (status and status.status and
+                                status.status <=
+                                set(SEND_MAIL_FAILED_STATUS)):
+                    error = "Not sent: {0}".format(
+                        status.status if status else sent
+                    )
+                else:
+                    error = None
+
+            if error is None:
+                Outbox.objects.filter(id=email.id).update(
+                    status=Outbox.STATUS_SENT,
+                    last_error=None,
+                    lease=None,
+                    sent=timezone.now(),
+                )
+            else:
+                record_error(email, error)
+                failed += 1
+    finally:
+        connection.close()
+
+    return len(emails) - failed, failed
+
+
+def flush_outbox(time_limit=None, batch_size=None):
+    """
+    Sends batches of pending emails of the outbox until none is due.
+
+    time_limit: Seconds after which no other batch is started
+    batch_size: Maximum number of emails sent per batch, defaults to
+                OUTBOX['BATCH_SIZE']
+
+    Returns a tuple of the numbers of sent and failed emails.
+    """
+    start = time.monotonic()
+    total_sent = total_failed = 0
+    while time_limit is None or time.monotonic() - start < time_limit:
+        sent, failed = send_outbox(batch_size)
+        if not (sent or failed):
+            break
+        total_sent += sent
+        total_failed += failed
+
+    return total_sent, total_failed
+
+
 def notify_user_of_new_account(email, password):
     if settings.LOCAL_SETTINGS['EMAIL_SERVICE'] is False:
         raise MailServiceError(_("Email service is disabled."))
@@ -127,13 +739,9 @@ def notify_user_of_new_account(email, password):
             'PASSWORD': password,
         }
 
-        plain_msg = render_to_string(
-            "notify_user_of_new_account.txt",
-            merge_data
-        )
-        msg_html = render_to_string(
-            "notify_user_of_new_account.html",
-            merge_data
+        plain_msg, msg_html = render_notification(
+            "notify_user_of_new_account",
+            merge_data,
         )
 
         return django_send_mail(
@@ -142,6 +750,7 @@ def notify_user_of_new_account(email, password):
             settings.DEFAULT_FROM_EMAIL,
             [email],
             html_message=msg_html,
+            connection=get_notification_connection(),
         )
 
 
@@ -105,6 +105,12 @@ LOGGING = {
             'level': 'INFO',  # change debug level as appropiate
             'propagate': False,
         },
+        # Latency of each request to the payment API
+        'store.paysafe': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 # Disable logging during unittests. Can be overriden in specific tests with:
@@ -144,6 +150,36 @@ DATABASES = {
     )
 }
 
+# Connection of database caches to the default database. It autocommits
+# outside of the transactions of requests, see blitz_api.cache_backends.
+DATABASES['cache'] = dict(DATABASES['default'])
+if 'sqlite' not in DATABASES['cache']['ENGINE']:
+    DATABASES['cache']['TEST'] = {
+        'NAME': 'test_cache_' + DATABASES['cache']['NAME'],
+    }
+
+DATABASE_ROUTERS = ['blitz_api.cache_backends.CacheRouter']
+
+# Caches
+# https://docs.djangoproject.com/en/2.0/topics/cache/
+
+# The default cache is kept in the memory of each process. The shared cache
+# is seen by every worker, run "python manage.py createcachetable" to create
+# its table when using the database backend. Memcached or Redis backends
+# save the database queries of the shared cache.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': config(
+            'SHARED_CACHE_BACKEND',
+            default='blitz_api.cache_backends.DatabaseCache',
+        ),
+        'LOCATION': config('SHARED_CACHE_LOCATION', default='cache_table'),
+    },
+}
+
 # Custom user model
 
 AUTH_USER_MODEL = 'blitz_api.User'
@@ -268,6 +304,11 @@ ACTIVATION_TOKENS = {
     'MINUTES': config('ACTIVATION_TOKENS_MINUTES', default=1440, cast=int),
 }
 
+# Tokens used in the url of the users' calendar feeds
+CALENDAR_FEED_TOKENS = {
+    'DAYS': config('CALENDAR_FEED_TOKENS_DAYS', default=3650, cast=int),
+}
+
 # Email service configuration (using Anymail).
 # Refer to Anymail's documentation for configuration details.
 
@@ -275,6 +316,10 @@ ANYMAIL = {
     'SENDINBLUE_API_KEY': config('SENDINBLUE_API_KEY', default='example_key'),
     'REQUESTS_TIMEOUT': config('REQUESTS_TIMEOUT', default=(30, 30),
                                cast=tuple),
+    # Recipients sent in a single request. Values above 1 require an Anymail
+    # backend sending templates with merge_data (ie: Postmark, SendGrid or
+    # Mailgun), not Sendinblue whose backend sends one recipient per request.
+    'BATCH_SIZE': config('ANYMAIL_BATCH_SIZE', default=1, cast=int),
     'TEMPLATES': {
         'CONFIRM_SIGN_UP': config('CONFIRM_SIGN_UP', default='example_id'),
         'FORGOT_PASSWORD': config('FORGOT_PASSWORD', default='example_id'),
@@ -286,6 +331,24 @@ ANYMAIL = {
 }
 EMAIL_BACKEND = config('EMAIL_BACKEND',
                        default='django.core.mail.backends.smtp.EmailBackend')
+
+# When enabled, notifications are saved in the outbox and sent with
+# OUTBOX['EMAIL_BACKEND'] by the send_outbox command, or by the scheduled
+# event calling blitz_api.events.send_outbox on Lambda (see
+# zappa_settings.json). Error reports to ADMINS are always sent directly.
+OUTBOX = {
+    'ENABLED': config('OUTBOX_ENABLED', default=False, cast=bool),
+    'EMAIL_BACKEND': config('OUTBOX_EMAIL_BACKEND', default=EMAIL_BACKEND),
+    'BATCH_SIZE': config('OUTBOX_BATCH_SIZE', default=100, cast=int),
+    'MAX_ATTEMPTS': config('OUTBOX_MAX_ATTEMPTS', default=8, cast=int),
+    # Seconds after which emails claimed by an interrupted worker are sent
+    # again. Keep it above the time taken to send a batch.
+    'LEASE': config('OUTBOX_LEASE', default=300, cast=int),
+    # Seconds before the first retry, doubled after each failed attempt
+    'RETRY_DELAY': config('OUTBOX_RETRY_DELAY', default=60, cast=int),
+    # Seconds kept to finish a batch before the scheduled event times out
+    'TIME_MARGIN': config('OUTBOX_TIME_MARGIN', default=10, cast=int),
+}
 # This 'FROM' email is not used with SendInBlue templates
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL',
                             default='noreply@example.org')
@@ -331,6 +394,34 @@ PAYSAFE = {
                        default='https://api.test.paysafe.com/'),
     'VAULT_URL': config('PAYSAFE_VAULT_URL', default='customervault/v1/'),
     'CARD_URL': config('PAYSAFE_CARD_URL', default='cardpayments/v1/'),
+    # Seconds to wait for a connection and for a response
+    'CONNECT_TIMEOUT': config('PAYSAFE_CONNECT_TIMEOUT', default=3.05,
+                              cast=float),
+    'READ_TIMEOUT': config('PAYSAFE_READ_TIMEOUT', default=8, cast=float),
+    # Seconds after which a call ends, retries included. Keep the calls of a
+    # request within the Lambda and API Gateway timeouts (30 seconds).
+    'TOTAL_TIMEOUT': config('PAYSAFE_TOTAL_TIMEOUT', default=10, cast=float),
+    # Retries of GET and DELETE requests, delayed by a random time up to
+    # RETRY_BACKOFF seconds doubled after each retry
+    'RETRIES': config('PAYSAFE_RETRIES', default=2, cast=int),
+    'RETRY_BACKOFF': config('PAYSAFE_RETRY_BACKOFF', default=0.5, cast=float),
+    # Connections kept alive with the payment API
+    'POOL_SIZE': config('PAYSAFE_POOL_SIZE', default=10, cast=int),
+    # The circuit breaker opens when BREAKER_ERROR_RATE of at least
+    # BREAKER_MIN_REQUESTS requests sent within BREAKER_WINDOW seconds failed
+    # or took more than BREAKER_SLOW_CALL seconds. Requests fail immediately
+    # for BREAKER_OPEN_TIMEOUT seconds, then a single request probes the API.
+    # Counters are kept in BREAKER_CACHE, which must be shared by workers.
+    'BREAKER_CACHE': config('PAYSAFE_BREAKER_CACHE', default='shared'),
+    'BREAKER_ERROR_RATE': config('PAYSAFE_BREAKER_ERROR_RATE', default=0.5,
+                                 cast=float),
+    'BREAKER_MIN_REQUESTS': config('PAYSAFE_BREAKER_MIN_REQUESTS', default=10,
+                                   cast=int),
+    'BREAKER_WINDOW': config('PAYSAFE_BREAKER_WINDOW', default=60, cast=int),
+    'BREAKER_SLOW_CALL': config('PAYSAFE_BREAKER_SLOW_CALL', default=5,
+                                cast=float),
+    'BREAKER_OPEN_TIMEOUT': config('PAYSAFE_BREAKER_OPEN_TIMEOUT', default=30,
+                                   cast=float),
 }
 
 # django-import-export
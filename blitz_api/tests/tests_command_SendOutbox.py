@@ -0,0 +1,314 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives, mail_admins, send_mail
+from django.core.management import call_command
+from django.db import transaction
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from blitz_api import events
+from blitz_api.email_backends import LocalEmailBackend
+from blitz_api.models import Outbox
+from blitz_api.services import (flush_outbox, send_notifications,
+                                send_outbox)
+
+OUTBOX = {
+    'ENABLED': True,
+    'EMAIL_BACKEND': 'blitz_api.email_backends.LocalEmailBackend',
+    'BATCH_SIZE': 2,
+    'MAX_ATTEMPTS': 2,
+    'LEASE': 300,
+    'RETRY_DELAY': 60,
+    'TIME_MARGIN': 0,
+}
+
+
+@override_settings(
+    EMAIL_BACKEND='blitz_api.email_backends.OutboxEmailBackend',
+    OUTBOX=OUTBOX,
+)
+class SendOutboxTests(APITestCase):
+
+    def tearDown(self):
+        LocalEmailBackend.failing_recipients = set()
+
+    def test_queue(self):
+        """
+        Ensure that emails are saved in the outbox instead of being sent.
+        """
+        message = EmailMultiAlternatives(
+            "Subject",
+            "Plain",
+            "sender@example.com",
+            ["user@example.com"],
+            cc=["cc@example.com"],
+        )
+        message.attach_alternative("<p>Html</p>", "text/html")
+        message.attach("file.txt", "content", "text/plain")
+        message.send()
+
+        self.assertEqual(len(mail.outbox), 0)
+
+        email = Outbox.objects.get()
+
+        self.assertEqual(email.status, Outbox.STATUS_PENDING)
+        self.assertEqual(
+            email.recipients,
+            ["user@example.com", "cc@example.com"],
+        )
+
+        call_command('send_outbox', stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, "Subject")
+        self.assertEqual(mail.outbox[0].cc, ["cc@example.com"])
+        self.assertEqual(
+            mail.outbox[0].alternatives,
+            [("<p>Html</p>", "text/html")],
+        )
+        self.assertEqual(
+            mail.outbox[0].attachments,
+            [("file.txt", "content", "text/plain")],
+        )
+
+        email.refresh_from_db()
+
+        self.assertEqual(email.status, Outbox.STATUS_SENT)
+        self.assertEqual(email.attempts, 1)
+
+    def test_provider_attributes(self):
+        """
+        Ensure that provider specific attributes are kept until the email
+        is sent.
+        """
+        message = EmailMultiAlternatives(to=["user@example.com"])
+        message.from_email = None
+        message.template_id = 5
+        message.merge_global_data = {'NAME': "Alice"}
+        message.send()
+
+        send_outbox()
+
+        self.assertEqual(mail.outbox[0].from_email, None)
+        self.assertEqual(mail.outbox[0].template_id, 5)
+        self.assertEqual(mail.outbox[0].merge_global_data, {'NAME': "Alice"})
+
+    def test_rollback(self):
+        """
+        Ensure that emails are discarded with the transaction saving them.
+        """
+        try:
+            with transaction.atomic():
+                send_mail(
+                    "Subject",
+                    "Plain",
+                    "sender@example.com",
+                    ["user@example.com"],
+                )
+                raise ValueError
+        except ValueError:
+            pass
+
+        self.assertFalse(Outbox.objects.exists())
+
+    @override_settings(
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+        ADMINS=[("Admin", "admin@example.com")],
+    )
+    def test_notifications(self):
+        """
+        Ensure that notifications are saved in the outbox while error reports
+        to admins are sent directly.
+        """
+        send_notifications(
+            "Subject",
+            [("Plain", "<p>Html</p>")],
+            ["user@example.com"],
+        )
+        mail_admins("Error", "Traceback")
+
+        self.assertEqual(Outbox.objects.get().recipients, ["user@example.com"])
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["admin@example.com"])
+
+    @override_settings(
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+        OUTBOX=dict(OUTBOX, ENABLED=False),
+    )
+    def test_notifications_disabled(self):
+        """
+        Ensure that notifications are sent directly when the outbox is
+        disabled.
+        """
+        send_notifications(
+            "Subject",
+            [("Plain", "<p>Html</p>")],
+            ["user@example.com"],
+        )
+
+        self.assertFalse(Outbox.objects.exists())
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_batch(self):
+        """
+        Ensure that emails are sent in batches.
+        """
+        for index in range(3):
+            send_mail(
+                "Subject",
+                "Plain",
+                "sender@example.com",
+                ["user{0}@example.com".format(index)],
+            )
+
+        self.assertEqual(send_outbox(), (2, 0))
+        self.assertEqual(send_outbox(), (1, 0))
+        self.assertEqual(send_outbox(), (0, 0))
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_flush(self):
+        """
+        Ensure that batches are sent until no email is due.
+        """
+        for index in range(3):
+            send_mail(
+                "Subject",
+                "Plain",
+                "sender@example.com",
+                ["user{0}@example.com".format(index)],
+            )
+
+        self.assertEqual(flush_outbox(), (3, 0))
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_run_outbox(self):
+        """
+        Ensure that run_outbox, the former name of the command, still sends
+        the outbox.
+        """
+        send_mail(
+            "Subject",
+            "Plain",
+            "sender@example.com",
+            ["user@example.com"],
+        )
+        stdout = StringIO()
+
+        call_command('run_outbox', stdout=stdout)
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn("1 email(s) sent", stdout.getvalue())
+
+    def test_scheduled_event(self):
+        """
+        Ensure that the scheduled event sends pending emails and starts no
+        batch once the function is about to time out.
+        """
+        class Context:
+            remaining_time = 60000
+
+            def get_remaining_time_in_millis(self):
+                return self.remaining_time
+
+        for index in range(3):
+            send_mail(
+                "Subject",
+                "Plain",
+                "sender@example.com",
+                ["user{0}@example.com".format(index)],
+            )
+
+        context = Context()
+        context.remaining_time = 0
+
+        self.assertEqual(
+            events.send_outbox({}, context),
+            {'sent': 0, 'failed': 0},
+        )
+
+        context.remaining_time = 60000
+
+        self.assertEqual(
+            events.send_outbox({}, context),
+            {'sent': 3, 'failed': 0},
+        )
+
+    def test_retry(self):
+        """
+        Ensure that failed emails are retried with a backoff and abandoned
+        after the maximum number of attempts.
+        """
+        LocalEmailBackend.failing_recipients = {"user@example.com"}
+
+        send_mail(
+            "Subject",
+            "Plain",
+            "sender@example.com",
+            ["user@example.com"],
+        )
+        send_mail(
+            "Subject",
+            "Plain",
+            "sender@example.com",
+            ["user2@example.com"],
+        )
+
+        self.assertEqual(send_outbox(), (1, 1))
+
+        email = Outbox.objects.get(status=Outbox.STATUS_PENDING)
+
+        self.assertEqual(email.attempts, 1)
+        self.assertIn("SMTPRecipientsRefused", email.last_error)
+        self.assertGreater(
+            email.next_attempt,
+            timezone.now() + timedelta(seconds=59),
+        )
+
+        # Not yet retried
+        self.assertEqual(send_outbox(), (0, 0))
+
+        email.next_attempt = timezone.now()
+        email.save()
+
+        self.assertEqual(send_outbox(), (0, 1))
+
+        email.refresh_from_db()
+
+        self.assertEqual(email.status, Outbox.STATUS_FAILED)
+        self.assertEqual(email.attempts, 2)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_lease(self):
+        """
+        Ensure that emails are claimed before being sent, and claimed again
+        once the lease of an interrupted worker expires.
+        """
+        send_mail(
+            "Subject",
+            "Plain",
+            "sender@example.com",
+            ["user@example.com"],
+        )
+        email = Outbox.objects.get()
+        Outbox.objects.filter(id=email.id).update(
+            status=Outbox.STATUS_SENDING,
+            attempts=1,
+            lease=timezone.now() + timedelta(seconds=60),
+        )
+
+        # Claimed by another worker
+        self.assertEqual(send_outbox(), (0, 0))
+
+        Outbox.objects.filter(id=email.id).update(lease=timezone.now())
+
+        self.assertEqual(send_outbox(), (1, 0))
+
+        email.refresh_from_db()
+
+        self.assertEqual(email.status, Outbox.STATUS_SENT)
+        self.assertEqual(email.attempts, 2)
+        self.assertIsNone(email.lease)
+        self.assertEqual(len(mail.outbox), 1)
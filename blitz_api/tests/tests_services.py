@@ -0,0 +1,276 @@
+import json
+
+import responses
+from django.core import mail
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from blitz_api.factories import UserFactory
+from blitz_api.models import Outbox
+from blitz_api.services import (render_notification, render_notifications,
+                                send_mail, send_notifications, send_outbox)
+
+
+class NotificationTests(APITestCase):
+
+    def setUp(self):
+        self.user = UserFactory(first_name="Alice")
+        self.user2 = UserFactory(first_name="O'Neil & Co")
+        self.context = {
+            'RETIREMENT': {
+                'name': "mega_retirement",
+                'review_url': "example.com/review",
+            },
+        }
+
+    def test_render_notifications(self):
+        """
+        Ensure that rendering once for many recipients gives the same
+        messages as rendering for each recipient, escaping included.
+        """
+        messages = list(render_notifications(
+            "throwback",
+            self.context,
+            [{'USER': self.user}, {'USER': self.user2}],
+        ))
+
+        for message, user in zip(messages, [self.user, self.user2]):
+            self.assertEqual(
+                message,
+                render_notification(
+                    "throwback",
+                    dict(self.context, USER=user),
+                ),
+            )
+
+        self.assertIn("Bonjour O&#39;Neil &amp; Co", messages[1][0])
+
+    @override_settings(TEMPLATES=[{
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'OPTIONS': {
+            'loaders': [('django.template.loaders.locmem.Loader', {
+                'greeting.txt': "{% if USER.is_staff %}Admin {% endif %}"
+                                "{{USER.first_name|upper}}",
+                'greeting.html': "<p>{{USER.first_name}}</p>",
+                'unknown.txt': "{{USER.first_name}}{{USER.unknown}}",
+                'unknown.html': "<p>{{USER.last_name}}</p>",
+            })],
+        },
+    }])
+    def test_render_notifications_per_recipient(self):
+        """
+        Ensure that notifications using per-recipient values in tags or
+        filters, or values missing for a recipient, are rendered per
+        recipient.
+        """
+        self.user2.is_staff = True
+        recipient_contexts = [{'USER': self.user}, {'USER': self.user2}]
+
+        for template_name in ("greeting", "unknown"):
+            messages = list(render_notifications(
+                template_name,
+                self.context,
+                recipient_contexts,
+            ))
+
+            self.assertEqual(messages, [
+                render_notification(
+                    template_name,
+                    dict(self.context, **recipient_context),
+                ) for recipient_context in recipient_contexts
+            ])
+
+        messages = list(render_notifications(
+            "greeting",
+            self.context,
+            recipient_contexts,
+        ))
+
+        self.assertEqual(messages[0][0], "ALICE")
+        self.assertEqual(messages[1][0], "Admin O&#39;NEIL &amp; CO")
+
+    def test_send_notifications(self):
+        """
+        Ensure that one email is sent per address.
+        """
+        sent = send_notifications(
+            "Subject",
+            [("plain", "<p>html</p>")] * 2,
+            [self.user.email, self.user2.email],
+        )
+
+        self.assertEqual(sent, 2)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[1].to, [self.user2.email])
+        self.assertEqual(
+            mail.outbox[1].alternatives,
+            [("<p>html</p>", "text/html")],
+        )
+
+
+@override_settings(
+    LOCAL_SETTINGS={
+        "EMAIL_SERVICE": True,
+    },
+    EMAIL_BACKEND='anymail.backends.postmark.EmailBackend',
+    ANYMAIL={
+        'POSTMARK_SERVER_TOKEN': 'example_token',
+        'POSTMARK_API_URL': 'http://example.com/postmark/',
+        'BATCH_SIZE': 50,
+        'TEMPLATES': {
+            'CONFIRM_SIGN_UP': 1,
+        },
+    },
+)
+class SendMailTests(APITestCase):
+
+    def setUp(self):
+        self.users = [
+            UserFactory(email="user%s@example.com" % index)
+            for index in range(120)
+        ]
+
+    def add_batch_response(self, rejected=()):
+        def callback(request):
+            messages = json.loads(request.body)['Messages']
+            body = [
+                {
+                    'ErrorCode': 406,
+                    'Message': "You tried to send to a recipient that has "
+                               "been marked as inactive.\nFound inactive "
+                               "addresses: %s.\nInactive recipients are ones "
+                               "that have generated a hard bounce or a spam "
+                               "complaint. " % message['To'],
+                } if message['To'] in rejected else {
+                    'ErrorCode': 0,
+                    'Message': "OK",
+                    'To': message['To'],
+                    'MessageID': message['To'],
+                    'SubmittedAt': "2018-01-01T00:00:00.0000000-05:00",
+                }
+                for message in messages
+            ]
+            return 200, {}, json.dumps(body)
+
+        responses.add_callback(
+            responses.POST,
+            'http://example.com/postmark/email/batchWithTemplates',
+            callback=callback,
+            content_type='application/json',
+        )
+
+    @responses.activate
+    def test_send_mail(self):
+        """
+        Ensure that recipients are sent in batches, each recipient with its
+        own message and merge data.
+        """
+        self.add_batch_response()
+
+        failed_emails = send_mail(
+            self.users,
+            {'activation_url': "example.com"},
+            'CONFIRM_SIGN_UP',
+            merge_data={
+                "user0@example.com": {'first_name': "Alice"},
+            },
+        )
+
+        self.assertEqual(failed_emails, [])
+        self.assertEqual(len(responses.calls), 3)
+
+        messages = json.loads(responses.calls[0].request.body)['Messages']
+
+        self.assertEqual(len(messages), 50)
+        self.assertEqual(messages[0]['To'], "user0@example.com")
+        self.assertEqual(
+            messages[0]['TemplateModel'],
+            {'activation_url': "example.com", 'first_name': "Alice"},
+        )
+        self.assertEqual(
+            messages[1]['TemplateModel'],
+            {'activation_url': "example.com"},
+        )
+
+    @responses.activate
+    def test_send_mail_rejected(self):
+        """
+        Ensure that rejected recipients are returned as failed.
+        """
+        self.add_batch_response(rejected=("user7@example.com",))
+
+        failed_emails = send_mail(
+            self.users,
+            {'activation_url': "example.com"},
+            'CONFIRM_SIGN_UP',
+        )
+
+        self.assertEqual(failed_emails, ["user7@example.com"])
+        self.assertEqual(len(responses.calls), 3)
+
+    @responses.activate
+    def test_send_mail_outbox(self):
+        """
+        Ensure that batches saved in the outbox keep their merge data and
+        are sent with one request per batch.
+        """
+        self.add_batch_response()
+
+        with self.settings(OUTBOX={
+            'ENABLED': True,
+            'EMAIL_BACKEND': 'anymail.backends.postmark.EmailBackend',
+            'BATCH_SIZE': 10,
+            'MAX_ATTEMPTS': 1,
+            'LEASE': 300,
+            'RETRY_DELAY': 60,
+        }):
+            failed_emails = send_mail(
+                self.users,
+                {'activation_url': "example.com"},
+                'CONFIRM_SIGN_UP',
+                merge_data={
+                    "user0@example.com": {'first_name': "Alice"},
+                },
+            )
+
+            self.assertEqual(failed_emails, [])
+            self.assertEqual(Outbox.objects.count(), 3)
+            self.assertEqual(len(responses.calls), 0)
+
+            self.assertEqual(send_outbox(), (3, 0))
+
+        self.assertEqual(len(responses.calls), 3)
+
+        messages = json.loads(responses.calls[0].request.body)['Messages']
+
+        self.assertEqual(len(messages), 50)
+        self.assertEqual(
+            messages[0]['TemplateModel'],
+            {'activation_url': "example.com", 'first_name': "Alice"},
+        )
+
+    def test_send_mail_single(self):
+        """
+        Ensure that a recipient gets the shared context and its merge data
+        when batches are not supported by the provider.
+        """
+        with self.settings(
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            ANYMAIL={'TEMPLATES': {'CONFIRM_SIGN_UP': 1}},
+        ):
+            failed_emails = send_mail(
+                self.users[:2],
+                {'activation_url': "example.com"},
+                'CONFIRM_SIGN_UP',
+                merge_data={
+                    "user1@example.com": {'first_name': "Bob"},
+                },
+            )
+
+        self.assertEqual(failed_emails, [])
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[1].to, ["user1@example.com"])
+        self.assertEqual(
+            mail.outbox[1].merge_global_data,
+            {'activation_url': "example.com", 'first_name': "Bob"},
+        )
@@ -0,0 +1,237 @@
+import json
+from datetime import datetime
+
+import pytz
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from blitz_api.factories import UserFactory
+from blitz_api.models import ActionToken
+from blitz_api.services import format_calendar_line
+from retirement.models import Retirement
+from retirement.models import Reservation as RetirementReservation
+from workplace.models import Period, Reservation, TimeSlot, Workplace
+
+LOCAL_TIMEZONE = pytz.timezone(settings.TIME_ZONE)
+
+
+class CalendarFeedTests(APITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(CalendarFeedTests, cls).setUpClass()
+        cls.client = APIClient()
+        cls.user = UserFactory()
+        cls.user2 = UserFactory()
+        cls.workplace = Workplace.objects.create(
+            name="Blitz",
+            seats=40,
+            details="short_description",
+            address_line1="123 random street",
+            postal_code="123 456",
+            state_province="Random state",
+            country="Random country",
+        )
+        cls.period = Period.objects.create(
+            name="random_period",
+            workplace=cls.workplace,
+            start_date=LOCAL_TIMEZONE.localize(datetime(2130, 1, 1)),
+            end_date=LOCAL_TIMEZONE.localize(datetime(2130, 12, 31)),
+            price=3,
+            is_active=True,
+        )
+        cls.time_slot = TimeSlot.objects.create(
+            period=cls.period,
+            price=3,
+            start_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 10, 8)),
+            end_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 10, 12)),
+        )
+        cls.retirement = Retirement.objects.create(
+            name="mega_retirement",
+            details="This is a description of the mega retirement.",
+            seats=400,
+            address_line1="123 random street",
+            postal_code="123 456",
+            state_province="Random state",
+            country="Random country",
+            price=199,
+            start_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 8)),
+            end_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 17, 12)),
+            min_day_refund=7,
+            min_day_exchange=7,
+            refund_rate=50,
+            is_active=True,
+            accessibility=True,
+            form_url="example.com",
+            carpool_url='example2.com',
+            review_url='example3.com',
+            has_shared_rooms=True,
+        )
+
+    def setUp(self):
+        self.reservation = Reservation.objects.create(
+            user=self.user,
+            timeslot=self.time_slot,
+            is_active=True,
+        )
+        self.retirement_reservation = RetirementReservation.objects.create(
+            user=self.user,
+            retirement=self.retirement,
+            is_active=True,
+        )
+        self.token = ActionToken.objects.create(
+            type='calendar_feed',
+            user=self.user,
+        )
+        self.url = reverse('calendar_feed', kwargs={'token': self.token.key})
+
+    def test_feed(self):
+        """
+        Ensure that the feed lists the active reservations of the user.
+        """
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response['Content-Type'],
+            'text/calendar; charset=utf-8',
+        )
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        content = b''.join(response.streaming_content).decode()
+
+        self.assertTrue(content.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertTrue(content.endswith('END:VCALENDAR\r\n'))
+        self.assertEqual(content.count('BEGIN:VEVENT'), 2)
+        self.assertIn('DTSTART:21300110T130000Z\r\n', content)
+        self.assertIn('DTEND:21300117T170000Z\r\n', content)
+        self.assertIn('SUMMARY:mega_retirement\r\n', content)
+        self.assertIn(
+            'LOCATION:123 random street\\, Random state\\, 123 456\\, '
+            'Random country\r\n',
+            content,
+        )
+
+    def test_feed_not_modified(self):
+        """
+        Ensure that an unchanged feed is answered with a 304 and that a new
+        reservation changes the ETag.
+        """
+        response = self.client.get(self.url)
+        etag = response['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.reservation.is_active = False
+        self.reservation.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+        content = b''.join(response.streaming_content).decode()
+
+        self.assertEqual(content.count('BEGIN:VEVENT'), 1)
+
+    def test_feed_event_modified(self):
+        """
+        Ensure that a modified timeslot changes the ETag of the feed.
+        """
+        response = self.client.get(self.url)
+        etag = response['ETag']
+
+        time_slot = TimeSlot.objects.get(pk=self.time_slot.pk)
+        time_slot.end_time = LOCAL_TIMEZONE.localize(
+            datetime(2130, 1, 10, 13)
+        )
+        time_slot.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        content = b''.join(response.streaming_content).decode()
+
+        self.assertIn('DTEND:21300110T180000Z\r\n', content)
+
+    def test_feed_invalid_token(self):
+        """
+        Ensure that expired or unknown tokens are rejected.
+        """
+        self.token.expire()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.get(
+            reverse('calendar_feed', kwargs={'token': 'invalid'})
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_format_calendar_line(self):
+        """
+        Ensure that long lines are folded to 75 octets.
+        """
+        line = format_calendar_line('SUMMARY', 'é' * 100)
+
+        for part in line[:-2].split('\r\n'):
+            self.assertLessEqual(len(part.encode()), 75)
+        self.assertEqual(
+            line.replace('\r\n ', ''),
+            'SUMMARY:' + 'é' * 100 + '\r\n',
+        )
+
+    def test_profile_calendar(self):
+        """
+        Ensure that a user can get and renew the URL of its feed.
+        """
+        self.client.force_authenticate(user=self.user2)
+
+        response = self.client.get(reverse('profile_calendar'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        url = json.loads(response.content)['url']
+        token = ActionToken.objects.get(type='calendar_feed', user=self.user2)
+
+        self.assertEqual(
+            url,
+            'http://testserver' +
+            reverse('calendar_feed', kwargs={'token': token.key}),
+        )
+        self.assertGreater(
+            token.expires,
+            timezone.now() + timezone.timedelta(days=365),
+        )
+
+        response = self.client.get(reverse('profile_calendar'))
+
+        self.assertEqual(json.loads(response.content)['url'], url)
+
+        response = self.client.post(reverse('profile_calendar'))
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotEqual(json.loads(response.content)['url'], url)
+
+        token.refresh_from_db()
+
+        self.assertTrue(token.expired)
+
+    def test_profile_calendar_without_authentication(self):
+        """
+        Ensure that the URL of a feed requires authentication.
+        """
+        self.client.force_authenticate(user=None)
+
+        response = self.client.get(reverse('profile_calendar'))
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
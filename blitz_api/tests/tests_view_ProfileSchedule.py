@@ -0,0 +1,207 @@
+import json
+from datetime import datetime
+
+import pytz
+from django.conf import settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from blitz_api.factories import UserFactory
+from retirement.models import Retirement
+from retirement.models import Reservation as RetirementReservation
+from workplace.models import Period, Reservation, TimeSlot, Workplace
+
+LOCAL_TIMEZONE = pytz.timezone(settings.TIME_ZONE)
+
+
+class ProfileScheduleTests(APITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(ProfileScheduleTests, cls).setUpClass()
+        cls.client = APIClient()
+        cls.user = UserFactory()
+        cls.user2 = UserFactory()
+        cls.workplace = Workplace.objects.create(
+            name="Blitz",
+            seats=40,
+            details="short_description",
+            address_line1="123 random street",
+            postal_code="123 456",
+            state_province="Random state",
+            country="Random country",
+        )
+        cls.period = Period.objects.create(
+            name="random_period",
+            workplace=cls.workplace,
+            start_date=LOCAL_TIMEZONE.localize(datetime(2130, 1, 1)),
+            end_date=LOCAL_TIMEZONE.localize(datetime(2130, 12, 31)),
+            price=3,
+            is_active=True,
+        )
+        cls.time_slots = [
+            TimeSlot.objects.create(
+                period=cls.period,
+                price=3,
+                start_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, day, 8)),
+                end_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, day, 12)),
+            )
+            for day in [10, 20, 30]
+        ]
+        cls.reservations = [
+            Reservation.objects.create(
+                user=cls.user,
+                timeslot=time_slot,
+                is_active=True,
+            )
+            for time_slot in cls.time_slots
+        ]
+        Reservation.objects.create(
+            user=cls.user2,
+            timeslot=cls.time_slots[0],
+            is_active=True,
+        )
+        cls.retirement = Retirement.objects.create(
+            name="mega_retirement",
+            details="This is a description of the mega retirement.",
+            seats=400,
+            address_line1="123 random street",
+            postal_code="123 456",
+            state_province="Random state",
+            country="Random country",
+            price=199,
+            start_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 8)),
+            end_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 17, 12)),
+            min_day_refund=7,
+            min_day_exchange=7,
+            refund_rate=50,
+            is_active=True,
+            accessibility=True,
+            form_url="example.com",
+            carpool_url='example2.com',
+            review_url='example3.com',
+            has_shared_rooms=True,
+        )
+        cls.retirement_reservation = RetirementReservation.objects.create(
+            user=cls.user,
+            retirement=cls.retirement,
+            is_active=True,
+        )
+
+    def test_schedule(self):
+        """
+        Ensure that a user gets its reservations ordered by start time.
+        """
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(reverse('profile_schedule'))
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK,
+            response.content,
+        )
+
+        content = json.loads(response.content)
+
+        self.assertEqual(content['next'], None)
+        self.assertEqual(
+            [(entry['type'], entry['id']) for entry in content['results']],
+            [
+                ('timeslot', self.reservations[0].id),
+                ('retirement', self.retirement_reservation.id),
+                ('timeslot', self.reservations[1].id),
+                ('timeslot', self.reservations[2].id),
+            ]
+        )
+        self.assertEqual(
+            content['results'][1],
+            {
+                'type': 'retirement',
+                'id': self.retirement_reservation.id,
+                'url': 'http://testserver/retirement/reservations/' +
+                       str(self.retirement_reservation.id),
+                'retirement': 'http://testserver/retirement/retirements/' +
+                              str(self.retirement.id),
+                'name': "mega_retirement",
+                'start_time': '2130-01-15T08:00:00-05:00',
+                'end_time': '2130-01-17T12:00:00-05:00',
+                'is_present': False,
+            }
+        )
+
+    def test_schedule_window(self):
+        """
+        Ensure that only reservations starting within the window are listed.
+        """
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(
+            reverse('profile_schedule'),
+            {
+                'from': '2130-01-15T08:00:00-05:00',
+                'to': '2130-01-30T08:00:00-05:00',
+            },
+        )
+
+        content = json.loads(response.content)
+
+        self.assertEqual(
+            [(entry['type'], entry['id']) for entry in content['results']],
+            [
+                ('retirement', self.retirement_reservation.id),
+                ('timeslot', self.reservations[1].id),
+            ]
+        )
+
+    def test_schedule_cursor(self):
+        """
+        Ensure that the schedule can be browsed page by page.
+        """
+        self.client.force_authenticate(user=self.user)
+
+        entries = list()
+        url = reverse('profile_schedule') + '?page_size=3'
+        while url:
+            response = self.client.get(url)
+            content = json.loads(response.content)
+            entries += [
+                (entry['type'], entry['id']) for entry in content['results']
+            ]
+            url = content['next']
+
+        self.assertEqual(
+            entries,
+            [
+                ('timeslot', self.reservations[0].id),
+                ('retirement', self.retirement_reservation.id),
+                ('timeslot', self.reservations[1].id),
+                ('timeslot', self.reservations[2].id),
+            ]
+        )
+
+    def test_schedule_invalid_cursor(self):
+        """
+        Ensure that an invalid cursor is rejected.
+        """
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(
+            reverse('profile_schedule'),
+            {'cursor': 'invalid'},
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_400_BAD_REQUEST,
+            response.content,
+        )
+
+    def test_schedule_without_authentication(self):
+        """
+        Ensure that the schedule requires authentication.
+        """
+        response = self.client.get(reverse('profile_schedule'))
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
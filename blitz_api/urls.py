@@ -78,6 +78,21 @@ urlpatterns = [
         name='profile',
         kwargs={'pk': 'me'},
     ),
+    path(
+        'profile/schedule',
+        views.ProfileSchedule.as_view(),
+        name='profile_schedule',
+    ),
+    path(
+        'profile/calendar',
+        views.ProfileCalendar.as_view(),
+        name='profile_calendar',
+    ),
+    path(
+        'calendar/<str:token>.ics',
+        views.calendar_feed,
+        name='calendar_feed',
+    ),
     # Forgot password
     path(
         'reset_password',
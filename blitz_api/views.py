@@ -1,4 +1,5 @@
 import base64
+import hashlib
 import json
 
 import pytz
@@ -9,9 +10,11 @@ from django.contrib.auth import get_user_model, password_validation
 from django.conf import settings
 from django.core.files.base import ContentFile
 from django.utils import timezone
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.core.exceptions import ValidationError
+from django.utils.dateparse import parse_datetime
 from django.utils.translation import ugettext_lazy as _
+from django.views.decorators.http import condition
 
 from rest_framework import status, viewsets, mixins, filters
 from rest_framework.decorators import action
@@ -20,7 +23,10 @@ from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.views import APIView
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.exceptions import PermissionDenied
+from rest_framework.fields import DateTimeField
+from rest_framework.utils.urls import replace_query_param
 
 from blitz_api.mixins import ExportMixin
 from .models import (
@@ -305,6 +311,240 @@ class UsersActivation(APIView):
             return Response(return_data)
 
 
+class ProfileSchedule(APIView):
+    """
+    get:
+    Return the active workplace and retirement reservations of the current
+    user ordered by start time.
+
+    Parameters:
+        from: optional datetime (isoformat), defaults to now.
+        to: optional datetime (isoformat).
+        page_size: optional number of entries per page (max 100).
+        cursor: value provided by the `next` link of the previous page.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    page_size = 20
+    max_page_size = 100
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            start = self.parse_datetime(params.get('from'), timezone.now())
+            end = self.parse_datetime(params.get('to'))
+            page_size = min(
+                int(params.get('page_size', self.page_size)),
+                self.max_page_size,
+            )
+            if page_size < 1:
+                raise ValueError
+            after = self.decode_cursor(params.get('cursor'))
+        except (TypeError, ValueError):
+            return Response(
+                {'detail': _("Invalid from, to, page_size or cursor.")},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        entries, has_more = services.get_schedule(
+            request.user,
+            start=start,
+            end=end,
+            after=after,
+            limit=page_size,
+        )
+
+        next_url = None
+        if has_more:
+            start_time, kind, reservation = entries[-1]
+            next_url = replace_query_param(
+                request.build_absolute_uri(),
+                'cursor',
+                self.encode_cursor(start_time, kind, reservation.id),
+            )
+
+        return Response({
+            'next': next_url,
+            'results': [
+                self.serialize_entry(kind, reservation)
+                for start_time, kind, reservation in entries
+            ],
+        })
+
+    @staticmethod
+    def parse_datetime(value, default=None):
+        if value is None:
+            return default
+        value = parse_datetime(value)
+        if value is None:
+            raise ValueError
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        return value
+
+    @staticmethod
+    def encode_cursor(start_time, kind, id):
+        value = json.dumps([start_time.isoformat(), kind, id])
+        return base64.urlsafe_b64encode(value.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        if cursor is None:
+            return None
+        try:
+            start_time, kind, id = json.loads(
+                base64.urlsafe_b64decode(cursor.encode()).decode()
+            )
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError
+        if kind not in [source[0] for source in services.SCHEDULE_SOURCES]:
+            raise ValueError
+        return self.parse_datetime(start_time), kind, int(id)
+
+    def serialize_entry(self, kind, reservation):
+        """Compact representation of a reservation, without nested users"""
+        if kind == 'timeslot':
+            event = reservation.timeslot
+            workplace = event.period.workplace
+            name = workplace.name if workplace else event.period.name
+            url_prefix = ''
+        else:
+            event = reservation.retirement
+            name = event.name
+            url_prefix = 'retirement:'
+
+        return {
+            'type': kind,
+            'id': reservation.id,
+            'url': reverse(
+                url_prefix + 'reservation-detail',
+                args=[reservation.id],
+                request=self.request,
+            ),
+            kind: reverse(
+                url_prefix + kind + '-detail',
+                args=[event.id],
+                request=self.request,
+            ),
+            'name': name,
+            'start_time': DateTimeField().to_representation(event.start_time),
+            'end_time': DateTimeField().to_representation(event.end_time),
+            'is_present': reservation.is_present,
+        }
+
+
+def get_calendar_token(request, token):
+    """
+    Returns the active calendar feed token matching the key, cached on the
+    request since conditional checks and the view itself all need it.
+    """
+    if not hasattr(request, '_calendar_token'):
+        request._calendar_token = ActionToken.objects.filter(
+            key=token,
+            type='calendar_feed',
+            expires__gt=timezone.now(),
+        ).select_related('user').first()
+        request._calendar_last_modified = None
+        if request._calendar_token:
+            request._calendar_last_modified = \
+                services.get_calendar_last_modified(
+                    request._calendar_token.user
+                )
+    return request._calendar_token
+
+
+def calendar_last_modified(request, token):
+    get_calendar_token(request, token)
+    return request._calendar_last_modified
+
+
+def calendar_etag(request, token):
+    if get_calendar_token(request, token) is None:
+        return None
+    last_modified = request._calendar_last_modified
+    value = token + (last_modified.isoformat() if last_modified else '')
+    return hashlib.md5(value.encode()).hexdigest()
+
+
+@condition(etag_func=calendar_etag, last_modified_func=calendar_last_modified)
+def calendar_feed(request, token):
+    """
+    Serves the iCalendar feed of the reservations of the owner of the token.
+    Calendar clients poll this URL: unchanged feeds are answered with a 304
+    by the conditional checks without being generated.
+    """
+    calendar_token = get_calendar_token(request, token)
+    if calendar_token is None:
+        raise Http404
+
+    response = StreamingHttpResponse(
+        services.iter_calendar(calendar_token.user),
+        content_type='text/calendar; charset=utf-8',
+    )
+    response['Cache-Control'] = 'private, max-age=0, must-revalidate'
+    return response
+
+
+class ProfileCalendar(APIView):
+    """
+    get:
+    Return the URL of the iCalendar feed of the current user.
+
+    post:
+    Expire the previous URL of the iCalendar feed of the current user and
+    return a new one.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        token = ActionToken.objects.filter(
+            type='calendar_feed',
+            user=request.user,
+            expires__gt=timezone.now(),
+        ).first()
+
+        if token is None:
+            token = self.create_token(request.user)
+
+        return Response({'url': self.get_feed_url(token)})
+
+    def post(self, request):
+        tokens = ActionToken.objects.filter(
+            type='calendar_feed',
+            user=request.user,
+            expires__gt=timezone.now(),
+        )
+
+        for token in tokens:
+            token.expire()
+
+        token = self.create_token(request.user)
+
+        return Response(
+            {'url': self.get_feed_url(token)},
+            status=status.HTTP_201_CREATED,
+        )
+
+    @staticmethod
+    def create_token(user):
+        token = ActionToken.objects.create(
+            type='calendar_feed',
+            user=user,
+        )
+        # Feed URLs are long lived, unlike other action tokens
+        token.expires = timezone.now() + timezone.timedelta(
+            days=settings.CALENDAR_FEED_TOKENS['DAYS']
+        )
+        token.save()
+        return token
+
+    def get_feed_url(self, token):
+        return reverse(
+            'calendar_feed',
+            kwargs={'token': token.key},
+            request=self.request,
+        )
+
+
 class ResetPassword(APIView):
     """
     post:
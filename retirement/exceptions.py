@@ -0,0 +1,5 @@
+class BookingError(Exception):
+    """
+    Raised when retirements can't be booked for a user.
+    """
+    pass
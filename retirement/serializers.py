@@ -12,7 +12,6 @@ from django.core.mail import mail_admins
 from django.core.mail import send_mail
 from django.db import transaction
 from django.db.models import F
-from django.template.loader import render_to_string
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers, status
@@ -22,7 +21,9 @@ from rest_framework.validators import UniqueValidator
 from blitz_api.serializers import UserSerializer
 from blitz_api.services import (check_if_translated_field,
                                 remove_translation_fields,
-                                getMessageTranslate)
+                                getMessageTranslate,
+                                get_notification_connection,
+                                render_notification)
 from store.exceptions import PaymentAPIError
 from store.models import Order, OrderLine, PaymentProfile, Refund
 from store.services import (charge_payment,
@@ -879,8 +880,7 @@ class ReservationSerializer(serializers.HyperlinkedModelSerializer):
                 ),
             }
 
-            plain_msg = render_to_string("invoice.txt", merge_data)
-            msg_html = render_to_string("invoice.html", merge_data)
+            plain_msg, msg_html = render_notification("invoice", merge_data)
 
             send_mail(
                 "Confirmation d'achat",
@@ -888,6 +888,7 @@ class ReservationSerializer(serializers.HyperlinkedModelSerializer):
                 settings.DEFAULT_FROM_EMAIL,
                 [order.user.email],
                 html_message=msg_html,
+                connection=get_notification_connection(),
             )
 
         # Send refund confirmation email
@@ -908,8 +909,7 @@ class ReservationSerializer(serializers.HyperlinkedModelSerializer):
                 'TAX': round(Decimal(tax), 2),
             }
 
-            plain_msg = render_to_string("refund.txt", merge_data)
-            msg_html = render_to_string("refund.html", merge_data)
+            plain_msg, msg_html = render_notification("refund", merge_data)
 
             send_mail(
                 "Confirmation de remboursement",
@@ -917,6 +917,7 @@ class ReservationSerializer(serializers.HyperlinkedModelSerializer):
                 settings.DEFAULT_FROM_EMAIL,
                 [user.email],
                 html_message=msg_html,
+                connection=get_notification_connection(),
             )
 
         # Send exchange confirmation email
@@ -931,8 +932,7 @@ class ReservationSerializer(serializers.HyperlinkedModelSerializer):
                 'OLD_RETIREMENT': old_retirement,
             }
 
-            plain_msg = render_to_string("exchange.txt", merge_data)
-            msg_html = render_to_string("exchange.html", merge_data)
+            plain_msg, msg_html = render_notification("exchange", merge_data)
 
             send_mail(
                 "Confirmation d'échange",
@@ -940,6 +940,7 @@ class ReservationSerializer(serializers.HyperlinkedModelSerializer):
                 settings.DEFAULT_FROM_EMAIL,
                 [user.email],
                 html_message=msg_html,
+                connection=get_notification_connection(),
             )
 
             merge_data = {
@@ -947,13 +948,9 @@ class ReservationSerializer(serializers.HyperlinkedModelSerializer):
                 'USER': instance.user,
             }
 
-            plain_msg = render_to_string(
-                "retirement_info.txt",
-                merge_data
-            )
-            msg_html = render_to_string(
-                "retirement_info.html",
-                merge_data
+            plain_msg, msg_html = render_notification(
+                "retirement_info",
+                merge_data,
             )
 
             send_mail(
@@ -962,6 +959,7 @@ class ReservationSerializer(serializers.HyperlinkedModelSerializer):
                 settings.DEFAULT_FROM_EMAIL,
                 [instance.user.email],
                 html_message=msg_html,
+                connection=get_notification_connection(),
             )
 
         return Reservation.objects.get(id=instance_pk)
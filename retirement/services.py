@@ -2,14 +2,22 @@ from decimal import Decimal
 
 from django.conf import settings
 from django.core.mail import send_mail
-from django.template.loader import render_to_string
+from django.db.models import Count, F
 from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
 
+from blitz_api.services import (bulk_history_update,
+                                get_notification_connection,
+                                render_notification, render_notifications,
+                                send_notifications)
 from store.exceptions import PaymentAPIError
 from store.models import Refund
 from store.services import (PAYSAFE_EXCEPTION,
                             refund_amount, )
 
+from .exceptions import BookingError
+from .models import Reservation, Retirement, WaitQueue, WaitQueueNotification
+
 
 TAX_RATE = settings.LOCAL_SETTINGS['SELLING_TAX']
 
@@ -22,8 +30,7 @@ def notify_reserved_retirement_seat(user, retirement):
 
     merge_data = {'RETIREMENT_NAME': retirement.name}
 
-    plain_msg = render_to_string("reserved_place.txt", merge_data)
-    msg_html = render_to_string("reserved_place.html", merge_data)
+    plain_msg, msg_html = render_notification("reserved_place", merge_data)
 
     return send_mail(
         "Place exclusive pour 24h",
@@ -31,49 +38,49 @@ def notify_reserved_retirement_seat(user, retirement):
         settings.DEFAULT_FROM_EMAIL,
         [user.email],
         html_message=msg_html,
+        connection=get_notification_connection(),
     )
 
 
-def send_retirement_7_days_email(user, retirement):
+def send_retirement_7_days_email(users, retirement):
     """
-    This function sends an email to notify a user that a retirement in which he
-    has bought a seat is starting in 7 days.
+    This function sends an email to notify users that a retirement in which
+    they have bought a seat is starting in 7 days. The email is the same for
+    every user and is rendered once.
     """
+    users = list(users)
 
     merge_data = {'RETIREMENT': retirement}
 
-    plain_msg = render_to_string("reminder.txt", merge_data)
-    msg_html = render_to_string("reminder.html", merge_data)
+    messages = render_notification("reminder", merge_data)
 
-    return send_mail(
+    return send_notifications(
         "Rappel retraite",
-        plain_msg,
-        settings.DEFAULT_FROM_EMAIL,
-        [user.email],
-        html_message=msg_html,
+        [messages] * len(users),
+        [user.email for user in users],
     )
 
 
-def send_post_retirement_email(user, retirement):
+def send_post_retirement_email(users, retirement):
     """
-    This function sends an email to get back to a user after a retirement has
-    ended.
+    This function sends an email to get back to users after a retirement has
+    ended. The email is rendered once and only the name of each user is
+    substituted.
     """
+    users = list(users)
 
-    merge_data = {
-        'RETIREMENT': retirement,
-        'USER': user,
-    }
+    merge_data = {'RETIREMENT': retirement}
 
-    plain_msg = render_to_string("throwback.txt", merge_data)
-    msg_html = render_to_string("throwback.html", merge_data)
+    messages = render_notifications(
+        "throwback",
+        merge_data,
+        [{'USER': user} for user in users],
+    )
 
-    return send_mail(
+    return send_notifications(
         "Merci pour votre participation",
-        plain_msg,
-        settings.DEFAULT_FROM_EMAIL,
-        [user.email],
-        html_message=msg_html,
+        messages,
+        [user.email for user in users],
     )
 
 
@@ -118,3 +125,106 @@ def refund_retirement(reservation, refund_rate, refund_reason):
     )
 
     return refund_instance
+
+
+def book_retirements(user, order_lines):
+    """
+    This function reserves the retirements of order lines for a user. The
+    active reservations count of every retirement, the active reservations
+    of the user and its wait queue notifications are loaded in three
+    queries. Reservations are inserted in bulk. Must be called inside a
+    transaction.
+
+    user:           User model instance
+    order_lines:    Saved OrderLine instances of retirements, checked in
+                    that order
+
+    Raises BookingError if a retirement can't be booked.
+    Returns the list of created reservations.
+    """
+    if not (user.phone and user.city):
+        raise BookingError(_(
+            "Incomplete user profile. 'phone' and 'city' field must be "
+            "filled in the user profile to book a retirement."
+        ))
+
+    retirement_ids = [order_line.object_id for order_line in order_lines]
+    reserved = dict(
+        Reservation.objects.filter(
+            retirement_id__in=retirement_ids,
+            is_active=True,
+        ).values('retirement_id').annotate(
+            count=Count('id'),
+        ).values_list('retirement_id', 'count')
+    )
+    registered = set(
+        Reservation.objects.filter(
+            user=user,
+            retirement_id__in=retirement_ids,
+            is_active=True,
+        ).values_list('retirement_id', flat=True)
+    )
+    notified = set(
+        WaitQueueNotification.objects.filter(
+            user=user,
+            retirement_id__in=retirement_ids,
+        ).values_list('retirement_id', flat=True)
+    )
+
+    reservations = list()
+    released_seats = list()
+    for order_line in order_lines:
+        retirement = order_line.content_object
+        if retirement.id in registered:
+            raise BookingError(_(
+                "You already are registered to this retirement: {0}."
+            ).format(str(retirement)))
+        places = (retirement.seats - reserved.get(retirement.id, 0) -
+                  retirement.reserved_seats)
+        if not (places > 0 or (retirement.reserved_seats and
+                               retirement.id in notified)):
+            raise BookingError(_(
+                "There are no places left in the requested retirement."
+            ))
+        reservations.append(
+            Reservation(
+                user=user,
+                retirement=retirement,
+                order_line=order_line,
+                is_active=True,
+            )
+        )
+        registered.add(retirement.id)
+        reserved[retirement.id] = reserved.get(retirement.id, 0) + 1
+        # Decrement reserved_seats if > 0
+        if retirement.reserved_seats:
+            retirement.reserved_seats -= 1
+            released_seats.append(retirement.id)
+
+    Reservation.objects.bulk_create(reservations)
+
+    # Primary keys are not set by bulk_create on every database, so the new
+    # reservations are read back to create their history.
+    created_reservations = list(
+        Reservation.objects.filter(order_line__in=order_lines)
+    )
+    for reservation in created_reservations:
+        reservation._history_user = user
+    Reservation.history.bulk_history_create(created_reservations)
+
+    if released_seats:
+        Retirement.objects.filter(pk__in=released_seats).update(
+            reserved_seats=F('reserved_seats') - 1,
+        )
+        # The update bypasses simple_history, changes are recorded here
+        bulk_history_update(
+            Retirement.objects.filter(pk__in=released_seats),
+            user,
+        )
+
+    WaitQueue.objects.filter(
+        user=user,
+        retirement_id__in=retirement_ids,
+    ).delete()
+
+    return reservations
@@ -11,6 +11,8 @@ import rest_framework
 
 from blitz_api.exceptions import MailServiceError
 from blitz_api.mixins import ExportMixin
+from blitz_api.services import (get_notification_connection,
+                                render_notification)
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.mail import mail_admins
@@ -18,7 +20,6 @@ from django.core.mail import send_mail as django_send_mail
 from django.db import transaction
 from django.db.models import F
 from django.http import HttpResponse
-from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
@@ -103,8 +104,15 @@ class RetirementViewSet(ExportMixin, viewsets.ModelViewSet):
             return Response(response_data, status=status.HTTP_200_OK)
 
         # Notify a user for every reserved seat
-        for reservation in retirement.reservations.filter(is_active=True):
-            send_retirement_7_days_email(reservation.user, retirement)
+        send_retirement_7_days_email(
+            [
+                reservation.user for reservation in
+                retirement.reservations.filter(
+                    is_active=True,
+                ).select_related('user')
+            ],
+            retirement,
+        )
 
         response_data = {
             'stop': True,
@@ -128,8 +136,15 @@ class RetirementViewSet(ExportMixin, viewsets.ModelViewSet):
             return Response(response_data, status=status.HTTP_200_OK)
 
         # Notify a user for every reserved seat
-        for reservation in retirement.reservations.filter(is_active=True):
-            send_post_retirement_email(reservation.user, retirement)
+        send_post_retirement_email(
+            [
+                reservation.user for reservation in
+                retirement.reservations.filter(
+                    is_active=True,
+                ).select_related('user')
+            ],
+            retirement,
+        )
 
         response_data = {
             'stop': True,
@@ -395,8 +410,7 @@ class ReservationViewSet(ExportMixin, viewsets.ModelViewSet):
                 'TAX': round(Decimal(amount_tax / 100), 2),
             }
 
-            plain_msg = render_to_string("refund.txt", merge_data)
-            msg_html = render_to_string("refund.html", merge_data)
+            plain_msg, msg_html = render_notification("refund", merge_data)
 
             django_send_mail(
                 "Confirmation de remboursement",
@@ -404,6 +418,7 @@ class ReservationViewSet(ExportMixin, viewsets.ModelViewSet):
                 settings.DEFAULT_FROM_EMAIL,
                 [user.email],
                 html_message=msg_html,
+                connection=get_notification_connection(),
             )
         return Response(status=status.HTTP_204_NO_CONTENT)
 
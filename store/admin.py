@@ -7,7 +7,7 @@ from simple_history.admin import SimpleHistoryAdmin
 
 from .models import (Membership, Order, OrderLine, Package, PaymentProfile,
                      CustomPayment, Coupon, MembershipCoupon, CouponUser,
-                     Refund, )
+                     Refund, CouponNotification, )
 from .resources import (MembershipResource, OrderResource, OrderLineResource,
                         PackageResource, CustomPaymentResource, CouponResource,
                         CouponUserResource, RefundResource, )
@@ -85,6 +85,8 @@ class OrderAdmin(SimpleHistoryAdmin, ExportActionModelAdmin):
         'settlement_id',
         'transaction_date',
         'user',
+        'total',
+        'refunded',
     )
     list_filter = (
         ('user', admin.RelatedOnlyFieldListFilter),
@@ -199,4 +201,5 @@ admin.site.register(PaymentProfile, PaymentProfileAdmin)
 admin.site.register(Coupon, CouponAdmin)
 admin.site.register(MembershipCoupon)
 admin.site.register(CouponUser, CouponUserAdmin)
+admin.site.register(CouponNotification)
 admin.site.register(Refund, RefundAdmin)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class StoreConfig(AppConfig):
     name = 'store'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register()
+def check_paysafe_breaker_cache(app_configs, **kwargs):
+    """
+    Warns when the Paysafe circuit breaker counts requests in a local memory
+    cache: each process would then open its own circuit.
+    """
+    alias = settings.PAYSAFE.get('BREAKER_CACHE', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    if backend.endswith('.LocMemCache'):
+        return [
+            Warning(
+                "The Paysafe circuit breaker cache '{0}' is kept in the "
+                "memory of each process.".format(alias),
+                hint="Set PAYSAFE_BREAKER_CACHE to a cache shared by every "
+                     "worker, such as a database or Redis cache.",
+                id='store.W001',
+            )
+        ]
+    return []
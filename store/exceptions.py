@@ -3,3 +3,10 @@ class PaymentAPIError(Exception):
     Raised when a payment related action fails.
     """
     pass
+
+
+class CouponCodeError(Exception):
+    """
+    Raised when unique coupon codes can't be generated.
+    """
+    pass
@@ -0,0 +1,20 @@
+from rest_framework import serializers
+
+
+class ContentTypeField(serializers.SlugRelatedField):
+    """
+    Content type given by its model name. Each model name is looked up once
+    per field instance, thus once for all the items of a list serializer.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('slug_field', 'model')
+        super().__init__(**kwargs)
+        self.content_types = dict()
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            return super().to_internal_value(data)
+        if data not in self.content_types:
+            self.content_types[data] = super().to_internal_value(data)
+        return self.content_types[data]
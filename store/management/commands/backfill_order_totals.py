@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from store.models import Order
+from store.services import update_order_totals
+
+
+class Command(BaseCommand):
+    help = 'Compute the saved totals of existing orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=500,
+            dest='batch_size',
+            help='Number of orders updated per transaction',
+        )
+
+    def handle(self, *args, **options):
+        count = 0
+        last_id = 0
+        while True:
+            order_ids = list(
+                Order.objects.filter(
+                    pk__gt=last_id,
+                ).order_by('pk').values_list(
+                    'pk',
+                    flat=True,
+                )[:options['batch_size']]
+            )
+            if not order_ids:
+                break
+            count += update_order_totals(order_ids)
+            last_id = order_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} "
+            f"order(s) updated"))
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from store.models import Coupon
+
+
+class Command(BaseCommand):
+    help = 'Verify the total uses of coupons against their uses by users'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            dest='fix',
+            help='Set the total uses of coupons to the uses by users',
+        )
+
+    def handle(self, *args, **options):
+        coupons = Coupon.objects.annotate(
+            uses=Coalesce(
+                Sum(
+                    'coupon_users__uses',
+                    filter=Q(coupon_users__deleted__isnull=True),
+                ),
+                0,
+            ),
+        ).exclude(uses_total=F('uses')).order_by('pk')
+
+        count = 0
+        for coupon in coupons:
+            count += 1
+            self.stdout.write(
+                f"{coupon.code}: "
+                f"{coupon.uses_total} total use(s), "
+                f"{coupon.uses} use(s) by users")
+            if options['fix']:
+                Coupon.objects.filter(pk=coupon.pk).update(
+                    uses_total=coupon.uses,
+                )
+
+        if options['fix']:
+            self.stdout.write(self.style.SUCCESS(
+                f"{count} "
+                f"coupon(s) fixed"))
+        elif count:
+            self.stdout.write(self.style.ERROR(
+                f"{count} "
+                f"coupon(s) out of sync"))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                "All coupons are in sync"))
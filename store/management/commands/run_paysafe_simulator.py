@@ -0,0 +1,69 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.paysafe_simulator import (PaysafeSimulator, parse_error,
+                                     parse_latency)
+
+
+class Command(BaseCommand):
+    help = 'Run a local simulation of the Paysafe API for load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--host',
+            default='127.0.0.1',
+            help='Address listened by the simulator',
+        )
+        parser.add_argument(
+            '--port',
+            type=int,
+            default=8765,
+            help='Port listened by the simulator',
+        )
+        parser.add_argument(
+            '--latency',
+            default='fixed:0',
+            help='Latency of responses in seconds, ie: "fixed:0.1", '
+                 '"uniform:0.05,0.3", "normal:0.2,0.05", '
+                 '"lognormal:-1.6,0.5" or "exponential:0.2"',
+        )
+        parser.add_argument(
+            '--error',
+            action='append',
+            default=[],
+            dest='errors',
+            help='Error injected at a rate, ie: "3009:0.05" or '
+                 '"refunds:3406:0.1" for a single endpoint (auths, refunds, '
+                 'profiles or cards). Three digits codes are HTTP errors. '
+                 'Can be repeated.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            latency = parse_latency(options['latency'])
+            errors = [parse_error(error) for error in options['errors']]
+        except (TypeError, ValueError) as err:
+            raise CommandError(err)
+
+        simulator = PaysafeSimulator(
+            host=options['host'],
+            port=options['port'],
+            latency=latency,
+            errors=errors,
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Paysafe simulator listening, set "
+            f"PAYSAFE_BASE_URL={simulator.url}"))
+        self.stdout.write(
+            f"Request accounting: {simulator.url}__simulator/stats")
+
+        try:
+            simulator.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            simulator.server.server_close()
+
+        self.stdout.write(json.dumps(simulator.get_stats(), indent=2))
@@ -0,0 +1,30 @@
+# Generated by Django 2.0.8 on 2026-10-18 22:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('store', '0025_historicalmembershipcoupon_membershipcoupon'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CouponNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.PositiveIntegerField(verbose_name='Number of emails')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Creation date')),
+                ('coupon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='store.Coupon', verbose_name='Coupon')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='coupon_notifications', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Coupon notification',
+                'verbose_name_plural': 'Coupon notifications',
+            },
+        ),
+    ]
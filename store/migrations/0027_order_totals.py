@@ -0,0 +1,73 @@
+# Generated by Django 2.0.8 on 2026-10-18 22:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0026_couponnotification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalorder',
+            name='discount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Discount'),
+        ),
+        migrations.AddField(
+            model_name='historicalorder',
+            name='refunded',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Refunded'),
+        ),
+        migrations.AddField(
+            model_name='historicalorder',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Subtotal'),
+        ),
+        migrations.AddField(
+            model_name='historicalorder',
+            name='tax',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Tax'),
+        ),
+        migrations.AddField(
+            model_name='historicalorder',
+            name='tickets',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Tickets'),
+        ),
+        migrations.AddField(
+            model_name='historicalorder',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Total'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='discount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Discount'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='refunded',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Refunded'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Subtotal'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='tax',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Tax'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='tickets',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Tickets'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Total'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 2.0.8 on 2026-10-18 22:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_coupon_applicability(apps, schema_editor):
+    '''
+    Flattens the applicable relations of existing coupons. We use the
+    historical models as the current ones may be newer than this migration.
+    '''
+    Coupon = apps.get_model('store', 'Coupon')
+    CouponApplicability = apps.get_model('store', 'CouponApplicability')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+
+    applicabilities = list()
+    for field_name in ('applicable_retirements', 'applicable_timeslots',
+                       'applicable_packages', 'applicable_memberships'):
+        field = Coupon._meta.get_field(field_name)
+        content_type, created = ContentType.objects.get_or_create(
+            app_label=field.related_model._meta.app_label,
+            model=field.related_model._meta.model_name,
+        )
+        relations = field.remote_field.through.objects.values_list(
+            field.m2m_field_name(),
+            field.m2m_reverse_field_name(),
+        )
+        for coupon_id, object_id in relations:
+            applicabilities.append(CouponApplicability(
+                coupon_id=coupon_id,
+                content_type=content_type,
+                object_id=object_id,
+            ))
+
+    field = Coupon._meta.get_field('applicable_product_types')
+    relations = field.remote_field.through.objects.values_list(
+        field.m2m_field_name(),
+        field.m2m_reverse_field_name(),
+    )
+    for coupon_id, content_type_id in relations:
+        applicabilities.append(CouponApplicability(
+            coupon_id=coupon_id,
+            content_type_id=content_type_id,
+            object_id=None,
+        ))
+
+    CouponApplicability.objects.bulk_create(applicabilities, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('store', '0027_order_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CouponApplicability',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='Object id')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType', verbose_name='Content type')),
+                ('coupon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='applicabilities', to='store.Coupon', verbose_name='Coupon')),
+            ],
+            options={
+                'verbose_name': 'Coupon applicability',
+                'verbose_name_plural': 'Coupon applicabilities',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='couponapplicability',
+            unique_together={('coupon', 'content_type', 'object_id')},
+        ),
+        migrations.AlterIndexTogether(
+            name='couponapplicability',
+            index_together={('content_type', 'object_id')},
+        ),
+        migrations.RunPython(fill_coupon_applicability, migrations.RunPython.noop),
+    ]
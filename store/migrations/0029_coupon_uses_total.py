@@ -0,0 +1,41 @@
+# Generated by Django 2.0.8 on 2026-10-18 22:59
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_uses_total(apps, schema_editor):
+    '''
+    Sums the uses of existing coupons. We use the historical models as the
+    current ones may be newer than this migration.
+    '''
+    Coupon = apps.get_model('store', 'Coupon')
+    CouponUser = apps.get_model('store', 'CouponUser')
+    uses = CouponUser.objects.filter(
+        deleted__isnull=True,
+    ).values('coupon').annotate(total=Sum('uses'))
+    for coupon_uses in uses:
+        Coupon.objects.filter(pk=coupon_uses['coupon']).update(
+            uses_total=coupon_uses['total'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0028_couponapplicability'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='uses_total',
+            field=models.PositiveIntegerField(default=0, verbose_name='Total uses'),
+        ),
+        migrations.AddField(
+            model_name='historicalcoupon',
+            name='uses_total',
+            field=models.PositiveIntegerField(default=0, verbose_name='Total uses'),
+        ),
+        migrations.RunPython(fill_uses_total, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 2.0.8 on 2026-10-18 23:04
+
+from django.core.management.base import CommandError
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicated_codes(apps, schema_editor):
+    '''
+    Stops the migration if coupons, deleted ones included, share a code.
+    Customers may hold these codes: they must be renamed knowingly, and
+    reissued, before the code is made unique. We use the historical model as
+    the current one may be newer than this migration.
+    '''
+    Coupon = apps.get_model('store', 'Coupon')
+    duplicated_codes = Coupon.objects.values('code').annotate(
+        count=Count('id'),
+    ).filter(count__gt=1).order_by('code').values_list('code', flat=True)
+    duplicates = [
+        '{0} (coupons {1})'.format(
+            code,
+            ', '.join(
+                str(coupon_id) for coupon_id in Coupon.objects.filter(
+                    code=code,
+                ).order_by('id').values_list('id', flat=True)
+            ),
+        )
+        for code in duplicated_codes
+    ]
+    if duplicates:
+        raise CommandError(
+            "Coupon codes must be unique. Rename the following duplicated "
+            "codes, deleted coupons included, before migrating: " +
+            "; ".join(duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0029_coupon_uses_total'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicated_codes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='coupon',
+            name='code',
+            field=models.CharField(max_length=253, unique=True, verbose_name='Code'),
+        ),
+        migrations.AlterField(
+            model_name='historicalcoupon',
+            name='code',
+            field=models.CharField(db_index=True, max_length=253, verbose_name='Code'),
+        ),
+    ]
@@ -1,5 +1,5 @@
 import decimal
-import random
+import secrets
 import string
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
@@ -14,10 +14,17 @@ from safedelete.models import SafeDeleteModel
 
 from simple_history.models import HistoricalRecords
 
-from blitz_api.models import AcademicLevel
+from blitz_api.models import AcademicLevel, Outbox
 
 User = get_user_model()
 
+# Characters of coupon codes, without the easily confused O, I and 0.
+COUPON_CODE_CHARACTERS = (
+    string.ascii_uppercase.replace("O", "").replace("I", "") +
+    string.digits.replace("0", "")
+)
+COUPON_CODE_LENGTH = 8
+
 
 class Order(models.Model):
     """Represents a transaction."""
@@ -54,29 +61,61 @@ class Order(models.Model):
         blank=True,
     )
 
+    # Totals are saved at checkout. Products paid with money are in the
+    # subtotal, with the coupon discount already deducted, while timeslots
+    # are paid with tickets.
+    subtotal = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        verbose_name=_("Subtotal"),
+        default=0,
+    )
+
+    discount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        verbose_name=_("Discount"),
+        default=0,
+    )
+
+    tax = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        verbose_name=_("Tax"),
+        default=0,
+    )
+
+    total = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        verbose_name=_("Total"),
+        default=0,
+    )
+
+    tickets = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        verbose_name=_("Tickets"),
+        default=0,
+    )
+
+    # Updated with the refunds of the order lines
+    refunded = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        verbose_name=_("Refunded"),
+        default=0,
+    )
+
     history = HistoricalRecords()
 
     @property
     def total_cost(self):
-        cost = 0
-        orderlines = self.order_lines.filter(
-            models.Q(content_type__model='membership') |
-            models.Q(content_type__model='package') |
-            models.Q(content_type__model='retirement')
-        )
-        for orderline in orderlines:
-            cost += orderline.cost * orderline.quantity
-        return cost
+        return self.subtotal
 
     @property
     def total_ticket(self):
-        tickets = 0
-        orderlines = self.order_lines.filter(
-            content_type__model='timeslot'
-        )
-        for orderline in orderlines:
-            tickets += orderline.content_object.price * orderline.quantity
-        return tickets
+        return self.tickets
 
     def __str__(self):
         return str(self.authorization_id)
@@ -450,6 +489,7 @@ class Coupon(AbstractCoupon):
     code = models.CharField(
         verbose_name=_("Code"),
         max_length=253,
+        unique=True,
     )
 
     #  The "owner" of the instance is the buyer of the coupon, but not
@@ -469,15 +509,33 @@ class Coupon(AbstractCoupon):
         through='CouponUser',
     )
 
+    # Sum of the uses of CouponUser, kept to claim uses with a single
+    # conditional update.
+    uses_total = models.PositiveIntegerField(
+        verbose_name=_("Total uses"),
+        default=0,
+    )
+
     history = HistoricalRecords()
 
     def __str__(self):
         return self.code
 
+    @staticmethod
+    def get_random_code():
+        return ''.join(
+            secrets.choice(COUPON_CODE_CHARACTERS)
+            for index in range(COUPON_CODE_LENGTH)
+        )
+
     def generate_code(self):
-        self.code = ''.join(random.choices(
-            string.ascii_uppercase.replace("O", "") +
-            string.digits.replace("0", ""), k=8))
+        """
+        Sets a random code which is not used by another coupon, deleted or
+        not.
+        """
+        self.code = self.get_random_code()
+        while Coupon.all_objects.filter(code=self.code).exists():
+            self.code = self.get_random_code()
 
 
 class MembershipCoupon(AbstractCoupon):
@@ -516,3 +574,102 @@ class CouponUser(SafeDeleteModel):
 
     def __str__(self):
         return ', '.join([str(self.coupon), str(self.user)])
+
+
+class CouponApplicability(models.Model):
+    """
+    Products to which a coupon applies, flattened from the applicable
+    relations of the coupon. A null object_id makes the whole product type
+    applicable.
+    """
+
+    class Meta:
+        verbose_name = _("Coupon applicability")
+        verbose_name_plural = _("Coupon applicabilities")
+        unique_together = (('coupon', 'content_type', 'object_id'),)
+        index_together = (('content_type', 'object_id'),)
+
+    coupon = models.ForeignKey(
+        Coupon,
+        on_delete=models.CASCADE,
+        verbose_name=_("Coupon"),
+        related_name='applicabilities',
+    )
+
+    content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        verbose_name=_("Content type"),
+    )
+
+    object_id = models.PositiveIntegerField(
+        verbose_name=_("Object id"),
+        null=True,
+        blank=True,
+    )
+
+    def __str__(self):
+        return ', '.join([
+            str(self.coupon),
+            str(self.content_type),
+            str(self.object_id),
+        ])
+
+
+class CouponNotification(models.Model):
+    """
+    Emails sent by a coupon owner to notify users of a coupon code. The
+    delivery of each email is followed through the outbox.
+    """
+
+    class Meta:
+        verbose_name = _("Coupon notification")
+        verbose_name_plural = _("Coupon notifications")
+
+    coupon = models.ForeignKey(
+        Coupon,
+        on_delete=models.CASCADE,
+        verbose_name=_("Coupon"),
+        related_name='notifications',
+    )
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name=_("User"),
+        related_name='coupon_notifications',
+    )
+
+    total = models.PositiveIntegerField(
+        verbose_name=_("Number of emails"),
+    )
+
+    created = models.DateTimeField(
+        verbose_name=_("Creation date"),
+        auto_now_add=True,
+    )
+
+    def __str__(self):
+        return ', '.join([str(self.coupon), str(self.created)])
+
+    @property
+    def reference(self):
+        return 'coupon-notification-{0}'.format(self.id)
+
+    def get_status(self):
+        """
+        Returns the email addresses of the notification by outbox status.
+        """
+        status = {
+            Outbox.STATUS_PENDING: list(),
+            Outbox.STATUS_SENT: list(),
+            Outbox.STATUS_FAILED: list(),
+        }
+        emails = Outbox.objects.filter(
+            reference=self.reference,
+        ).only('status', 'recipients')
+
+        for email in emails:
+            status[email.status] += email.recipients
+
+        return status
@@ -0,0 +1,292 @@
+import logging
+import random
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import ugettext_lazy as _
+
+from .exceptions import PaymentAPIError
+
+logger = logging.getLogger(__name__)
+
+# Requests which can be sent again without side effects
+RETRY_METHODS = ('GET', 'DELETE')
+RETRY_STATUS = (500, 502, 503, 504)
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to the payment API while it fails, so workers
+    don't pile up waiting for it. Outcomes of requests are counted in a
+    cache shared by every worker, per window of PAYSAFE['BREAKER_WINDOW']
+    seconds. The cache must not write within the transaction of the request,
+    or failed payments rolled back would erase their own counts.
+
+    The circuit opens when enough requests of the window failed or were too
+    slow. While open, requests fail immediately. After
+    PAYSAFE['BREAKER_OPEN_TIMEOUT'] seconds the circuit is half open: a
+    single request is sent to probe the API, closing the circuit if it
+    succeeds and opening it again otherwise.
+    """
+
+    STATE_CLOSED = 'closed'
+    STATE_OPEN = 'open'
+    STATE_HALF_OPEN = 'half_open'
+
+    def __init__(self, name='paysafe'):
+        self.name = name
+
+    @property
+    def cache(self):
+        return caches[settings.PAYSAFE.get('BREAKER_CACHE', 'default')]
+
+    def get_key(self, suffix):
+        return '{0}:breaker:{1}'.format(self.name, suffix)
+
+    def get_window_keys(self):
+        window = int(time.time() // settings.PAYSAFE.get('BREAKER_WINDOW', 60))
+        return (
+            self.get_key('{0}:requests'.format(window)),
+            self.get_key('{0}:failures'.format(window)),
+        )
+
+    def get_state(self):
+        flags = self.cache.get_many([
+            self.get_key('open'),
+            self.get_key('tripped'),
+        ])
+        if flags.get(self.get_key('open')):
+            return self.STATE_OPEN
+        if flags.get(self.get_key('tripped')):
+            return self.STATE_HALF_OPEN
+        return self.STATE_CLOSED
+
+    def get_stats(self):
+        """
+        Returns the state of the circuit, the number of times it opened and
+        the requests and failures counted in the current window.
+        """
+        requests_key, failures_key = self.get_window_keys()
+        return {
+            'state': self.get_state(),
+            'trips': self.cache.get(self.get_key('trips'), 0),
+            'requests': self.cache.get(requests_key, 0),
+            'failures': self.cache.get(failures_key, 0),
+        }
+
+    def before_request(self):
+        """
+        Raises PaymentAPIError if the circuit is open, or half open and
+        already probed by another request.
+
+        Returns True if the request probes the API.
+        """
+        state = self.get_state()
+        if state == self.STATE_CLOSED:
+            return False
+        if state == self.STATE_HALF_OPEN and self.cache.add(
+                self.get_key('probe'),
+                True,
+                timeout=settings.PAYSAFE.get('BREAKER_OPEN_TIMEOUT', 30),
+        ):
+            return True
+        raise PaymentAPIError(_("Payment temporarily unavailable."))
+
+    def record(self, success, probe=False):
+        """
+        Counts the outcome of a request, opening or closing the circuit.
+        """
+        if probe:
+            self.cache.delete(self.get_key('probe'))
+            if success:
+                self.close()
+            else:
+                self.open()
+            return
+
+        window = settings.PAYSAFE.get('BREAKER_WINDOW', 60)
+        requests_key, failures_key = self.get_window_keys()
+        self.cache.add(requests_key, 0, timeout=window * 2)
+        requests = self.cache.incr(requests_key)
+        if success:
+            return
+
+        self.cache.add(failures_key, 0, timeout=window * 2)
+        failures = self.cache.incr(failures_key)
+        if (requests >= settings.PAYSAFE.get('BREAKER_MIN_REQUESTS', 10) and
+                failures / requests >=
+                settings.PAYSAFE.get('BREAKER_ERROR_RATE', 0.5) and
+                self.get_state() == self.STATE_CLOSED):
+            self.open()
+
+    def open(self):
+        self.cache.set(
+            self.get_key('open'),
+            True,
+            timeout=settings.PAYSAFE.get('BREAKER_OPEN_TIMEOUT', 30),
+        )
+        self.cache.set(self.get_key('tripped'), True, timeout=None)
+        self.cache.add(self.get_key('trips'), 0, timeout=None)
+        trips = self.cache.incr(self.get_key('trips'))
+        self.cache.delete_many(self.get_window_keys())
+        logger.warning(
+            "paysafe breaker %s, %s trip(s)",
+            self.STATE_OPEN,
+            trips,
+            extra={
+                'paysafe_breaker_state': self.STATE_OPEN,
+                'paysafe_breaker_trips': trips,
+            },
+        )
+
+    def close(self):
+        self.cache.delete_many([
+            self.get_key('open'),
+            self.get_key('tripped'),
+        ])
+        logger.warning(
+            "paysafe breaker %s",
+            self.STATE_CLOSED,
+            extra={
+                'paysafe_breaker_state': self.STATE_CLOSED,
+                'paysafe_breaker_trips': self.cache.get(
+                    self.get_key('trips'),
+                    0,
+                ),
+            },
+        )
+
+
+class PaysafeClient:
+    """
+    HTTP client of the Paysafe API. Connections are kept alive in a pool
+    shared by every request of the process, so warm workers don't connect
+    again for each request.
+
+    Requests are bounded by PAYSAFE['CONNECT_TIMEOUT'] and
+    PAYSAFE['READ_TIMEOUT']. GET and DELETE requests failing to connect,
+    timing out or answered by a server error are retried PAYSAFE['RETRIES']
+    times after a random delay. Every call, retries included, ends within
+    PAYSAFE['TOTAL_TIMEOUT'] seconds. Requests failing to get a response
+    raise PaymentAPIError.
+
+    Requests are refused while the circuit breaker is open.
+
+    The latency of every request is logged by the 'store.paysafe' logger.
+    """
+
+    def __init__(self, pool_size=None, breaker=None):
+        self.breaker = breaker or CircuitBreaker()
+        if pool_size is None:
+            pool_size = settings.PAYSAFE.get('POOL_SIZE', 10)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        """
+        Sends a request to the payment API with the credentials of
+        PAYSAFE settings. Keyword arguments are those of requests.
+
+        Returns the response, whatever its status.
+        """
+        config = settings.PAYSAFE
+        method = method.upper()
+        kwargs.setdefault('auth', (config['USER'], config['PASSWORD']))
+        deadline = time.monotonic() + config.get('TOTAL_TIMEOUT', 10)
+        connect_timeout = config.get('CONNECT_TIMEOUT', 3.05)
+        read_timeout = config.get('READ_TIMEOUT', 8)
+
+        retries = 0
+        if method in RETRY_METHODS:
+            retries = config.get('RETRIES', 2)
+        backoff = config.get('RETRY_BACKOFF', 0.5)
+
+        probe = self.breaker.before_request()
+        if probe:
+            retries = 0
+
+        response = error = None
+        for attempt in range(retries + 1):
+            if attempt:
+                # Full jitter keeps retries of concurrent workers apart
+                delay = random.uniform(0, backoff * 2 ** (attempt - 1))
+                if time.monotonic() + delay >= deadline:
+                    break
+                time.sleep(delay)
+
+            # No attempt outlasts the time budget of the call
+            remaining = deadline - time.monotonic()
+            kwargs['timeout'] = (
+                min(connect_timeout, remaining),
+                min(read_timeout, remaining),
+            )
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as err:
+                self.record(method, url, err.__class__.__name__, start, probe)
+                response, error = None, err
+                continue
+
+            self.record(method, url, response.status_code, start, probe)
+            if response.status_code not in RETRY_STATUS:
+                break
+
+        if response is None:
+            raise PaymentAPIError(
+                _("The request could not be processed.")
+            ) from error
+        return response
+
+    def record(self, method, url, status, start, probe=False):
+        """
+        Logs the latency of a request and counts its outcome in the circuit
+        breaker. Requests without response, answered by a server error or
+        slower than PAYSAFE['BREAKER_SLOW_CALL'] are failures.
+        """
+        duration = time.monotonic() - start
+        path = urlsplit(url).path
+        self.breaker.record(
+            isinstance(status, int) and status < 500 and
+            duration <= settings.PAYSAFE.get('BREAKER_SLOW_CALL', 10),
+            probe,
+        )
+        logger.info(
+            "paysafe %s %s %s %.3fs",
+            method,
+            path,
+            status,
+            duration,
+            extra={
+                'paysafe_method': method,
+                'paysafe_path': path,
+                'paysafe_status': status,
+                'paysafe_duration': duration,
+            },
+        )
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+
+# Shared by every request of the process
+paysafe_client = PaysafeClient()
@@ -0,0 +1,340 @@
+"""
+Local simulation of the Paysafe endpoints used by store.services, to load
+test orders and refunds under realistic latency and failures. Pointing
+PAYSAFE['BASE_URL'] at a running simulator sends every payment request to
+it. See the run_paysafe_simulator command.
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+# HTTP status and message of the errors which can be injected. Other
+# Paysafe codes are answered with a 400 status, three digits codes are
+# answered as bare HTTP errors.
+PAYSAFE_ERRORS = {
+    '3009': (402, "Your request has been declined by the issuing bank."),
+    '3022': (402, "The card has been declined due to insufficient funds."),
+    '3406': (400, "The settlement you are attempting to refund has not been "
+                  "batched yet. There are no settled funds available to "
+                  "refund."),
+    '5031': (409, "The transaction you have submitted has already been "
+                  "processed."),
+    '5269': (404, "The ID(s) specified in the URL do not correspond to the "
+                  "values in the system."),
+}
+
+LATENCY_DISTRIBUTIONS = {
+    'fixed': lambda seconds: seconds,
+    'uniform': random.uniform,
+    'normal': random.gauss,
+    'lognormal': random.lognormvariate,
+    'exponential': lambda mean: random.expovariate(1 / mean),
+}
+
+
+def parse_latency(spec):
+    """
+    Returns a function drawing latencies in seconds from a specification
+    like "fixed:0.1", "uniform:0.05,0.3", "normal:0.2,0.05",
+    "lognormal:-1.6,0.5" or "exponential:0.2".
+    """
+    name, parameters = (spec.split(':', 1) + [''])[:2]
+    if name not in LATENCY_DISTRIBUTIONS:
+        raise ValueError("Unknown latency distribution: {0}".format(name))
+    distribution = LATENCY_DISTRIBUTIONS[name]
+    arguments = [float(value) for value in parameters.split(',') if value]
+
+    return lambda: max(distribution(*arguments), 0)
+
+
+def parse_error(spec):
+    """
+    Returns an (endpoint, code, rate) tuple from a specification like
+    "3009:0.05" or "auths:3009:0.05". Errors without endpoint are injected
+    in every endpoint.
+    """
+    values = spec.split(':')
+    if len(values) == 2:
+        values.insert(0, None)
+    endpoint, code, rate = values
+
+    return endpoint, code, float(rate)
+
+
+class PaysafeSimulator:
+    """
+    Stateful simulation of the card payments auths and refunds, and of the
+    customer vault profiles and cards.
+
+    latency:    Function returning the delay of a response in seconds
+    errors:     List of (endpoint, code, rate) of the errors to inject
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=None, errors=None):
+        self.latency = latency or (lambda: 0)
+        self.errors = errors or list()
+        self.lock = threading.Lock()
+        self.reset()
+
+        card_url = re.escape(settings.PAYSAFE['CARD_URL'])
+        vault_url = re.escape(settings.PAYSAFE['VAULT_URL'])
+        self.routes = [
+            ('POST', 'auths',
+             card_url + r'accounts/[^/]+/auths/?$',
+             self.create_auth),
+            ('POST', 'refunds',
+             card_url + r'accounts/[^/]+/settlements/(?P<settlement_id>[^/]+)'
+                        r'/refunds/?$',
+             self.create_refund),
+            ('POST', 'profiles',
+             vault_url + r'profiles/?$',
+             self.create_profile),
+            ('GET', 'profiles',
+             vault_url + r'profiles/(?P<profile_id>[^/]+)$',
+             self.get_profile),
+            ('POST', 'cards',
+             vault_url + r'profiles/(?P<profile_id>[^/]+)/cards/?$',
+             self.create_card),
+            ('PUT', 'cards',
+             vault_url + r'profiles/(?P<profile_id>[^/]+)'
+                         r'/cards/(?P<card_id>[^/]+)$',
+             self.update_card),
+            ('DELETE', 'cards',
+             vault_url + r'profiles/(?P<profile_id>[^/]+)'
+                         r'/cards/(?P<card_id>[^/]+)$',
+             self.delete_card),
+            ('GET', 'cards',
+             vault_url + r'cards/(?P<card_id>[^/]+)$',
+             self.get_card),
+        ]
+
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def handle_request(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length)
+                status, content = simulator.handle(
+                    self.command,
+                    self.path,
+                    json.loads(body.decode()) if body else {},
+                )
+                content = json.dumps(content).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(content)))
+                    self.end_headers()
+                    self.wfile.write(content)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up waiting
+                    self.close_connection = True
+
+            do_GET = do_POST = do_PUT = do_DELETE = handle_request
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        self.server = Server((host, port), Handler)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return 'http://{0}:{1}/'.format(host, port)
+
+    def reset(self):
+        """
+        Forgets every payment, profile and card and the request accounting.
+        """
+        with self.lock:
+            self.settlements = dict()
+            self.profiles = dict()
+            self.cards = dict()
+            self.stats = defaultdict(lambda: {
+                'requests': 0,
+                'errors': 0,
+                'latency': 0.0,
+            })
+
+    def get_stats(self):
+        """
+        Returns the number of requests and errors and the mean latency in
+        seconds of each endpoint.
+        """
+        with self.lock:
+            return {
+                endpoint: {
+                    'requests': stats['requests'],
+                    'errors': stats['errors'],
+                    'mean_latency': stats['latency'] / stats['requests'],
+                } for endpoint, stats in self.stats.items()
+            }
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, method, path, data):
+        """
+        Returns the status and content of the response to a request, after
+        the simulated latency.
+        """
+        path = urlsplit(path).path.lstrip('/')
+        if path == '__simulator/stats':
+            return 200, self.get_stats()
+        if path == '__simulator/reset':
+            self.reset()
+            return 200, {}
+
+        for route_method, endpoint, pattern, view in self.routes:
+            match = re.match(pattern, path)
+            if match and route_method == method:
+                break
+        else:
+            return self.error('5269')
+
+        latency = self.latency()
+        time.sleep(latency)
+
+        status, content = self.inject_error(endpoint)
+        if status is None:
+            with self.lock:
+                status, content = view(data, **match.groupdict())
+
+        with self.lock:
+            stats = self.stats['{0} {1}'.format(method, endpoint)]
+            stats['requests'] += 1
+            stats['errors'] += status >= 400
+            stats['latency'] += latency
+
+        return status, content
+
+    def inject_error(self, endpoint):
+        for error_endpoint, code, rate in self.errors:
+            if error_endpoint in (None, endpoint) and random.random() < rate:
+                return self.error(code)
+        return None, None
+
+    def error(self, code, **content):
+        if len(code) == 3:
+            return int(code), {}
+        status, message = PAYSAFE_ERRORS.get(code, (400, "Simulated error."))
+        content['error'] = {'code': code, 'message': message}
+        return status, content
+
+    def create_auth(self, data):
+        settlement = {
+            'id': str(uuid.uuid4()),
+            'merchantRefNum': data.get('merchantRefNum'),
+            'status': 'PENDING',
+            'amount': data.get('amount'),
+            'availableToRefund': data.get('amount'),
+        }
+        self.settlements[settlement['id']] = settlement
+        return 200, {
+            'id': str(uuid.uuid4()),
+            'merchantRefNum': data.get('merchantRefNum'),
+            'status': 'COMPLETED',
+            'amount': data.get('amount'),
+            'settleWithAuth': data.get('settleWithAuth'),
+            'currencyCode': 'CAD',
+            'settlements': [settlement],
+        }
+
+    def create_refund(self, data, settlement_id):
+        settlement = self.settlements.get(settlement_id)
+        if settlement is None:
+            return self.error('5269')
+        if data.get('amount', 0) > settlement['availableToRefund']:
+            return self.error('3406')
+        settlement['availableToRefund'] -= data.get('amount', 0)
+        return 200, {
+            'id': str(uuid.uuid4()),
+            'merchantRefNum': data.get('merchantRefNum'),
+            'amount': data.get('amount'),
+            'status': 'COMPLETED',
+        }
+
+    def create_profile(self, data):
+        profile = dict(data, id=str(uuid.uuid4()), status='ACTIVE')
+        self.profiles[profile['id']] = profile
+        return 200, profile
+
+    def get_profile(self, data, profile_id):
+        if profile_id not in self.profiles:
+            return self.error('5269')
+        return 200, dict(
+            self.profiles[profile_id],
+            cards=[
+                card for card in self.cards.values()
+                if card['profileId'] == profile_id
+            ],
+        )
+
+    def create_card(self, data, profile_id):
+        if profile_id not in self.profiles:
+            return self.error('5269')
+        for card in self.cards.values():
+            if card['singleUseToken'] == data.get('singleUseToken'):
+                return self.error('7503', links=[{
+                    'rel': 'existing_entity',
+                    'href': '{0}{1}cards/{2}'.format(
+                        self.url,
+                        settings.PAYSAFE['VAULT_URL'],
+                        card['id'],
+                    ),
+                }])
+        card = {
+            'id': str(uuid.uuid4()),
+            'profileId': profile_id,
+            'singleUseToken': data.get('singleUseToken'),
+            'status': 'ACTIVE',
+            'cardBin': '453091',
+            'lastDigits': '{0:04}'.format(random.randint(0, 9999)),
+            'cardExpiry': {'year': 2030, 'month': 12},
+            'cardType': 'VI',
+            'holderName': 'Simulated Holder',
+            'paymentToken': uuid.uuid4().hex[:15],
+        }
+        self.cards[card['id']] = card
+        return 200, card
+
+    def update_card(self, data, profile_id, card_id):
+        card = self.cards.get(card_id)
+        if card is None or card['profileId'] != profile_id:
+            return self.error('5269')
+        card['singleUseToken'] = data.get('singleUseToken')
+        return 200, card
+
+    def delete_card(self, data, profile_id, card_id):
+        card = self.cards.get(card_id)
+        if card is None or card['profileId'] != profile_id:
+            return self.error('5269')
+        del self.cards[card_id]
+        return 200, {}
+
+    def get_card(self, data, card_id):
+        if card_id not in self.cards:
+            return self.error('5269')
+        return 200, self.cards[card_id]
@@ -70,6 +70,12 @@ class OrderResource(resources.ModelResource):
             'authorization_id',
             'settlement_id',
             'coupon',
+            'subtotal',
+            'discount',
+            'tax',
+            'total',
+            'tickets',
+            'refunded',
         )
         export_order = (
             'id',
@@ -78,6 +84,12 @@ class OrderResource(resources.ModelResource):
             'authorization_id',
             'settlement_id',
             'coupon',
+            'subtotal',
+            'discount',
+            'tax',
+            'total',
+            'tickets',
+            'refunded',
         )
 
 
@@ -201,8 +213,7 @@ class CouponResource(resources.ModelResource):
     total_use = fields.Field()
 
     def dehydrate_total_use(self, coupon):
-        uses = CouponUser.objects.filter(coupon=coupon)
-        return sum(uses.values_list('uses', flat=True))
+        return coupon.uses_total
 
     class Meta:
         model = Coupon
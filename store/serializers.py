@@ -1,9 +1,8 @@
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
+from collections import defaultdict
 from decimal import Decimal
-import random
-import string
 import uuid
 
 from django.apps import apps
@@ -11,27 +10,41 @@ from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
-from django.db import transaction, models
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Prefetch, Q, prefetch_related_objects
 from django.conf import settings
 from django.core.mail import send_mail
-from django.template.loader import render_to_string
 
+from blitz_api.models import Outbox
 from blitz_api.services import (remove_translation_fields,
                                 check_if_translated_field,
-                                getMessageTranslate)
-from workplace.models import Reservation
-from retirement.models import Reservation as RetirementReservation
-from retirement.models import WaitQueueNotification, Retirement
-
-from .exceptions import PaymentAPIError
+                                getMessageTranslate,
+                                get_notification_connection,
+                                render_notification)
+from workplace.exceptions import BookingError
+from workplace.models import TimeSlot
+from workplace.services import book_time_slots, materialize_time_slot
+from retirement.exceptions import BookingError as RetirementBookingError
+from retirement.services import book_retirements
+
+from .exceptions import CouponCodeError, PaymentAPIError
+from .fields import ContentTypeField
 from .models import (Package, Membership, Order, OrderLine, BaseProduct,
                      PaymentProfile, CustomPayment, Coupon, CouponUser, Refund,
-                     MembershipCoupon,)
+                     CouponNotification,)
 from .services import (charge_payment,
+                       claim_coupon_use,
+                       create_coupons,
+                       create_membership_coupons,
+                       generate_coupon_codes,
+                       COUPON_APPLICABLE_FIELDS,
+                       COUPON_BATCH_LIMIT,
                        create_external_payment_profile,
                        create_external_card,
                        get_external_cards,
+                       get_order_line_products,
+                       get_order_totals,
+                       update_order_totals,
                        PAYSAFE_CARD_TYPE,
                        validate_coupon_for_order, )
 
@@ -214,8 +227,7 @@ class CustomPaymentSerializer(serializers.HyperlinkedModelSerializer):
             'COST': custom_payment.price,
         }
 
-        plain_msg = render_to_string("invoice.txt", merge_data)
-        msg_html = render_to_string("invoice.html", merge_data)
+        plain_msg, msg_html = render_notification("invoice", merge_data)
 
         send_mail(
             "Confirmation d'achat",
@@ -223,6 +235,7 @@ class CustomPaymentSerializer(serializers.HyperlinkedModelSerializer):
             settings.DEFAULT_FROM_EMAIL,
             [custom_payment.user.email],
             html_message=msg_html,
+            connection=get_notification_connection(),
         )
 
         return custom_payment
@@ -267,7 +280,7 @@ class PaymentProfileSerializer(serializers.HyperlinkedModelSerializer):
 
 class OrderLineSerializer(serializers.HyperlinkedModelSerializer):
     id = serializers.ReadOnlyField()
-    content_type = serializers.SlugRelatedField(
+    content_type = ContentTypeField(
         queryset=ContentType.objects.all(),
         slug_field='model',
     )
@@ -284,11 +297,6 @@ class OrderLineSerializer(serializers.HyperlinkedModelSerializer):
         """Limits packages according to request user membership"""
         validated_data = super().validate(attrs)
 
-        user = self.context['request'].user
-
-        user_membership = user.membership
-        user_academic_level = user.academic_level
-
         content_type = validated_data.get(
             'content_type',
             getattr(self.instance, 'content_type', None)
@@ -306,6 +314,18 @@ class OrderLineSerializer(serializers.HyperlinkedModelSerializer):
                 ],
             })
 
+        return self.validate_product(attrs, content_type, obj)
+
+    def validate_product(self, attrs, content_type, obj):
+        """
+        Checks that the user can order the product and sets the cost of the
+        order line.
+        """
+        user = self.context['request'].user
+
+        user_membership = user.membership
+        user_academic_level = user.academic_level
+
         if (not user.is_staff
                 and (content_type.model == 'package'
                      or content_type.model == 'retirement')
@@ -335,7 +355,7 @@ class OrderLineSerializer(serializers.HyperlinkedModelSerializer):
         if (content_type.model == 'membership'
                 or content_type.model == 'package'
                 or content_type.model == 'retirement'):
-            attrs['cost'] = obj.price * validated_data.get('quantity')
+            attrs['cost'] = obj.price * attrs.get('quantity')
 
         return attrs
 
@@ -345,6 +365,20 @@ class OrderLineSerializer(serializers.HyperlinkedModelSerializer):
 
 
 class OrderLineSerializerNoOrder(OrderLineSerializer):
+    rule_occurrence = serializers.DateTimeField(
+        write_only=True,
+        required=False,
+        help_text=_(
+            "Start time of the occurrence to book when the order line refers "
+            "to a time slot rule."
+        ),
+    )
+
+    def validate(self, attrs):
+        # Products of all the order lines are loaded at once and validated by
+        # OrderSerializer.validate_order_lines.
+        return attrs
+
     class Meta:
         model = OrderLine
         fields = '__all__'
@@ -392,9 +426,62 @@ class OrderSerializer(serializers.HyperlinkedModelSerializer):
     #     required=False,
     # )
 
+    def validate_order_lines(self, order_lines):
+        """
+        Loads the products of every order line at once and checks that the
+        user can order them.
+        """
+        self.products = get_order_line_products(order_lines)
+        order_line_serializer = self.fields['order_lines'].child
+
+        errors = list()
+        for order_line in order_lines:
+            content_type = order_line['content_type']
+            product = self.products.get(
+                (content_type.id, order_line['object_id'])
+            )
+            try:
+                if product is None:
+                    raise serializers.ValidationError({
+                        'object_id': [
+                            _("The referenced object does not exist.")
+                        ],
+                    })
+                order_line_serializer.validate_product(
+                    order_line,
+                    content_type,
+                    product,
+                )
+                if content_type.model == 'timeslotrule':
+                    rule_occurrence = order_line.get('rule_occurrence')
+                    occurrences = dict(product.get_occurrences(
+                        rule_occurrence,
+                        rule_occurrence,
+                    )) if rule_occurrence else dict()
+                    if rule_occurrence not in occurrences:
+                        raise serializers.ValidationError({
+                            'rule_occurrence': [_(
+                                "This is not an available occurrence of the "
+                                "rule."
+                            )],
+                        })
+                errors.append({})
+            except serializers.ValidationError as err:
+                errors.append(err.detail)
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return order_lines
+
     def create(self, validated_data):
         """
         Create an Order and charge the user.
+
+        Checkout is done in stages: products are loaded by content type
+        during the validation, order lines are inserted at once and priced,
+        then entitlements are applied with a single save of the user and
+        bookings are made in bulk before charging the user.
         """
         user = self.context['request'].user
         # if validated_data.get('target_user', None):
@@ -446,52 +533,98 @@ class OrderSerializer(serializers.HyperlinkedModelSerializer):
             order = Order.objects.create(**validated_data)
             charge_response = None
             discount_amount = 0
+
+            # Occurrences of time slot rules are saved as timeslots when they
+            # are booked. Their order lines refer to those timeslots.
+            time_slot_type = ContentType.objects.get_for_model(TimeSlot)
             for orderline_data in orderlines_data:
-                OrderLine.objects.create(order=order, **orderline_data)
+                rule_occurrence = orderline_data.pop('rule_occurrence', None)
+                content_type = orderline_data['content_type']
+                if content_type.model != 'timeslotrule':
+                    continue
+                time_slot = materialize_time_slot(
+                    self.products[
+                        (content_type.id, orderline_data['object_id'])
+                    ],
+                    rule_occurrence,
+                )
+                if time_slot is None:
+                    raise serializers.ValidationError({
+                        'non_field_errors': [_(
+                            "The requested timeslot does not exist."
+                        )]
+                    })
+                orderline_data['content_type'] = time_slot_type
+                orderline_data['object_id'] = time_slot.id
+                self.products[(time_slot_type.id, time_slot.id)] = time_slot
+
+            # Order lines are inserted at once. Primary keys are not set by
+            # bulk_create on every database, so they are read back to create
+            # their history. Products were loaded during the validation.
+            OrderLine.objects.bulk_create([
+                OrderLine(order=order, **orderline_data)
+                for orderline_data in orderlines_data
+            ])
+            orderlines = list(order.order_lines.order_by('id'))
+            OrderLine.history.bulk_history_create(orderlines)
+
+            orderlines_by_model = defaultdict(list)
+            for orderline in orderlines:
+                orderline.content_object = self.products[
+                    (orderline.content_type_id, orderline.object_id)
+                ]
+                orderlines_by_model[orderline.content_type.model].append(
+                    orderline
+                )
+            membership_orderlines = orderlines_by_model['membership']
+            package_orderlines = orderlines_by_model['package']
+            reservation_orderlines = orderlines_by_model['timeslot']
+            retirement_orderlines = orderlines_by_model['retirement']
 
+            # Pricing
             if coupon:
-                coupon_info = validate_coupon_for_order(coupon, order)
+                coupon_info = validate_coupon_for_order(
+                    coupon,
+                    user,
+                    orderlines,
+                    self.products,
+                )
                 if coupon_info['valid_use']:
-                    coupon_user = CouponUser.objects.get(
-                        user=user,
-                        coupon=coupon,
-                    )
-                    coupon_user.uses = coupon_user.uses + 1
-                    coupon_user.save()
+                    if not claim_coupon_use(coupon, user):
+                        raise serializers.ValidationError({
+                            'non_field_errors': [_(
+                                "Maximum number of uses exceeded for this "
+                                "coupon."
+                            )]
+                        })
                     discount_amount = coupon_info['value']
-                    orderline_cost = coupon_info['orderline'].cost
-                    coupon_info['orderline'].cost = (
-                            orderline_cost -
+                    coupon_orderline = coupon_info['orderline']
+                    coupon_orderline.cost = (
+                            coupon_orderline.cost -
                             discount_amount
                     )
-                    coupon_info['orderline'].coupon = coupon
-                    coupon_info['orderline'].coupon_real_value = coupon_info[
+                    coupon_orderline.coupon = coupon
+                    coupon_orderline.coupon_real_value = coupon_info[
                         'value'
                     ]
-                    coupon_info['orderline'].save()
+                    # Totals of the order are computed below at once
+                    coupon_orderline.skip_order_totals = True
+                    coupon_orderline.save()
                 else:
                     raise serializers.ValidationError(coupon_info['error'])
 
-            amount = order.total_cost
-            tax = amount * Decimal(repr(TAX_RATE))
-            tax = tax.quantize(Decimal('0.01'))
-            amount *= Decimal(repr(TAX_RATE + 1))
+            totals = get_order_totals(orderlines)
+            for field, value in totals.items():
+                setattr(order, field, value)
+
+            tax = totals['tax']
+            amount = totals['subtotal'] * Decimal(repr(TAX_RATE + 1))
             amount = round(amount * 100, 2)
 
-            membership_orderlines = order.order_lines.filter(
-                content_type__model="membership"
-            )
-            package_orderlines = order.order_lines.filter(
-                content_type__model="package"
-            )
-            reservation_orderlines = order.order_lines.filter(
-                content_type__model="timeslot"
-            )
-            retirement_orderlines = order.order_lines.filter(
-                content_type__model="retirement"
-            )
             need_transaction = False
 
+            # Entitlements are applied to the user, which is saved once
+            # afterwards.
             if membership_orderlines:
                 need_transaction = True
                 today = timezone.now().date()
@@ -505,136 +638,44 @@ class OrderSerializer(serializers.HyperlinkedModelSerializer):
                 user.membership_end = (
                         timezone.now().date() + user.membership.duration
                 )
-                user.save()
-
-                membership_coupons = MembershipCoupon.objects.filter(
-                    membership__pk=membership_orderlines[0].content_object.pk
-                )
 
-                for membership_coupon in membership_coupons:
-                    coupon = Coupon.objects.create(
-                        value=membership_coupon.value,
-                        percent_off=membership_coupon.percent_off,
-                        max_use=membership_coupon.max_use,
-                        max_use_per_user=membership_coupon.max_use_per_user,
-                        details=membership_coupon.details,
-                        start_time=timezone.now(),
-                        end_time=timezone.now() +
-                        membership_orderlines[0].content_object.duration,
-                        owner=user)
-                    coupon.applicable_retirements.set(
-                        membership_coupon.applicable_retirements.all())
-                    coupon.applicable_timeslots.set(
-                        membership_coupon.applicable_timeslots.all())
-                    coupon.applicable_packages.set(
-                        membership_coupon.applicable_packages.all())
-                    coupon.applicable_memberships.set(
-                        membership_coupon.applicable_memberships.all())
-                    coupon.applicable_product_types.set(
-                        membership_coupon.applicable_product_types.all())
-                    coupon.generate_code()
-                    coupon.save()
+                create_membership_coupons(user.membership, user)
 
             if package_orderlines:
                 need_transaction = True
-                for package_orderline in package_orderlines:
-                    user.tickets += (
-                            package_orderline.content_object.reservations *
-                            package_orderline.quantity
-                    )
-                    user.save()
+                user.tickets += sum(
+                    orderline.content_object.reservations *
+                    orderline.quantity
+                    for orderline in package_orderlines
+                )
+
             if reservation_orderlines:
-                for reservation_orderline in reservation_orderlines:
-                    timeslot = reservation_orderline.content_object
-                    reservations = timeslot.reservations.filter(is_active=True)
-                    reserved = reservations.count()
-                    if timeslot.billing_price > user.tickets:
-                        raise serializers.ValidationError({
-                            'non_field_errors': [_(
-                                "You don't have enough tickets to make this "
-                                "reservation."
-                            )]
-                        })
-                    if reservations.filter(user=user):
-                        raise serializers.ValidationError({
-                            'non_field_errors': [_(
-                                "You already are registered to this timeslot: "
-                                "{0}.".format(str(timeslot))
-                            )]
-                        })
-                    if (timeslot.period.workplace and
-                            timeslot.period.workplace.seats - reserved > 0):
-                        Reservation.objects.create(
-                            user=user,
-                            timeslot=timeslot,
-                            is_active=True
-                        )
-                        # Decrement user tickets for each reservation.
-                        # OrderLine's quantity and TimeSlot's price will be
-                        # used in the future if we want to allow multiple
-                        # reservations of the same timeslot.
-                        user.tickets -= 1
-                        user.save()
-                    else:
-                        raise serializers.ValidationError({
-                            'non_field_errors': [_(
-                                "There are no places left in the requested "
-                                "timeslot."
-                            )]
-                        })
-            if retirement_orderlines:
-                need_transaction = True
-                if not (user.phone and user.city):
+                # Tickets of the packages above can be used, the user is
+                # saved with the reservations.
+                try:
+                    book_time_slots(
+                        user,
+                        [orderline.object_id
+                         for orderline in reservation_orderlines],
+                    )
+                except BookingError as err:
                     raise serializers.ValidationError({
-                        'non_field_errors': [_(
-                            "Incomplete user profile. 'phone' and 'city' "
-                            "field must be filled in the user profile to book "
-                            "a retirement."
-                        )]
+                        'non_field_errors': [err]
                     })
+            elif membership_orderlines or package_orderlines:
+                user.save()
 
-                for retirement_orderline in retirement_orderlines:
-                    retirement = retirement_orderline.content_object
-                    user_waiting = retirement.wait_queue.filter(user=user)
-                    reservations = retirement.reservations.filter(
-                        is_active=True
+            if retirement_orderlines:
+                need_transaction = True
+                try:
+                    retirement_reservations = book_retirements(
+                        user,
+                        retirement_orderlines,
                     )
-                    reserved = reservations.count()
-                    if reservations.filter(user=user):
-                        raise serializers.ValidationError({
-                            'non_field_errors': [_(
-                                "You already are registered to this "
-                                "retirement: {0}.".format(str(retirement))
-                            )]
-                        })
-                    if (((retirement.seats - retirement.total_reservations -
-                          retirement.reserved_seats) > 0)
-                            or (retirement.reserved_seats
-                                and WaitQueueNotification.objects.filter(
-                                        user=user, retirement=retirement))):
-                        retirement_reservations.append(
-                            RetirementReservation.objects.create(
-                                user=user,
-                                retirement=retirement,
-                                order_line=retirement_orderline,
-                                is_active=True
-                            )
-                        )
-                        # Decrement reserved_seats if > 0
-                        if retirement.reserved_seats:
-                            retirement.reserved_seats = (
-                                    retirement.reserved_seats - 1
-                            )
-                            retirement.save()
-                    else:
-                        raise serializers.ValidationError({
-                            'non_field_errors': [_(
-                                "There are no places left in the requested "
-                                "retirement."
-                            )]
-                        })
-                    if user_waiting:
-                        user_waiting.delete()
+                except RetirementBookingError as err:
+                    raise serializers.ValidationError({
+                        'non_field_errors': [err]
+                    })
 
             if need_transaction and payment_token and int(amount):
                 # Charge the order with the external payment API
@@ -695,15 +736,13 @@ class OrderSerializer(serializers.HyperlinkedModelSerializer):
                     order.authorization_id = 0
                     order.settlement_id = 0
                     order.reference_number = "charge-" + str(uuid.uuid4())
-                order.save()
+            order.save()
 
         if need_transaction:
             # Send order email
-            orderlines = order.order_lines.filter(
-                models.Q(content_type__model='membership') |
-                models.Q(content_type__model='package') |
-                models.Q(content_type__model='retirement')
-            )
+            orderlines = (membership_orderlines +
+                          package_orderlines +
+                          retirement_orderlines)
 
             # Here, the 'details' key is used to provide details of the
             #  item to the email template.
@@ -749,8 +788,7 @@ class OrderSerializer(serializers.HyperlinkedModelSerializer):
                 'COST': round(amount / 100, 2),
             }
 
-            plain_msg = render_to_string("invoice.txt", merge_data)
-            msg_html = render_to_string("invoice.html", merge_data)
+            plain_msg, msg_html = render_notification("invoice", merge_data)
 
             send_mail(
                 "Confirmation d'achat",
@@ -758,6 +796,7 @@ class OrderSerializer(serializers.HyperlinkedModelSerializer):
                 settings.DEFAULT_FROM_EMAIL,
                 [order.user.email],
                 html_message=msg_html,
+                connection=get_notification_connection(),
             )
 
         # Send retirement informations emails
@@ -768,13 +807,9 @@ class OrderSerializer(serializers.HyperlinkedModelSerializer):
                 'USER': user,
             }
 
-            plain_msg = render_to_string(
-                "retirement_info.txt",
-                merge_data
-            )
-            msg_html = render_to_string(
-                "retirement_info.html",
-                merge_data
+            plain_msg, msg_html = render_notification(
+                "retirement_info",
+                merge_data,
             )
 
             send_mail(
@@ -783,12 +818,36 @@ class OrderSerializer(serializers.HyperlinkedModelSerializer):
                 settings.DEFAULT_FROM_EMAIL,
                 [retirement_reservation.user.email],
                 html_message=msg_html,
+                connection=get_notification_connection(),
             )
 
+        # Order lines of the response are loaded at once
+        prefetch_related_objects(
+            [order],
+            Prefetch(
+                'order_lines',
+                queryset=OrderLine.objects.select_related(
+                    'content_type',
+                    'coupon',
+                ),
+            ),
+        )
+
         return order
 
     def update(self, instance, validated_data):
         orderlines_data = validated_data.pop('order_lines')
+        # Occurrences of time slot rules are only materialized and booked
+        # when an order is created.
+        for orderline_data in orderlines_data:
+            orderline_data.pop('rule_occurrence', None)
+            if orderline_data['content_type'].model == 'timeslotrule':
+                raise serializers.ValidationError({
+                    'order_lines': [_(
+                        "Time slot rules can only be booked when creating "
+                        "an order."
+                    )]
+                })
         order = super().update(instance, validated_data)
         for orderline_data in orderlines_data:
             OrderLine.objects.update_or_create(
@@ -797,6 +856,8 @@ class OrderSerializer(serializers.HyperlinkedModelSerializer):
                 object_id=orderline_data.get('object_id'),
                 defaults=orderline_data,
             )
+        update_order_totals([order.id])
+        order.refresh_from_db()
         return order
 
     class Meta:
@@ -809,6 +870,24 @@ class OrderSerializer(serializers.HyperlinkedModelSerializer):
             'user': {
                 'read_only': True,
             },
+            'subtotal': {
+                'read_only': True,
+            },
+            'discount': {
+                'read_only': True,
+            },
+            'tax': {
+                'read_only': True,
+            },
+            'total': {
+                'read_only': True,
+            },
+            'tickets': {
+                'read_only': True,
+            },
+            'refunded': {
+                'read_only': True,
+            },
         }
 
 
@@ -824,7 +903,7 @@ class CouponSerializer(serializers.HyperlinkedModelSerializer):
         allow_blank=True,
         required=False,
         validators=[
-            UniqueValidator(queryset=Coupon.objects.all()),
+            UniqueValidator(queryset=Coupon.all_objects.all()),
         ]
     )
     value = serializers.DecimalField(
@@ -871,24 +950,13 @@ class CouponSerializer(serializers.HyperlinkedModelSerializer):
         """
         Generate coupon's code and create the coupon.
         """
-        code = validated_data.get('code', None)
-
-        used_code = Coupon.objects.all().values_list('code', flat=True)
-        n = 0
-        while ((not code or code in used_code) and (n < 100)):
-            code = ''.join(
-                random.choices(
-                    string.ascii_uppercase.replace("O", "").replace("I", "") +
-                    string.digits.replace("0", ""),
-                    k=8))
-            n += 1
-        if n >= 100:
-            raise serializers.ValidationError({
-                'non_field_errors': [_(
-                    "Can't generate new unique codes. Delete old coupons."
-                )]
-            })
-        validated_data['code'] = code
+        if not validated_data.get('code', None):
+            try:
+                validated_data['code'] = generate_coupon_codes(1).pop()
+            except CouponCodeError as err:
+                raise serializers.ValidationError({
+                    'non_field_errors': [str(err)]
+                })
         return super(CouponSerializer, self).create(validated_data)
 
     def update(self, instance, validated_data):
@@ -979,9 +1047,39 @@ class CouponSerializer(serializers.HyperlinkedModelSerializer):
             'applicable_memberships': {
                 'required': False,
             },
+            'uses_total': {
+                'read_only': True,
+            },
         }
 
 
+class CouponBatchSerializer(CouponSerializer):
+    """Creates coupons sharing everything but their random code."""
+    code = None
+    count = serializers.IntegerField(
+        min_value=1,
+        max_value=COUPON_BATCH_LIMIT,
+        help_text=_("Number of coupons to create."),
+    )
+
+    def create(self, validated_data):
+        count = validated_data.pop('count')
+        applicable_ids = {
+            field_name: [
+                related.pk for related in validated_data.pop(field_name, [])
+            ] for field_name in COUPON_APPLICABLE_FIELDS
+        }
+        try:
+            return create_coupons(count, applicable_ids, **validated_data)
+        except CouponCodeError as err:
+            raise serializers.ValidationError({
+                'non_field_errors': [str(err)]
+            })
+
+    class Meta(CouponSerializer.Meta):
+        exclude = ('deleted', 'code', 'users')
+
+
 class CouponUserSerializer(serializers.HyperlinkedModelSerializer):
     id = serializers.ReadOnlyField()
 
@@ -990,6 +1088,32 @@ class CouponUserSerializer(serializers.HyperlinkedModelSerializer):
         exclude = ('deleted',)
 
 
+class CouponNotificationSerializer(serializers.HyperlinkedModelSerializer):
+    """
+    Delivery of the emails of a coupon notification, by outbox status.
+    """
+    id = serializers.ReadOnlyField()
+
+    class Meta:
+        model = CouponNotification
+        fields = ('id', 'url', 'coupon', 'user', 'total', 'created',)
+
+    def to_representation(self, instance):
+        data = super(CouponNotificationSerializer, self).to_representation(
+            instance
+        )
+        notification_status = instance.get_status()
+        sent = len(notification_status[Outbox.STATUS_SENT])
+        failed_emails = notification_status[Outbox.STATUS_FAILED]
+
+        data['sent'] = sent
+        data['failed'] = len(failed_emails)
+        data['pending'] = instance.total - sent - len(failed_emails)
+        data['failed_emails'] = failed_emails
+
+        return data
+
+
 class RefundSerializer(serializers.HyperlinkedModelSerializer):
     id = serializers.ReadOnlyField()
 
@@ -1,3 +1,4 @@
+from collections import defaultdict
 from decimal import Decimal
 import json
 import random
@@ -5,14 +6,43 @@ import requests
 import uuid
 
 from django.conf import settings
-from django.core.mail import send_mail
-from django.db.models import Q
-from django.template.loader import render_to_string
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
-from .exceptions import PaymentAPIError
-from .models import CouponUser
+from blitz_api.email_backends import OutboxEmailBackend
+from blitz_api.services import (bulk_history_update, render_notification,
+                                send_notifications)
+
+from .exceptions import CouponCodeError, PaymentAPIError
+from .models import (Coupon, CouponApplicability, CouponNotification,
+                     CouponUser, MembershipCoupon, Order, OrderLine, Refund)
+from .paysafe import paysafe_client
+
+TAX_RATE = settings.LOCAL_SETTINGS['SELLING_TAX']
+
+# Number of emails above which the delivery of coupon notifications is
+# reported by a CouponNotification to poll.
+COUPON_NOTIFICATION_SYNC_LIMIT = 50
+
+# Number of coupons inserted at once when coupons are created in bulk, and
+# number of times a batch is retried with new codes after a conflict.
+COUPON_BATCH_SIZE = 500
+COUPON_CODE_ATTEMPTS = 10
+
+# Maximum number of coupons created by a single request.
+COUPON_BATCH_LIMIT = 10000
+
+# Applicable relations of coupons, indexed in CouponApplicability.
+COUPON_APPLICABLE_FIELDS = (
+    'applicable_retirements',
+    'applicable_timeslots',
+    'applicable_packages',
+    'applicable_memberships',
+    'applicable_product_types',
+)
 
 
 ###############################################################################
@@ -123,12 +153,8 @@ def charge_payment(amount, payment_token, reference_number):
     }
 
     try:
-        r = requests.post(
+        r = paysafe_client.post(
             auth_url,
-            auth=(
-                settings.PAYSAFE['USER'],
-                settings.PAYSAFE['PASSWORD'],
-            ),
             json=data,
         )
         r.raise_for_status()
@@ -168,12 +194,8 @@ def refund_amount(settlement_id, amount):
     }
 
     try:
-        r = requests.post(
+        r = paysafe_client.post(
             refund_url,
-            auth=(
-                settings.PAYSAFE['USER'],
-                settings.PAYSAFE['PASSWORD'],
-            ),
             json=data,
         )
         r.raise_for_status()
@@ -213,12 +235,8 @@ def create_external_payment_profile(user):
     }
 
     try:
-        r = requests.post(
+        r = paysafe_client.post(
             create_profile_url,
-            auth=(
-                settings.PAYSAFE['USER'],
-                settings.PAYSAFE['PASSWORD']
-            ),
             json=data,
         )
         r.raise_for_status()
@@ -247,9 +265,8 @@ def get_external_payment_profile(profile_id):
     )
 
     try:
-        r = requests.get(
+        r = paysafe_client.get(
             get_profile_url,
-            auth=(settings.PAYSAFE['USER'], settings.PAYSAFE['PASSWORD']),
         )
         r.raise_for_status()
     except requests.exceptions.HTTPError as err:
@@ -283,9 +300,8 @@ def update_external_card(profile_id, card_id, single_use_token):
     }
 
     try:
-        r = requests.put(
+        r = paysafe_client.put(
             put_cards_url,
-            auth=(settings.PAYSAFE['USER'], settings.PAYSAFE['PASSWORD']),
             json=data,
         )
         r.raise_for_status()
@@ -319,9 +335,8 @@ def create_external_card(profile_id, single_use_token):
     }
 
     try:
-        r = requests.post(
+        r = paysafe_client.post(
             post_cards_url,
-            auth=(settings.PAYSAFE['USER'], settings.PAYSAFE['PASSWORD']),
             json=data,
         )
         r.raise_for_status()
@@ -335,12 +350,8 @@ def create_external_card(profile_id, single_use_token):
                 )
                 card_data = json.loads(r.content)
                 delete_external_card(profile_id, card_data['id'])
-                r = requests.post(
+                r = paysafe_client.post(
                     post_cards_url,
-                    auth=(
-                        settings.PAYSAFE['USER'],
-                        settings.PAYSAFE['PASSWORD']
-                    ),
                     json=data,
                 )
                 r.raise_for_status()
@@ -399,9 +410,8 @@ def get_external_card(card_id):
     )
 
     try:
-        r = requests.get(
+        r = paysafe_client.get(
             get_card_url,
-            auth=(settings.PAYSAFE['USER'], settings.PAYSAFE['PASSWORD']),
         )
         r.raise_for_status()
     except requests.exceptions.HTTPError as err:
@@ -430,9 +440,8 @@ def delete_external_card(profile_id, card_id):
     )
 
     try:
-        r = requests.delete(
+        r = paysafe_client.delete(
             delete_card_url,
-            auth=(settings.PAYSAFE['USER'], settings.PAYSAFE['PASSWORD']),
         )
         r.raise_for_status()
     except requests.exceptions.HTTPError as err:
@@ -449,18 +458,173 @@ def delete_external_card(profile_id, card_id):
 ###############################################################################
 
 
-def validate_coupon_for_order(coupon, order):
+def get_order_line_products(order_lines):
+    """
+    Loads the products of order lines with one query per content type.
+    Memberships required by products and periods of timeslots are loaded
+    with them.
+
+    order_lines: Iterable of dicts with 'content_type' and 'object_id' keys
+
+    Returns a dict of products by (content type id, object id).
+    """
+    object_ids = defaultdict(set)
+    for order_line in order_lines:
+        object_ids[order_line['content_type']].add(order_line['object_id'])
+
+    products = dict()
+    for content_type, ids in object_ids.items():
+        model = content_type.model_class()
+        prefetch = [
+            field for field in ('exclusive_memberships', 'academic_levels')
+            if hasattr(model, field)
+        ]
+        related = [field for field in ('period',) if hasattr(model, field)]
+        queryset = model._base_manager.filter(
+            pk__in=ids,
+        ).select_related(*related).prefetch_related(*prefetch)
+        for product in queryset:
+            products[(content_type.id, product.pk)] = product
+
+    return products
+
+
+def get_order_totals(orderlines):
+    """
+    Computes the totals of an order.
+
+    orderlines: OrderLine instances of the order, with their products
+
+    Returns a dict of the subtotal, discount, tax, total and tickets.
+    """
+    subtotal = Decimal(0)
+    discount = Decimal(0)
+    tickets = Decimal(0)
+    for orderline in orderlines:
+        model = orderline.content_type.model
+        if model == 'timeslot':
+            tickets += (orderline.content_object.billing_price *
+                        orderline.quantity)
+        elif model in ('membership', 'package', 'retirement'):
+            subtotal += orderline.cost * orderline.quantity
+        discount += orderline.coupon_real_value
+
+    return {
+        'subtotal': subtotal,
+        'discount': discount,
+        'tax': (subtotal * Decimal(repr(TAX_RATE))).quantize(
+            Decimal('0.01')
+        ),
+        'total': (subtotal * Decimal(repr(TAX_RATE + 1))).quantize(
+            Decimal('0.01')
+        ),
+        'tickets': tickets,
+    }
+
+
+def update_order_totals(order_ids):
+    """
+    Saves the totals of orders computed from their order lines and refunds.
+    Order lines, products and refunds are loaded with a fixed number of
+    queries, then each order is updated.
+
+    order_ids: Iterable of Order ids
+
+    Returns the number of updated orders.
+    """
+    order_ids = list(order_ids)
+    orderlines = list(
+        OrderLine.objects.filter(
+            order_id__in=order_ids,
+        ).select_related('content_type')
+    )
+    products = get_order_line_products([
+        {
+            'content_type': orderline.content_type,
+            'object_id': orderline.object_id,
+        } for orderline in orderlines
+    ])
+    refunded = dict(
+        Refund.objects.filter(
+            orderline__order_id__in=order_ids,
+        ).values('orderline__order_id').annotate(
+            amount=Sum('amount'),
+        ).values_list('orderline__order_id', 'amount')
+    )
+
+    orderlines_by_order = defaultdict(list)
+    for orderline in orderlines:
+        product = products.get(
+            (orderline.content_type_id, orderline.object_id)
+        )
+        # The price of a deleted timeslot is unknown
+        if product is None and orderline.content_type.model == 'timeslot':
+            continue
+        orderline.content_object = product
+        orderlines_by_order[orderline.order_id].append(orderline)
+
+    updated = 0
+    with transaction.atomic():
+        for order_id in order_ids:
+            updated += Order.objects.filter(pk=order_id).update(
+                refunded=refunded.get(order_id, 0),
+                **get_order_totals(orderlines_by_order[order_id])
+            )
+
+    return updated
+
+
+def get_applicability_filter(orderlines):
+    """
+    Returns a filter of the CouponApplicability matching the products of the
+    order lines, either directly or through their product type.
+    """
+    object_ids = defaultdict(set)
+    for orderline in orderlines:
+        object_ids[orderline.content_type_id].add(orderline.object_id)
+
+    applicability_filter = Q(
+        content_type_id__in=list(object_ids),
+        object_id=None,
+    )
+    for content_type_id, ids in object_ids.items():
+        applicability_filter |= Q(
+            content_type_id=content_type_id,
+            object_id__in=ids,
+        )
+
+    return applicability_filter
+
+
+def get_applicable_coupons(product):
+    """
+    Returns the coupons applying to a product, directly or through its
+    product type.
     """
-    coupon: Coupon model instance
-    order: Order model instance
+    return Coupon.objects.filter(
+        Q(applicabilities__object_id=product.pk) |
+        Q(applicabilities__object_id=None),
+        applicabilities__content_type=ContentType.objects.get_for_model(
+            product,
+        ),
+    ).distinct()
 
-    THIS DOES NOT RECORD COUPON USE. Linked CouponUser instance needs to be
-    updated outside of this function!
+
+def validate_coupon_for_order(coupon, user, orderlines, products=None):
+    """
+    coupon:     Coupon model instance
+    user:       User model instance placing the order
+    orderlines: OrderLine instances of the order, saved or not
+    products:   Optional dict of the products of the order lines as returned
+                by get_order_line_products(), loaded otherwise
+
+    The coupon is evaluated in memory and nothing is written.
+    THIS DOES NOT RECORD COUPON USE. Use claim_coupon_use() once the order
+    is placed!
 
     Returns a dict containing informations concerning the coupon use.
     """
     now = timezone.now()
-    user = order.user
     coupon_info = {
         'valid_use': False,
         'error': None,
@@ -494,18 +658,13 @@ def validate_coupon_for_order(coupon, order):
         return coupon_info
 
     # Check if the maximum number of use for this coupon is exceeded
-    coupon_user, created = CouponUser.objects.get_or_create(
+    user_coupon_uses = CouponUser.objects.filter(
         coupon=coupon,
         user=user,
-        defaults={'uses': 0},
-    )
-    total_coupon_uses = CouponUser.objects.filter(coupon=coupon)
-    total_coupon_uses = sum(
-        total_coupon_uses.values_list('uses', flat=True)
-    )
-    valid_use = coupon_user.uses < coupon.max_use_per_user
+    ).values_list('uses', flat=True).first() or 0
+    valid_use = user_coupon_uses < coupon.max_use_per_user
     valid_use = valid_use or not coupon.max_use_per_user
-    valid_use = valid_use and (total_coupon_uses < coupon.max_use
+    valid_use = valid_use and (coupon.uses_total < coupon.max_use
                                or not coupon.max_use)
     if not valid_use:
         coupon_info['error'] = {
@@ -516,21 +675,17 @@ def validate_coupon_for_order(coupon, order):
         return coupon_info
 
     # Check if the coupon can be applied to a product in the order
-    applicable_orderlines = order.order_lines.filter(
-        Q(content_type__in=coupon.applicable_product_types.all())
-        | Q(content_type__model='package',
-            object_id__in=coupon.applicable_packages.all().
-            values_list('id', flat=True))
-        | Q(content_type__model='timeslot',
-            object_id__in=coupon.applicable_timeslots.all().
-            values_list('id', flat=True))
-        | Q(content_type__model='membership',
-            object_id__in=coupon.applicable_memberships.all().
-            values_list('id', flat=True))
-        | Q(content_type__model='retirement',
-            object_id__in=coupon.applicable_retirements.all().
-            values_list('id', flat=True))
+    applicable = set(
+        CouponApplicability.objects.filter(
+            get_applicability_filter(orderlines),
+            coupon=coupon,
+        ).values_list('content_type_id', 'object_id')
     )
+    applicable_orderlines = [
+        orderline for orderline in orderlines
+        if (orderline.content_type_id, None) in applicable or
+        (orderline.content_type_id, orderline.object_id) in applicable
+    ]
     if not applicable_orderlines:
         coupon_info['error'] = {
             'non_field_errors': [_(
@@ -539,15 +694,23 @@ def validate_coupon_for_order(coupon, order):
         }
         return coupon_info
 
+    if products is None:
+        products = get_order_line_products([
+            {
+                'content_type': orderline.content_type,
+                'object_id': orderline.object_id,
+            } for orderline in applicable_orderlines
+        ])
+
     # The coupon is valid and can be used.
     # We find the product to which it applies.
     # We calculate the official amount to be discounted.
     coupon_info['valid_use'] = True
-    most_exp_product = applicable_orderlines[0].content_object
-    coupon_info['orderline'] = applicable_orderlines[0]
+    most_exp_product = None
     for orderline in applicable_orderlines:
-        product = orderline.content_object
-        if product.price > most_exp_product.price:
+        product = products[(orderline.content_type_id, orderline.object_id)]
+        if most_exp_product is None or (
+                product.price > most_exp_product.price):
             most_exp_product = product
             coupon_info['orderline'] = orderline
     if not coupon.value:
@@ -563,21 +726,261 @@ def validate_coupon_for_order(coupon, order):
     return coupon_info
 
 
-def notify_for_coupon(email, coupon):
+def claim_coupon_use(coupon, user):
+    """
+    Records a use of a coupon by a user if both have uses left. Counters are
+    incremented by conditional updates so concurrent orders can't exceed the
+    maximum number of uses of the coupon.
+
+    Returns True if the use was recorded.
+    """
+    with transaction.atomic():
+        coupon_user, created = CouponUser.objects.get_or_create(
+            user=user,
+            coupon=coupon,
+            defaults={'uses': 0},
+        )
+
+        claimed = Coupon.objects.filter(
+            Q(max_use=0) | Q(uses_total__lt=F('max_use')),
+            pk=coupon.pk,
+        ).update(uses_total=F('uses_total') + 1)
+
+        user_uses = CouponUser.objects.filter(pk=coupon_user.pk)
+        if coupon.max_use_per_user:
+            user_uses = user_uses.filter(uses__lt=coupon.max_use_per_user)
+        claimed = claimed and user_uses.update(uses=F('uses') + 1)
+
+        if not claimed:
+            transaction.set_rollback(True)
+            return False
+
+    # Conditional updates bypass simple_history, changes are recorded here
+    coupon.refresh_from_db(fields=['uses_total'])
+    coupon_user.refresh_from_db(fields=['uses'])
+    bulk_history_update([coupon], user)
+    bulk_history_update([coupon_user], user)
+
+    return True
+
+
+def generate_coupon_codes(count):
+    """
+    Returns a set of random codes which are not used by any coupon, deleted
+    or not. Candidates are checked COUPON_BATCH_SIZE at a time.
+    """
+    codes = set()
+    for attempt in range(COUPON_CODE_ATTEMPTS):
+        missing = count - len(codes)
+        if not missing:
+            return codes
+        candidates = {Coupon.get_random_code() for index in range(missing)}
+        candidates -= codes
+        candidates = list(candidates)
+        for index in range(0, len(candidates), COUPON_BATCH_SIZE):
+            batch = candidates[index:index + COUPON_BATCH_SIZE]
+            used_codes = Coupon.all_objects.filter(
+                code__in=batch,
+            ).values_list('code', flat=True)
+            codes.update(set(batch) - set(used_codes))
+
+    if len(codes) < count:
+        raise CouponCodeError(
+            _("Can't generate new unique codes. Delete old coupons.")
+        )
+    return codes
+
+
+def set_coupons_applicable_products(applicable_ids):
+    """
+    Relates coupons to their applicable products with one insert per
+    relation. m2m_changed isn't sent by bulk inserts, the products are also
+    indexed in CouponApplicability here.
+
+    applicable_ids: dict of coupon ids to a dict of applicable relation
+                    names to the related ids
+    """
+    through_instances = defaultdict(list)
+    applicabilities = list()
+    for coupon_id, relations in applicable_ids.items():
+        for field_name, related_ids in relations.items():
+            field = Coupon._meta.get_field(field_name)
+            through = field.remote_field.through
+            if field.related_model is not ContentType:
+                content_type = ContentType.objects.get_for_model(
+                    field.related_model,
+                )
+            for related_id in related_ids:
+                through_instances[through].append(through(**{
+                    field.m2m_column_name(): coupon_id,
+                    field.m2m_reverse_name(): related_id,
+                }))
+                if field.related_model is ContentType:
+                    applicabilities.append(CouponApplicability(
+                        coupon_id=coupon_id,
+                        content_type_id=related_id,
+                        object_id=None,
+                    ))
+                else:
+                    applicabilities.append(CouponApplicability(
+                        coupon_id=coupon_id,
+                        content_type=content_type,
+                        object_id=related_id,
+                    ))
+
+    for through, instances in through_instances.items():
+        through.objects.bulk_create(instances, batch_size=COUPON_BATCH_SIZE)
+    CouponApplicability.objects.bulk_create(
+        applicabilities,
+        batch_size=COUPON_BATCH_SIZE,
+    )
+
+
+def insert_coupons(coupons):
+    """
+    Inserts coupons with new random codes, COUPON_BATCH_SIZE at a time. A
+    batch whose codes were taken meanwhile is retried with new codes.
+
+    coupons: Unsaved Coupon instances, their primary keys are set
+
+    Returns the coupons.
+    """
+    for index in range(0, len(coupons), COUPON_BATCH_SIZE):
+        batch = coupons[index:index + COUPON_BATCH_SIZE]
+        for attempt in range(COUPON_CODE_ATTEMPTS):
+            for coupon, code in zip(batch, generate_coupon_codes(len(batch))):
+                coupon.code = code
+            try:
+                with transaction.atomic():
+                    Coupon.objects.bulk_create(batch)
+            except IntegrityError:
+                continue
+            break
+        else:
+            raise CouponCodeError(
+                _("Can't generate new unique codes. Delete old coupons.")
+            )
+        # Primary keys are not set by bulk_create on every database
+        coupon_ids = dict(
+            Coupon.objects.filter(
+                code__in=[coupon.code for coupon in batch],
+            ).values_list('code', 'id')
+        )
+        for coupon in batch:
+            coupon.pk = coupon_ids[coupon.code]
+
+    Coupon.history.bulk_history_create(coupons)
+
+    return coupons
+
+
+def create_coupons(count, applicable_ids=None, **fields):
     """
-    This function sends an email to notify a user that he has access to a
-    coupon code for his next purchase.
+    Creates coupons sharing the same fields and applicable products, each
+    with its own random code.
+
+    count:          Number of coupons to create
+    applicable_ids: Dict of applicable relation names to the related ids
+    fields:         Fields of the coupons
+
+    Returns the created coupons.
     """
+    with transaction.atomic():
+        coupons = insert_coupons([Coupon(**fields) for index in range(count)])
+        set_coupons_applicable_products({
+            coupon.id: applicable_ids or {} for coupon in coupons
+        })
+
+    return coupons
+
+
+def create_membership_coupons(membership, user):
+    """
+    Creates the coupons given with a membership to the user who bought it,
+    from the MembershipCoupon of the membership. The applicable products of
+    every MembershipCoupon are read in one pass and coupons are inserted at
+    once.
+
+    Returns the created coupons.
+    """
+    membership_coupons = list(
+        MembershipCoupon.objects.filter(
+            membership=membership,
+        ).prefetch_related(*COUPON_APPLICABLE_FIELDS)
+    )
+    if not membership_coupons:
+        return list()
+
+    now = timezone.now()
+    with transaction.atomic():
+        coupons = insert_coupons([
+            Coupon(
+                value=membership_coupon.value,
+                percent_off=membership_coupon.percent_off,
+                max_use=membership_coupon.max_use,
+                max_use_per_user=membership_coupon.max_use_per_user,
+                details=membership_coupon.details,
+                start_time=now,
+                end_time=now + membership.duration,
+                owner=user,
+            ) for membership_coupon in membership_coupons
+        ])
+        set_coupons_applicable_products({
+            coupon.id: {
+                field_name: [
+                    related.pk for related in
+                    getattr(membership_coupon, field_name).all()
+                ] for field_name in COUPON_APPLICABLE_FIELDS
+            } for coupon, membership_coupon in zip(coupons, membership_coupons)
+        })
+
+    return coupons
+
+
+def notify_for_coupon(emails, coupon, connection=None):
+    """
+    This function sends an email to notify users that they have access to a
+    coupon code for their next purchase. The email is the same for every
+    user and is rendered once.
+
+    Returns the number of successfully sent emails.
+    """
+    emails = list(emails)
 
     merge_data = {'COUPON': coupon}
 
-    plain_msg = render_to_string("coupon_code.txt", merge_data)
-    msg_html = render_to_string("coupon_code.html", merge_data)
+    messages = render_notification("coupon_code", merge_data)
 
-    return send_mail(
+    return send_notifications(
         "Coupon rabais",
-        plain_msg,
-        settings.DEFAULT_FROM_EMAIL,
-        [email],
-        html_message=msg_html,
+        [messages] * len(emails),
+        emails,
+        connection=connection,
     )
+
+
+def queue_coupon_notification(emails, coupon, user):
+    """
+    Saves the notification emails of a coupon in the outbox with the
+    reference of a new CouponNotification, which reports the delivery of
+    each email.
+
+    Returns the CouponNotification.
+    """
+    emails = list(emails)
+
+    with transaction.atomic():
+        notification = CouponNotification.objects.create(
+            coupon=coupon,
+            user=user,
+            total=len(emails),
+        )
+        # Written in the outbox whatever EMAIL_BACKEND is, the notification
+        # reports the delivery of those emails.
+        notify_for_coupon(
+            emails,
+            coupon,
+            connection=OutboxEmailBackend(reference=notification.reference),
+        )
+
+    return notification
@@ -0,0 +1,109 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Sum
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Coupon, CouponApplicability, Order, OrderLine, Refund
+from .services import update_order_totals
+
+# Products or product types related to the through model of each applicable
+# relation of coupons.
+APPLICABLE_MODELS = {
+    getattr(Coupon, field_name).through:
+        Coupon._meta.get_field(field_name).related_model
+    for field_name in (
+        'applicable_retirements',
+        'applicable_timeslots',
+        'applicable_packages',
+        'applicable_memberships',
+        'applicable_product_types',
+    )
+}
+
+
+@receiver(post_save, sender=Refund)
+@receiver(post_delete, sender=Refund)
+def update_order_refunded(sender, instance, **kwargs):
+    """
+    Keeps the refunded amount of the order of a refund up to date. Refunds
+    which are soft deleted are not counted anymore.
+    """
+    order_id = OrderLine.objects.filter(
+        pk=instance.orderline_id,
+    ).values_list('order_id', flat=True).first()
+
+    refunded = Refund.objects.filter(
+        orderline__order_id=order_id,
+    ).aggregate(amount=Sum('amount'))['amount']
+
+    Order.objects.filter(pk=order_id).update(refunded=refunded or 0)
+
+
+@receiver(post_save, sender=OrderLine)
+@receiver(post_delete, sender=OrderLine)
+def update_order_line_totals(sender, instance, raw=False, **kwargs):
+    """
+    Keeps the totals of the order of an order line up to date when the
+    order line is changed outside of the checkout (ie: /order_lines or the
+    admin). Order lines inserted in bulk at checkout don't send signals and
+    the checkout flags the order line it discounts with skip_order_totals.
+    """
+    if raw or getattr(instance, 'skip_order_totals', False):
+        return
+
+    update_order_totals([instance.order_id])
+
+
+@receiver(m2m_changed, sender=Coupon.applicable_retirements.through)
+@receiver(m2m_changed, sender=Coupon.applicable_timeslots.through)
+@receiver(m2m_changed, sender=Coupon.applicable_packages.through)
+@receiver(m2m_changed, sender=Coupon.applicable_memberships.through)
+@receiver(m2m_changed, sender=Coupon.applicable_product_types.through)
+def update_coupon_applicability(sender, instance, action, reverse, pk_set,
+                                **kwargs):
+    """
+    Keeps CouponApplicability in line with the applicable relations of
+    coupons, whichever side of the relation is changed.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    related_model = APPLICABLE_MODELS[sender]
+
+    # pk_set is None when the relation is cleared
+    if reverse:
+        coupon_ids, related_ids = pk_set, [instance.pk]
+    else:
+        coupon_ids, related_ids = [instance.pk], pk_set
+
+    if related_model is ContentType:
+        keys = [(related_id, None) for related_id in related_ids or ()]
+        queryset = CouponApplicability.objects.filter(object_id=None)
+        if related_ids is not None:
+            queryset = queryset.filter(content_type_id__in=related_ids)
+    else:
+        content_type_id = ContentType.objects.get_for_model(related_model).id
+        keys = [
+            (content_type_id, related_id) for related_id in related_ids or ()
+        ]
+        queryset = CouponApplicability.objects.filter(
+            content_type_id=content_type_id,
+            object_id__isnull=False,
+        )
+        if related_ids is not None:
+            queryset = queryset.filter(object_id__in=related_ids)
+
+    if coupon_ids is not None:
+        queryset = queryset.filter(coupon_id__in=coupon_ids)
+
+    if action == 'post_add':
+        CouponApplicability.objects.bulk_create([
+            CouponApplicability(
+                coupon_id=coupon_id,
+                content_type_id=content_type_id,
+                object_id=object_id,
+            ) for coupon_id in coupon_ids
+            for content_type_id, object_id in keys
+        ])
+    else:
+        queryset.delete()
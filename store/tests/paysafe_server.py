@@ -0,0 +1,77 @@
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+class FakePaysafeServer:
+    """
+    Local HTTP server answering queued responses, used to test the payment
+    client offline on real connections.
+
+    Each request is recorded as a (method, path, client port) tuple, the
+    client port tells which connection was used.
+    """
+
+    def __init__(self):
+        self.responses = deque()
+        self.requests = list()
+
+        fake_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def handle_request(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                self.rfile.read(length)
+                fake_server.requests.append(
+                    (self.command, self.path, self.client_address[1])
+                )
+                status, body, delay = (200, {}, 0)
+                if fake_server.responses:
+                    status, body, delay = fake_server.responses.popleft()
+                time.sleep(delay)
+                content = json.dumps(body).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(content)))
+                    self.end_headers()
+                    self.wfile.write(content)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up waiting
+                    self.close_connection = True
+
+            do_GET = do_POST = do_PUT = do_DELETE = handle_request
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+            def handle_error(self, request, client_address):
+                pass
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}/'.format(self.server.server_port)
+
+    def add_response(self, status=200, body=None, delay=0):
+        """
+        Queues the response of a next request, delayed by delay seconds.
+        """
+        self.responses.append((status, body or {}, delay))
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,10 +1,14 @@
+from io import StringIO
+
 from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
 
 from rest_framework.test import APITestCase
 
 from blitz_api.factories import UserFactory
 
-from ..models import Package, Coupon
+from ..models import Package, Coupon, CouponApplicability, CouponUser
+from ..services import get_applicable_coupons
 
 
 class CouponTests(APITestCase):
@@ -26,6 +30,13 @@ class CouponTests(APITestCase):
         )
         cls.coupon.applicable_product_types.add(cls.package_type)
         cls.coupon.save()
+        cls.package = Package.objects.create(
+            name="extreme_package",
+            details="100 reservations package",
+            price=400,
+            reservations=100,
+            available=True,
+        )
 
     def test_create(self):
         """
@@ -43,3 +54,71 @@ class CouponTests(APITestCase):
         )
 
         self.assertEqual(str(coupon), "12345678")
+
+    def test_applicability(self):
+        """
+        Ensure that the applicability of coupons follows their applicable
+        products and product types, from both sides of the relations.
+        """
+        coupon = Coupon.objects.create(
+            value=13,
+            code="12345678",
+            start_time="2019-01-06T15:11:05-05:00",
+            end_time="2020-01-06T15:11:06-05:00",
+            max_use=100,
+            max_use_per_user=2,
+            owner=self.user,
+        )
+
+        coupon.applicable_packages.add(self.package)
+
+        self.assertEqual(
+            list(coupon.applicabilities.values_list(
+                'content_type', 'object_id'
+            )),
+            [(self.package_type.id, self.package.id)],
+        )
+        self.assertEqual(
+            set(get_applicable_coupons(self.package)),
+            {self.coupon, coupon},
+        )
+
+        self.package.applicable_coupons.clear()
+
+        self.assertFalse(coupon.applicabilities.exists())
+        self.assertEqual(
+            list(get_applicable_coupons(self.package)),
+            [self.coupon],
+        )
+
+        self.coupon.applicable_product_types.remove(self.package_type)
+
+        self.assertFalse(CouponApplicability.objects.exists())
+
+    def test_reconcile_coupon_uses(self):
+        """
+        Ensure that total uses out of sync with the uses by users are
+        reported and fixed.
+        """
+        CouponUser.objects.create(
+            user=self.user,
+            coupon=self.coupon,
+            uses=2,
+        )
+
+        out = StringIO()
+        call_command('reconcile_coupon_uses', stdout=out)
+
+        self.assertIn("ASD1234E: 0 total use(s), 2 use(s)", out.getvalue())
+        self.assertIn("1 coupon(s) out of sync", out.getvalue())
+
+        out = StringIO()
+        call_command('reconcile_coupon_uses', fix=True, stdout=out)
+        self.coupon.refresh_from_db()
+
+        self.assertEqual(self.coupon.uses_total, 2)
+
+        out = StringIO()
+        call_command('reconcile_coupon_uses', stdout=out)
+
+        self.assertIn("All coupons are in sync", out.getvalue())
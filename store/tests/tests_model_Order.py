@@ -1,8 +1,10 @@
 from datetime import timedelta
+from io import StringIO
 import decimal
 
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
 from django.utils import timezone
 
 from rest_framework.test import APITestCase
@@ -11,7 +13,7 @@ from blitz_api.factories import UserFactory
 
 from workplace.models import TimeSlot, Period
 
-from ..models import Order, OrderLine, Package
+from ..models import Order, OrderLine, Package, Refund
 
 TAX = settings.LOCAL_SETTINGS['SELLING_TAX']
 
@@ -77,10 +79,78 @@ class OrderTests(APITestCase):
 
         self.assertEqual(str(order), '1')
 
-    # def test_properties(self):
-    #     """
-    #     Ensure that the property methods returns a valid value.
-    #     """
-    #     total_cost = decimal.Decimal(str(999 * 400 + 999 * 400 * TAX), 2)
-    #     self.assertEqual(self.order.total_ticket, 2 * 3)
-    #     self.assertEqual(self.order.total_cost, total_cost)
+    def test_backfill_order_totals(self):
+        """
+        Ensure that the totals of existing orders are computed from their
+        order lines and refunds.
+        """
+        order = Order.objects.create(
+            user=self.user,
+            transaction_date=timezone.now(),
+            authorization_id=1,
+            settlement_id=1,
+        )
+        orderline = OrderLine.objects.create(
+            order=order,
+            quantity=2,
+            content_type=self.package_type,
+            object_id=self.package.id,
+            cost=790,
+            coupon_real_value=10,
+        )
+        OrderLine.objects.create(
+            order=order,
+            quantity=2,
+            content_type=self.timeslot_type,
+            object_id=1,
+        )
+        Refund.objects.create(
+            orderline=orderline,
+            amount=100,
+            refund_date=timezone.now(),
+        )
+        Order.objects.filter(pk=order.pk).update(refunded=0)
+
+        out = StringIO()
+        call_command('backfill_order_totals', batch_size=1, stdout=out)
+
+        order.refresh_from_db()
+        subtotal = decimal.Decimal(2 * 790)
+
+        self.assertIn("2 order(s) updated", out.getvalue())
+        self.assertEqual(order.total_cost, subtotal)
+        self.assertEqual(order.discount, 10)
+        self.assertEqual(
+            order.tax,
+            (subtotal * decimal.Decimal(repr(TAX))).quantize(
+                decimal.Decimal('0.01')
+            ),
+        )
+        self.assertEqual(order.total, subtotal + order.tax)
+        self.assertEqual(order.total_ticket, 2 * 3)
+        self.assertEqual(order.refunded, 100)
+
+    def test_refunded(self):
+        """
+        Ensure that the refunded amount of an order follows its refunds.
+        """
+        orderline = self.order.order_lines.first()
+        refund = Refund.objects.create(
+            orderline=orderline,
+            amount=50,
+            refund_date=timezone.now(),
+        )
+        Refund.objects.create(
+            orderline=orderline,
+            amount=25,
+            refund_date=timezone.now(),
+        )
+
+        self.order.refresh_from_db()
+
+        self.assertEqual(self.order.refunded, 75)
+
+        refund.delete()
+        self.order.refresh_from_db()
+
+        self.assertEqual(self.order.refunded, 25)
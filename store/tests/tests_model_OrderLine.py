@@ -54,3 +54,55 @@ class OrderTests(APITestCase):
         )
 
         self.assertEqual(str(order_line), 'extreme_package, qt:999')
+
+    def test_update_order_totals(self):
+        """
+        Ensure that the totals of the order follow its order lines.
+        """
+        order_line = OrderLine.objects.create(
+            order=self.order,
+            quantity=1,
+            content_type=self.package_type,
+            object_id=self.package.id,
+            cost=400,
+        )
+
+        self.order.refresh_from_db()
+
+        self.assertEqual(self.order.subtotal, 400)
+
+        order_line.cost = 200
+        order_line.save()
+
+        self.order.refresh_from_db()
+
+        self.assertEqual(self.order.subtotal, 200)
+        self.assertEqual(self.order.total_cost, 200)
+
+        order_line.delete()
+
+        self.order.refresh_from_db()
+
+        self.assertEqual(self.order.subtotal, 0)
+        self.assertEqual(self.order.total, 0)
+
+    def test_update_order_totals_skipped(self):
+        """
+        Ensure that order lines flagged by the checkout don't update the
+        totals of their order.
+        """
+        order_line = OrderLine(
+            order=self.order,
+            quantity=1,
+            content_type=self.package_type,
+            object_id=self.package.id,
+            cost=400,
+        )
+        order_line.skip_order_totals = True
+
+        with self.assertNumQueries(2):
+            order_line.save()
+
+        self.order.refresh_from_db()
+
+        self.assertEqual(self.order.subtotal, 0)
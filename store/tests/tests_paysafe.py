@@ -0,0 +1,288 @@
+import logging
+import time
+
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework import serializers
+
+from .paysafe_server import FakePaysafeServer
+
+from ..checks import check_paysafe_breaker_cache
+from ..exceptions import PaymentAPIError
+from ..paysafe import CircuitBreaker, PaysafeClient
+
+PAYSAFE = {
+    'ACCOUNT_NUMBER': "0123456789",
+    'USER': "user",
+    'PASSWORD': "password",
+    'BASE_URL': "http://example.com/",
+    'VAULT_URL': "customervault/v1/",
+    'CARD_URL': "cardpayments/v1/",
+    'CONNECT_TIMEOUT': 1,
+    'READ_TIMEOUT': 0.2,
+    'TOTAL_TIMEOUT': 5,
+    'RETRIES': 2,
+    'RETRY_BACKOFF': 0,
+    'POOL_SIZE': 2,
+}
+
+
+@override_settings(PAYSAFE=PAYSAFE)
+class PaysafeClientTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = PaysafeClient()
+        self.server = FakePaysafeServer().__enter__()
+        self.addCleanup(self.server.__exit__)
+
+    def test_keep_alive(self):
+        """
+        Ensure that requests reuse the same connection.
+        """
+        for index in range(3):
+            response = self.client.get(self.server.url + 'profiles/1')
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(
+            len({port for method, path, port in self.server.requests}),
+            1,
+        )
+
+    def test_get_retry(self):
+        """
+        Ensure that a GET timing out or answered by a server error is sent
+        again.
+        """
+        self.server.add_response(delay=0.5)
+        self.server.add_response(status=503)
+        self.server.add_response(body={'id': "1"})
+
+        response = self.client.get(self.server.url + 'cards/1')
+
+        self.assertEqual(response.json(), {'id': "1"})
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_get_timeout(self):
+        """
+        Ensure that a GET timing out after its retries raises
+        PaymentAPIError.
+        """
+        for index in range(3):
+            self.server.add_response(delay=0.5)
+
+        with self.assertRaises(PaymentAPIError):
+            self.client.get(self.server.url + 'cards/1')
+
+        self.assertEqual(len(self.server.requests), 3)
+
+    @override_settings(PAYSAFE=dict(PAYSAFE, TOTAL_TIMEOUT=0.3))
+    def test_total_timeout(self):
+        """
+        Ensure that retries end within the time budget of the call.
+        """
+        for index in range(3):
+            self.server.add_response(delay=0.5)
+
+        start = time.monotonic()
+
+        with self.assertRaises(PaymentAPIError):
+            self.client.get(self.server.url + 'cards/1')
+
+        self.assertLess(time.monotonic() - start, 0.45)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_post_not_retried(self):
+        """
+        Ensure that a POST is sent only once, a charge could be made twice.
+        """
+        self.server.add_response(status=503)
+        self.server.add_response(delay=0.5)
+
+        response = self.client.post(self.server.url + 'auths/', json={})
+
+        self.assertEqual(response.status_code, 503)
+
+        with self.assertRaises(PaymentAPIError):
+            self.client.post(self.server.url + 'auths/', json={})
+
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_latency_logged(self):
+        """
+        Ensure that the latency of each request is logged.
+        """
+        logging.disable(logging.NOTSET)
+        self.addCleanup(logging.disable, logging.CRITICAL)
+
+        with self.assertLogs('store.paysafe', level='INFO') as logs:
+            self.client.delete(self.server.url + 'profiles/1/cards/2')
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(logs.records[0].paysafe_method, 'DELETE')
+        self.assertEqual(logs.records[0].paysafe_path, '/profiles/1/cards/2')
+        self.assertEqual(logs.records[0].paysafe_status, 200)
+
+
+@override_settings(PAYSAFE=dict(
+    PAYSAFE,
+    RETRIES=0,
+    BREAKER_ERROR_RATE=0.5,
+    BREAKER_MIN_REQUESTS=4,
+    BREAKER_SLOW_CALL=0.1,
+    BREAKER_OPEN_TIMEOUT=0.2,
+))
+class CircuitBreakerTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.breaker = CircuitBreaker()
+        self.client = PaysafeClient(breaker=self.breaker)
+        self.server = FakePaysafeServer().__enter__()
+        self.addCleanup(self.server.__exit__)
+
+    def trip(self):
+        for index in range(4):
+            self.server.add_response(status=503)
+            self.client.post(self.server.url + 'auths/', json={})
+
+    def test_open(self):
+        """
+        Ensure that requests fail without reaching the API once enough of
+        them failed.
+        """
+        self.server.add_response(status=402)
+        self.client.post(self.server.url + 'auths/', json={})
+        self.server.add_response(delay=0.15)
+        self.client.post(self.server.url + 'auths/', json={})
+        self.server.add_response(status=503)
+        self.client.post(self.server.url + 'auths/', json={})
+
+        self.assertEqual(self.breaker.get_state(), CircuitBreaker.STATE_CLOSED)
+
+        self.server.add_response(status=503)
+        self.client.post(self.server.url + 'auths/', json={})
+
+        self.assertEqual(self.breaker.get_state(), CircuitBreaker.STATE_OPEN)
+
+        with self.assertRaises(PaymentAPIError) as context:
+            self.client.get(self.server.url + 'cards/1')
+
+        self.assertEqual(
+            str(context.exception),
+            "Payment temporarily unavailable.",
+        )
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(self.breaker.get_stats()['trips'], 1)
+
+    def test_closed_by_probe(self):
+        """
+        Ensure that a single request probes the API once the circuit has been
+        open for a while, and closes the circuit if it succeeds.
+        """
+        logging.disable(logging.NOTSET)
+        self.addCleanup(logging.disable, logging.CRITICAL)
+
+        with self.assertLogs('store.paysafe', level='WARNING') as logs:
+            self.trip()
+            time.sleep(0.25)
+
+            self.assertEqual(
+                self.breaker.get_state(),
+                CircuitBreaker.STATE_HALF_OPEN,
+            )
+            self.assertTrue(self.breaker.before_request())
+            with self.assertRaises(PaymentAPIError):
+                self.client.get(self.server.url + 'cards/1')
+            self.breaker.record(True, probe=True)
+
+            self.assertEqual(
+                self.breaker.get_stats(),
+                {'state': 'closed', 'trips': 1, 'requests': 0, 'failures': 0},
+            )
+
+            response = self.client.get(self.server.url + 'cards/1')
+
+        self.assertEqual(
+            [record.paysafe_breaker_state for record in logs.records],
+            ['open', 'closed'],
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 5)
+
+    def test_opened_by_probe(self):
+        """
+        Ensure that the circuit opens again if the probe fails.
+        """
+        self.trip()
+        time.sleep(0.25)
+        self.server.add_response(delay=0.5)
+
+        with self.assertRaises(PaymentAPIError):
+            self.client.get(self.server.url + 'cards/1')
+
+        self.assertEqual(self.breaker.get_state(), CircuitBreaker.STATE_OPEN)
+        self.assertEqual(self.breaker.get_stats()['trips'], 2)
+        self.assertEqual(len(self.server.requests), 5)
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'cache_table',
+        },
+    })
+    def test_check_cache(self):
+        """
+        Ensure that a local memory breaker cache raises a warning.
+        """
+        warnings = check_paysafe_breaker_cache(None)
+
+        self.assertEqual([warning.id for warning in warnings], ['store.W001'])
+
+        with self.settings(PAYSAFE=dict(PAYSAFE, BREAKER_CACHE='shared')):
+            self.assertEqual(check_paysafe_breaker_cache(None), [])
+
+
+@override_settings(PAYSAFE=dict(
+    PAYSAFE,
+    BREAKER_CACHE='shared',
+    BREAKER_ERROR_RATE=0.5,
+    BREAKER_MIN_REQUESTS=2,
+))
+class CircuitBreakerSharedCacheTests(TestCase):
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.addCleanup(caches['shared'].clear)
+        self.breaker = CircuitBreaker()
+
+    def test_open_rolled_back(self):
+        """
+        Ensure that the circuit stays open when the transaction of the failed
+        request is rolled back.
+        """
+        with self.assertRaises(serializers.ValidationError):
+            with transaction.atomic():
+                self.breaker.record(False)
+                self.breaker.record(False)
+                raise serializers.ValidationError("Payment failed.")
+
+        self.assertEqual(
+            self.breaker.get_stats(),
+            {'state': 'open', 'trips': 1, 'requests': 0, 'failures': 0},
+        )
+
+    def test_incr(self):
+        """
+        Ensure that the shared cache increments values in place.
+        """
+        caches['shared'].add('counter', 0)
+
+        self.assertEqual(caches['shared'].incr('counter'), 1)
+        self.assertEqual(caches['shared'].incr('counter', 2), 3)
+        self.assertEqual(caches['shared'].get('counter'), 3)
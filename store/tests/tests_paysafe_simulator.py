@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from blitz_api.factories import UserFactory
+
+from ..exceptions import PaymentAPIError
+from ..paysafe_simulator import PaysafeSimulator, parse_error, parse_latency
+from ..services import (PAYSAFE_EXCEPTION, charge_payment,
+                        create_external_card,
+                        create_external_payment_profile, get_external_cards,
+                        refund_amount)
+
+PAYSAFE = {
+    'ACCOUNT_NUMBER': "0123456789",
+    'USER': "user",
+    'PASSWORD': "password",
+    'BASE_URL': "http://example.com/",
+    'VAULT_URL': "customervault/v1/",
+    'CARD_URL': "cardpayments/v1/",
+    'RETRY_BACKOFF': 0,
+}
+
+
+@override_settings(PAYSAFE=PAYSAFE)
+class PaysafeSimulatorTests(SimpleTestCase):
+
+    def run_simulator(self, **kwargs):
+        simulator = PaysafeSimulator(**kwargs).__enter__()
+        self.addCleanup(simulator.__exit__)
+
+        paysafe_settings = override_settings(
+            PAYSAFE=dict(settings.PAYSAFE, BASE_URL=simulator.url),
+        )
+        paysafe_settings.enable()
+        self.addCleanup(paysafe_settings.disable)
+
+        return simulator
+
+    def test_payment(self):
+        """
+        Ensure that a card can be saved, charged and refunded.
+        """
+        simulator = self.run_simulator()
+
+        profile = create_external_payment_profile(UserFactory.build()).json()
+        create_external_card(profile['id'], "SingleUseToken1")
+        cards = get_external_cards(profile['id'])
+
+        self.assertEqual(len(cards), 1)
+
+        payment = charge_payment(1000, cards[0]['payment_token'], "1").json()
+        settlement_id = payment['settlements'][0]['id']
+        refund_amount(settlement_id, 600)
+
+        with self.assertRaises(PaymentAPIError) as context:
+            refund_amount(settlement_id, 600)
+
+        self.assertEqual(
+            str(context.exception),
+            str(PAYSAFE_EXCEPTION['3406']),
+        )
+        self.assertEqual(simulator.get_stats()['POST refunds']['requests'], 2)
+        self.assertEqual(simulator.get_stats()['POST refunds']['errors'], 1)
+        self.assertEqual(simulator.get_stats()['POST auths']['requests'], 1)
+
+    def test_card_already_exists(self):
+        """
+        Ensure that a card saved again replaces the existing card.
+        """
+        self.run_simulator()
+
+        profile = create_external_payment_profile(UserFactory.build()).json()
+        create_external_card(profile['id'], "SingleUseToken1")
+        create_external_card(profile['id'], "SingleUseToken1")
+
+        self.assertEqual(len(get_external_cards(profile['id'])), 1)
+
+    def test_error_injection(self):
+        """
+        Ensure that errors are injected in their endpoint only.
+        """
+        simulator = self.run_simulator(errors=[parse_error("auths:3009:1")])
+
+        profile = create_external_payment_profile(UserFactory.build()).json()
+
+        with self.assertRaises(PaymentAPIError) as context:
+            charge_payment(1000, "PaymentToken1", "1")
+
+        self.assertEqual(
+            str(context.exception),
+            str(PAYSAFE_EXCEPTION['3009']),
+        )
+        self.assertEqual(
+            simulator.get_stats()['POST auths'],
+            {'requests': 1, 'errors': 1, 'mean_latency': 0},
+        )
+        self.assertEqual(profile['status'], 'ACTIVE')
+
+    def test_parse_latency(self):
+        """
+        Ensure that latencies are drawn from the given distribution.
+        """
+        self.assertEqual(parse_latency("fixed:0.1")(), 0.1)
+        self.assertTrue(0.05 <= parse_latency("uniform:0.05,0.3")() <= 0.3)
+        self.assertGreaterEqual(parse_latency("normal:0,1")(), 0)
+
+        with self.assertRaises(ValueError):
+            parse_latency("pareto:1")
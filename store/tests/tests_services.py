@@ -6,7 +6,8 @@ from django.conf import settings
 
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
-from django.test.utils import override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.utils import timezone
 
 from rest_framework import status
@@ -23,9 +24,13 @@ from .paysafe_sample_responses import (
 )
 
 from ..exceptions import PaymentAPIError
-from ..models import PaymentProfile, Order, Coupon, Package, OrderLine
+from ..models import (PaymentProfile, Order, Coupon, CouponApplicability,
+                      CouponUser, Membership, MembershipCoupon, Package,
+                      OrderLine)
 from ..services import (
     charge_payment,
+    claim_coupon_use,
+    create_membership_coupons,
     get_external_payment_profile,
     create_external_payment_profile,
     update_external_card,
@@ -395,7 +400,11 @@ class ServicesTests(APITestCase):
             cost=self.package_less_exp_product.price,
         )
 
-        coupon_info = validate_coupon_for_order(self.coupon, self.order)
+        coupon_info = validate_coupon_for_order(
+            self.coupon,
+            self.user,
+            [order_line_les_exp_product, order_line_most_exp_product],
+        )
 
         error = coupon_info.get('error')
 
@@ -405,3 +414,91 @@ class ServicesTests(APITestCase):
         self.assertIsNotNone(coupon_info_order_line)
         self.assertEqual(coupon_info_order_line.id,
                          order_line_most_exp_product.id)
+
+    def test_claim_coupon_use(self):
+        """
+        Ensure that uses are claimed until the coupon or the user has no
+        uses left.
+        """
+        self.coupon.max_use = 3
+        self.coupon.save()
+        user = UserFactory()
+
+        self.assertTrue(claim_coupon_use(self.coupon, self.user))
+        self.assertTrue(claim_coupon_use(self.coupon, self.user))
+        self.assertFalse(claim_coupon_use(self.coupon, self.user))
+        self.assertTrue(claim_coupon_use(self.coupon, user))
+        self.assertFalse(claim_coupon_use(self.coupon, UserFactory()))
+
+        self.coupon.refresh_from_db()
+
+        self.assertEqual(self.coupon.uses_total, 3)
+        self.assertEqual(
+            dict(CouponUser.objects.values_list('user', 'uses')),
+            {self.user.id: 2, user.id: 1},
+        )
+
+        history = self.coupon.history.order_by('history_id')
+
+        self.assertEqual(
+            list(history.values_list('uses_total', 'history_user'))[-3:],
+            [(1, self.user.id), (2, self.user.id), (3, user.id)],
+        )
+
+    def test_create_membership_coupons(self):
+        """
+        Ensure that the coupons of a membership are created with the
+        applicable products of their MembershipCoupon, with the same number
+        of queries whatever the number of MembershipCoupon.
+        """
+        membership = Membership.objects.create(
+            name="basic_membership",
+            details="1-Year student membership",
+            price=50,
+            available=True,
+            duration=timedelta(days=365),
+        )
+
+        def add_membership_coupon(value):
+            membership_coupon = MembershipCoupon.objects.create(
+                value=value,
+                max_use=4,
+                max_use_per_user=4,
+                membership=membership,
+            )
+            membership_coupon.applicable_packages.set([self.package])
+            membership_coupon.applicable_product_types.set([
+                ContentType.objects.get_for_model(Membership),
+            ])
+
+        add_membership_coupon(10)
+        # Content types are cached by the first call
+        create_membership_coupons(membership, UserFactory())
+        user = UserFactory()
+        with CaptureQueriesContext(connection) as single_queries:
+            create_membership_coupons(membership, user)
+
+        add_membership_coupon(20)
+        add_membership_coupon(30)
+        with CaptureQueriesContext(connection) as queries:
+            coupons = create_membership_coupons(membership, self.user)
+
+        self.assertEqual(len(queries), len(single_queries))
+        self.assertEqual(
+            sorted(coupon.value for coupon in coupons),
+            [10, 20, 30],
+        )
+        self.assertEqual(len({coupon.code for coupon in coupons}), 3)
+        self.assertEqual(
+            self.user.coupons.filter(code__in=[c.code for c in coupons])
+            .count(),
+            3,
+        )
+        self.assertEqual(
+            list(coupons[2].applicable_packages.all()),
+            [self.package],
+        )
+        self.assertEqual(
+            CouponApplicability.objects.filter(coupon__in=coupons).count(),
+            6,
+        )
@@ -21,7 +21,8 @@ from blitz_api.services import remove_translation_fields
 from workplace.models import TimeSlot, Period, Workplace
 from retirement.models import Retirement
 
-from ..models import Package, Order, OrderLine, Membership, Coupon
+from ..models import (Package, Order, OrderLine, Membership, Coupon,
+                      CouponApplicability)
 
 User = get_user_model()
 
@@ -160,6 +161,7 @@ class CouponTests(APITestCase):
             "max_use_per_user": 2,
             "details": "Any package for clients",
             "owner": "http://testserver/users/" + str(self.user.id),
+            "uses_total": 0,
             "applicable_retirements": [],
             "applicable_timeslots": [],
             "applicable_packages": [],
@@ -222,6 +224,7 @@ class CouponTests(APITestCase):
             "max_use_per_user": 2,
             "details": "Any package for clients",
             "owner": "http://testserver/users/" + str(self.user.id),
+            "uses_total": 0,
             "applicable_retirements": [],
             "applicable_timeslots": [],
             "applicable_packages": [],
@@ -282,6 +285,7 @@ class CouponTests(APITestCase):
             "max_use_per_user": 2,
             "details": "Any package for clients",
             "owner": "http://testserver/users/" + str(self.user.id),
+            "uses_total": 0,
             "applicable_retirements": [],
             "applicable_timeslots": [],
             "applicable_packages": [],
@@ -613,7 +617,8 @@ class CouponTests(APITestCase):
             "owner": "http://testserver/users/" + str(self.user.id),
         }
         with mock.patch(
-                'store.serializers.random.choices', return_value="ABCDEFGH"):
+                'store.models.Coupon.get_random_code',
+                return_value="ABCDEFGH"):
             response = self.client.post(
                 reverse('coupon-list'),
                 data,
@@ -637,6 +642,114 @@ class CouponTests(APITestCase):
             content
         )
 
+    def test_batch(self):
+        """
+        Ensure that an admin can create a batch of coupons with unique codes.
+        """
+        self.client.force_authenticate(user=self.admin)
+
+        data = {
+            "count": 1200,
+            "applicable_product_types": [
+                "package"
+            ],
+            "applicable_retirements": [
+                reverse(
+                    'retirement:retirement-detail',
+                    args=[self.retirement.id],
+                ),
+            ],
+            "value": "13.00",
+            "start_time": "2019-01-06T15:11:05-05:00",
+            "end_time": "2020-01-06T15:11:06-05:00",
+            "max_use": 1,
+            "max_use_per_user": 1,
+            "details": "Spring campaign",
+            "owner": "http://testserver/users/" + str(self.user.id),
+        }
+
+        response = self.client.post(
+            reverse('coupon-batch'),
+            data,
+            format='json',
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_201_CREATED,
+            response.content,
+        )
+
+        content = json.loads(response.content)
+        coupons = Coupon.objects.filter(details="Spring campaign")
+
+        self.assertEqual(content['count'], 1200)
+        self.assertEqual(len(set(content['codes'])), 1200)
+        self.assertEqual(
+            set(coupons.values_list('code', flat=True)),
+            set(content['codes']),
+        )
+        self.assertEqual(
+            CouponApplicability.objects.filter(coupon__in=coupons).count(),
+            2400,
+        )
+        self.assertEqual(
+            list(coupons[0].applicable_retirements.all()),
+            [self.retirement],
+        )
+
+    def test_batch_code_conflict(self):
+        """
+        Ensure that a batch is retried with new codes when its codes are
+        taken while it is created.
+        """
+        self.client.force_authenticate(user=self.admin)
+
+        data = {
+            "count": 2,
+            "value": "13.00",
+            "start_time": "2019-01-06T15:11:05-05:00",
+            "end_time": "2020-01-06T15:11:06-05:00",
+            "max_use": 1,
+            "max_use_per_user": 1,
+            "owner": "http://testserver/users/" + str(self.user.id),
+        }
+
+        codes = [{"ABCDEFGH", "NEW00001"}, {"NEW00002", "NEW00003"}]
+        with mock.patch(
+                'store.services.generate_coupon_codes',
+                side_effect=codes):
+            response = self.client.post(
+                reverse('coupon-batch'),
+                data,
+                format='json',
+            )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_201_CREATED,
+            response.content,
+        )
+        self.assertEqual(
+            sorted(json.loads(response.content)['codes']),
+            ["NEW00002", "NEW00003"],
+        )
+        self.assertFalse(Coupon.objects.filter(code="NEW00001").exists())
+
+    def test_batch_without_permission(self):
+        """
+        Ensure that a user can't create a batch of coupons.
+        """
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.post(
+            reverse('coupon-batch'),
+            {"count": 2},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
     def test_create_without_permission(self):
         """
         Ensure we can't create a coupon if user has no permission.
@@ -898,6 +1011,7 @@ class CouponTests(APITestCase):
             "max_use_per_user": 20,
             "details": "Any package for clients (updated max_use)",
             "owner": "http://testserver/users/" + str(self.user.id),
+            "uses_total": 0,
             "applicable_retirements": [],
             "applicable_timeslots": [],
             "applicable_packages": [],
@@ -956,6 +1070,7 @@ class CouponTests(APITestCase):
             "max_use_per_user": 20,
             "details": "Any package for clients (updated max_use)",
             "owner": "http://testserver/users/" + str(self.user.id),
+            "uses_total": 0,
             "applicable_retirements": [],
             "applicable_timeslots": [],
             "applicable_packages": [],
@@ -1064,6 +1179,7 @@ class CouponTests(APITestCase):
                 "max_use_per_user": 2,
                 "details": "Any package for clients",
                 "owner": "http://testserver/users/" + str(self.user.id),
+                "uses_total": 0,
                 "applicable_memberships": [{
                     'academic_levels': [],
                     'available': True,
@@ -1209,6 +1325,7 @@ class CouponTests(APITestCase):
                 "max_use_per_user": 2,
                 "details": "Any package for clients",
                 "owner": "http://testserver/users/" + str(self.user.id),
+                "uses_total": 0,
                 "applicable_retirements": [],
                 "applicable_timeslots": [],
                 "applicable_packages": [],
@@ -1227,6 +1344,7 @@ class CouponTests(APITestCase):
                 "max_use_per_user": 2,
                 "details": "Any package for clients",
                 "owner": "http://testserver/users/" + str(self.admin.id),
+                "uses_total": 0,
                 "applicable_retirements": [],
                 "applicable_timeslots": [],
                 "applicable_packages": [],
@@ -1280,6 +1398,7 @@ class CouponTests(APITestCase):
             "max_use_per_user": 2,
             "details": "Any package for clients",
             "owner": "http://testserver/users/" + str(self.user.id),
+            "uses_total": 0,
             "applicable_product_types": ['package'],
             "applicable_memberships": [{
                 'academic_levels': [],
@@ -1426,6 +1545,7 @@ class CouponTests(APITestCase):
             "max_use_per_user": 2,
             "details": "Any package for clients",
             "owner": "http://testserver/users/" + str(self.user.id),
+            "uses_total": 0,
             "applicable_retirements": [],
             "applicable_timeslots": [],
             "applicable_packages": [],
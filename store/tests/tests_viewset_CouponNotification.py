@@ -0,0 +1,140 @@
+import json
+
+from django.core import mail
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from blitz_api.email_backends import LocalEmailBackend
+from blitz_api.factories import UserFactory, AdminFactory
+from blitz_api.models import Outbox
+from blitz_api.services import send_outbox
+
+from ..models import Coupon, CouponNotification
+from ..services import COUPON_NOTIFICATION_SYNC_LIMIT
+
+
+# The production backend, notifications are written in the outbox anyway
+@override_settings(
+    EMAIL_BACKEND='anymail.backends.sendinblue.EmailBackend',
+    ANYMAIL={'SENDINBLUE_API_KEY': "key"},
+    OUTBOX={
+        'EMAIL_BACKEND': 'blitz_api.email_backends.LocalEmailBackend',
+        'BATCH_SIZE': 100,
+        'MAX_ATTEMPTS': 1,
+        'LEASE': 300,
+        'RETRY_DELAY': 60,
+        'TIME_MARGIN': 0,
+    },
+)
+class CouponNotificationTests(APITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(CouponNotificationTests, cls).setUpClass()
+        cls.client = APIClient()
+        cls.user = UserFactory()
+        cls.user2 = UserFactory()
+        cls.admin = AdminFactory()
+        cls.coupon = Coupon.objects.create(
+            value=13,
+            code="ABCDEFGH",
+            start_time="2019-01-06T15:11:05-05:00",
+            end_time="2020-01-06T15:11:06-05:00",
+            max_use=100,
+            max_use_per_user=2,
+            details="Any package for clients",
+            owner=cls.user,
+        )
+        cls.email_list = [
+            "user{0}@example.com".format(index)
+            for index in range(COUPON_NOTIFICATION_SYNC_LIMIT + 10)
+        ]
+
+    def tearDown(self):
+        LocalEmailBackend.failing_recipients = set()
+
+    def notify(self):
+        return self.client.post(
+            reverse('coupon-notify', kwargs={'pk': self.coupon.id}),
+            {'email_list': self.email_list},
+            format='json',
+        )
+
+    def test_notify(self):
+        """
+        Ensure that a large list of emails is accepted with a coupon
+        notification reporting the delivery of each email.
+        """
+        self.client.force_authenticate(user=self.user)
+
+        response = self.notify()
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_202_ACCEPTED,
+            response.content,
+        )
+
+        notification = CouponNotification.objects.get()
+        content = json.loads(response.content)
+
+        self.assertEqual(
+            response['Location'],
+            'http://testserver/coupon_notifications/' + str(notification.id),
+        )
+        self.assertEqual(content['total'], len(self.email_list))
+        self.assertEqual(content['pending'], len(self.email_list))
+        self.assertEqual(content['sent'], 0)
+        self.assertEqual(
+            Outbox.objects.filter(reference=notification.reference).count(),
+            len(self.email_list),
+        )
+
+    def test_notify_status(self):
+        """
+        Ensure that the coupon notification reports sent and failed emails.
+        """
+        self.client.force_authenticate(user=self.user)
+        LocalEmailBackend.failing_recipients = {"user7@example.com"}
+
+        url = self.notify()['Location']
+
+        send_outbox()
+
+        response = self.client.get(url)
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK,
+            response.content,
+        )
+
+        content = json.loads(response.content)
+
+        self.assertEqual(content['pending'], 0)
+        self.assertEqual(content['sent'], len(self.email_list) - 1)
+        self.assertEqual(content['failed'], 1)
+        self.assertEqual(content['failed_emails'], ["user7@example.com"])
+        self.assertEqual(len(mail.outbox), len(self.email_list) - 1)
+
+    def test_retrieve_not_owner(self):
+        """
+        Ensure that users only see their own coupon notifications.
+        """
+        self.client.force_authenticate(user=self.user)
+
+        url = self.notify()['Location']
+
+        self.client.force_authenticate(user=self.user2)
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(user=self.admin)
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -9,7 +9,8 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
 from django.core import mail
-from django.test.utils import override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.utils import timezone
 from django.urls import reverse
 
@@ -20,7 +21,7 @@ from unittest import mock
 from blitz_api.factories import UserFactory, AdminFactory
 from blitz_api.models import AcademicLevel
 
-from workplace.models import TimeSlot, Period, Workplace
+from workplace.models import TimeSlot, TimeSlotRule, Period, Workplace
 from retirement.models import Retirement, WaitQueueNotification, WaitQueue
 
 from .paysafe_sample_responses import (
@@ -209,6 +210,7 @@ class OrderTests(APITestCase):
             value=10,
             max_use_per_user=0,
             max_use=0,
+            uses_total=5,
             owner=self.admin,
         )
         self.coupon.applicable_product_types.set([self.package_type])
@@ -328,6 +330,12 @@ class OrderTests(APITestCase):
             'authorization_id': '1',
             'settlement_id': '1',
             'reference_number': '751',
+            'subtotal': '389.00',
+            'discount': '10.00',
+            'tax': '58.25',
+            'total': '447.25',
+            'tickets': '1.00',
+            'refunded': '0.00',
         }
 
         self.assertCountEqual(response_data['order_lines'],
@@ -364,6 +372,63 @@ class OrderTests(APITestCase):
         # 1 email for the retirement informations
         self.assertEqual(len(mail.outbox), 2)
 
+    @responses.activate
+    def test_create_queries(self):
+        """
+        Ensure that the number of queries of an order doesn't grow with its
+        number of order lines.
+        """
+        self.client.force_authenticate(user=self.admin)
+
+        responses.add(
+            responses.POST,
+            "http://example.com/cardpayments/v1/accounts/0123456789/auths/",
+            json=SAMPLE_PAYMENT_RESPONSE,
+            status=200
+        )
+
+        packages = [
+            Package.objects.create(
+                name="package_{0}".format(index),
+                details="10 reservations package",
+                available=True,
+                price=40,
+                reservations=10,
+            )
+            for index in range(5)
+        ]
+
+        queries = list()
+        for order_packages in (packages[:1], packages):
+            data = {
+                'payment_token': "CZgD1NlBzPuSefg",
+                'order_lines': [{
+                    'content_type': 'package',
+                    'object_id': package.id,
+                    'quantity': 1,
+                } for package in order_packages],
+            }
+
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(
+                    reverse('order-list'),
+                    data,
+                    format='json',
+                )
+
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_201_CREATED,
+                response.content,
+            )
+            queries.append(len(context))
+
+        self.assertEqual(queries[0], queries[1])
+
+        self.admin.refresh_from_db()
+
+        self.assertEqual(self.admin.tickets, 1 + 6 * 10)
+
     @responses.activate
     def test_create_reservation_only(self):
         """
@@ -417,6 +482,12 @@ class OrderTests(APITestCase):
             'authorization_id': '0',
             'settlement_id': '0',
             'reference_number': '0',
+            'subtotal': '0.00',
+            'discount': '0.00',
+            'tax': '0.00',
+            'total': '0.00',
+            'tickets': '1.00',
+            'refunded': '0.00',
         }
 
         self.assertEqual(response_data, content)
@@ -431,6 +502,98 @@ class OrderTests(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_create_reservation_rule_occurrence(self):
+        """
+        Ensure that an occurrence of a time slot rule is saved as a timeslot
+        when it is booked.
+        """
+        self.client.force_authenticate(user=self.admin)
+
+        today = timezone.now().date()
+        rule = TimeSlotRule.objects.create(
+            period=self.period,
+            price=1,
+            start_date=today + timedelta(days=1),
+            end_date=today + timedelta(days=7),
+            start_time=datetime.min.time().replace(hour=8),
+            end_time=datetime.min.time().replace(hour=12),
+            weekdays="0,1,2,3,4,5,6",
+        )
+        rule_occurrence, end_time = next(rule.get_occurrences())
+
+        data = {
+            'order_lines': [{
+                'content_type': 'timeslotrule',
+                'object_id': rule.id,
+                'rule_occurrence': rule_occurrence.isoformat(),
+                'quantity': 1,
+            }],
+        }
+
+        response = self.client.post(
+            reverse('order-list'),
+            data,
+            format='json',
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_201_CREATED,
+            response.content,
+        )
+
+        time_slot = TimeSlot.objects.get(rule=rule)
+        order_line = OrderLine.objects.get(
+            order_id=json.loads(response.content)['id'],
+        )
+
+        self.assertEqual(time_slot.start_time, rule_occurrence)
+        self.assertEqual(order_line.content_type.model, 'timeslot')
+        self.assertEqual(order_line.object_id, time_slot.id)
+        self.assertTrue(
+            time_slot.reservations.filter(user=self.admin).exists()
+        )
+
+    def test_create_reservation_invalid_rule_occurrence(self):
+        """
+        Ensure that only occurrences of a time slot rule can be booked.
+        """
+        self.client.force_authenticate(user=self.admin)
+
+        today = timezone.now().date()
+        rule = TimeSlotRule.objects.create(
+            period=self.period,
+            price=1,
+            start_date=today + timedelta(days=1),
+            end_date=today + timedelta(days=7),
+            start_time=datetime.min.time().replace(hour=8),
+            end_time=datetime.min.time().replace(hour=12),
+            weekdays="0,1,2,3,4,5,6",
+        )
+        rule_occurrence, end_time = next(rule.get_occurrences())
+
+        data = {
+            'order_lines': [{
+                'content_type': 'timeslotrule',
+                'object_id': rule.id,
+                'rule_occurrence': end_time.isoformat(),
+                'quantity': 1,
+            }],
+        }
+
+        response = self.client.post(
+            reverse('order-list'),
+            data,
+            format='json',
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_400_BAD_REQUEST,
+            response.content,
+        )
+        self.assertFalse(TimeSlot.objects.filter(rule=rule).exists())
+
     @responses.activate
     def test_create_reservation_twice(self):
         """
@@ -490,6 +653,12 @@ class OrderTests(APITestCase):
             'authorization_id': '0',
             'settlement_id': '0',
             'reference_number': '0',
+            'subtotal': '0.00',
+            'discount': '0.00',
+            'tax': '0.00',
+            'total': '0.00',
+            'tickets': '1.00',
+            'refunded': '0.00',
         }
 
         self.assertEqual(response_data, content)
@@ -1108,6 +1277,12 @@ class OrderTests(APITestCase):
             'authorization_id': '1',
             'settlement_id': '1',
             'reference_number': '751',
+            'subtotal': '199.00',
+            'discount': '0.00',
+            'tax': '29.80',
+            'total': '228.80',
+            'tickets': '0.00',
+            'refunded': '0.00',
         }
 
         self.assertEqual(response_data, content)
@@ -1116,6 +1291,16 @@ class OrderTests(APITestCase):
         # 1 email for the retirement informations
         self.assertEqual(len(mail.outbox), 2)
 
+        history = self.retirement_no_seats.history.latest('history_id')
+
+        self.assertEqual(history.reserved_seats, 0)
+        self.assertEqual(history.history_user, self.user)
+        self.assertEqual(
+            self.retirement_no_seats.reservations.get().history.get()
+            .history_user,
+            self.user,
+        )
+
     @responses.activate
     def test_create_retirement_twice(self):
         """
@@ -1177,6 +1362,12 @@ class OrderTests(APITestCase):
             'authorization_id': '1',
             'settlement_id': '1',
             'reference_number': '751',
+            'subtotal': '199.00',
+            'discount': '0.00',
+            'tax': '29.80',
+            'total': '228.80',
+            'tickets': '0.00',
+            'refunded': '0.00',
         }
 
         self.assertEqual(response_data, content)
@@ -1449,6 +1640,12 @@ class OrderTests(APITestCase):
             'authorization_id': '1',
             'settlement_id': '1',
             'reference_number': '751',
+            'subtotal': '160.00',
+            'discount': '0.00',
+            'tax': '23.96',
+            'total': '183.96',
+            'tickets': '1.00',
+            'refunded': '0.00',
         }
 
         self.assertEqual(response_data, content)
@@ -1541,6 +1738,12 @@ class OrderTests(APITestCase):
             'authorization_id': '1',
             'settlement_id': '1',
             'reference_number': '751',
+            'subtotal': '210.00',
+            'discount': '0.00',
+            'tax': '31.45',
+            'total': '241.45',
+            'tickets': '0.00',
+            'refunded': '0.00',
         }
 
         self.assertEqual(response_data, content)
@@ -1824,6 +2027,12 @@ class OrderTests(APITestCase):
             }],
             'settlement_id': '1',
             'reference_number': '751',
+            'subtotal': '210.00',
+            'discount': '0.00',
+            'tax': '31.45',
+            'total': '241.45',
+            'tickets': '0.00',
+            'refunded': '0.00',
             'transaction_date': response_data['transaction_date'],
             'user': 'http://testserver/users/' + str(self.admin.id),
         }
@@ -2036,6 +2245,12 @@ class OrderTests(APITestCase):
             'authorization_id': '1',
             'settlement_id': '1',
             'reference_number': '751',
+            'subtotal': '50.00',
+            'discount': '0.00',
+            'tax': '7.49',
+            'total': '57.49',
+            'tickets': '0.00',
+            'refunded': '0.00',
         }
 
         self.assertEqual(response_data, content)
@@ -2096,6 +2311,12 @@ class OrderTests(APITestCase):
             'authorization_id': '1',
             'settlement_id': '1',
             'reference_number': '751',
+            'subtotal': '392040.00',
+            'discount': '0.00',
+            'tax': '58707.99',
+            'total': '450747.99',
+            'tickets': '0.00',
+            'refunded': '0.00',
             'order_lines': [{
                 'url': f'http://testserver/order_lines/{self.order_line.id}',
                 'id': self.order_line.id,
@@ -2118,6 +2339,61 @@ class OrderTests(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_update_rule_occurrence(self):
+        """
+        Ensure that occurrences of time slot rules can't be booked by updating
+        an order.
+        """
+        self.client.force_authenticate(user=self.admin)
+
+        today = timezone.now().date()
+        rule = TimeSlotRule.objects.create(
+            period=self.period,
+            price=1,
+            start_date=today + timedelta(days=1),
+            end_date=today + timedelta(days=7),
+            start_time=datetime.min.time().replace(hour=8),
+            end_time=datetime.min.time().replace(hour=12),
+            weekdays="0,1,2,3,4,5,6",
+        )
+        rule_occurrence, end_time = next(rule.get_occurrences())
+
+        data = {
+            'order_lines': [{
+                'content_type': 'timeslotrule',
+                'object_id': rule.id,
+                'rule_occurrence': rule_occurrence.isoformat(),
+                'quantity': 1,
+            }],
+        }
+
+        response = self.client.put(
+            reverse(
+                'order-detail',
+                kwargs={'pk': self.order.id},
+            ),
+            data,
+            format='json',
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_400_BAD_REQUEST,
+            response.content,
+        )
+        self.assertEqual(
+            json.loads(response.content),
+            {'order_lines': [
+                "Time slot rules can only be booked when creating an order."
+            ]},
+        )
+        self.assertFalse(TimeSlot.objects.filter(rule=rule).exists())
+        self.assertFalse(
+            self.order.order_lines.filter(
+                content_type__model='timeslotrule',
+            ).exists()
+        )
+
     def test_delete(self):
         """
         Ensure we can delete an order.
@@ -2173,6 +2449,12 @@ class OrderTests(APITestCase):
                 'authorization_id': '1',
                 'settlement_id': '1',
                 'reference_number': '751',
+                'subtotal': '40.00',
+                'discount': '0.00',
+                'tax': '5.99',
+                'total': '45.99',
+                'tickets': '0.00',
+                'refunded': '0.00',
                 'order_lines': [{
                     'content_type': 'package',
                     'id': self.order_line.id,
@@ -2217,6 +2499,12 @@ class OrderTests(APITestCase):
                 'authorization_id': '1',
                 'settlement_id': '1',
                 'reference_number': '751',
+                'subtotal': '40.00',
+                'discount': '0.00',
+                'tax': '5.99',
+                'total': '45.99',
+                'tickets': '0.00',
+                'refunded': '0.00',
                 'order_lines': [{
                     'content_type': 'package',
                     'id': self.order_line.id,
@@ -2237,6 +2525,12 @@ class OrderTests(APITestCase):
                 'authorization_id': '2',
                 'settlement_id': '2',
                 'reference_number': '751',
+                'subtotal': '0.00',
+                'discount': '0.00',
+                'tax': '0.00',
+                'total': '0.00',
+                'tickets': '0.00',
+                'refunded': '0.00',
                 'order_lines': [],
                 'url': 'http://testserver/orders/' + str(self.order_admin.id),
                 'user': 'http://testserver/users/' + str(self.admin.id),
@@ -2265,6 +2559,42 @@ class OrderTests(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_list_filter_total(self):
+        """
+        Ensure we can filter and order orders on their totals.
+        """
+        Order.objects.filter(pk=self.order.pk).update(total=100)
+        Order.objects.filter(pk=self.order_admin.pk).update(total=200)
+        Order.objects.create(
+            user=self.user,
+            transaction_date=timezone.now(),
+            authorization_id=1,
+            settlement_id=1,
+            reference_number=751,
+            total=10,
+        )
+
+        self.client.force_authenticate(user=self.admin)
+
+        response = self.client.get(
+            reverse('order-list'),
+            {'total__gte': 50, 'ordering': '-total'},
+            format='json',
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK,
+            response.content,
+        )
+
+        content = json.loads(response.content)
+
+        self.assertEqual(
+            [order['id'] for order in content['results']],
+            [self.order_admin.id, self.order.id],
+        )
+
     def test_read_owner(self):
         """
         Ensure we can read an order owned by an authenticated user.
@@ -2286,6 +2616,12 @@ class OrderTests(APITestCase):
             'authorization_id': '1',
             'settlement_id': '1',
             'reference_number': '751',
+            'subtotal': '40.00',
+            'discount': '0.00',
+            'tax': '5.99',
+            'total': '45.99',
+            'tickets': '0.00',
+            'refunded': '0.00',
             'order_lines': [{
                 'content_type': 'package',
                 'id': self.order_line.id,
@@ -2346,6 +2682,12 @@ class OrderTests(APITestCase):
             'authorization_id': '1',
             'settlement_id': '1',
             'reference_number': '751',
+            'subtotal': '40.00',
+            'discount': '0.00',
+            'tax': '5.99',
+            'total': '45.99',
+            'tickets': '0.00',
+            'refunded': '0.00',
             'order_lines': [{
                 'content_type': 'package',
                 'id': self.order_line.id,
@@ -2439,6 +2781,45 @@ class OrderTests(APITestCase):
 
         self.assertEqual(response_data, content)
 
+    def test_validate_coupon_without_writes(self):
+        """
+        Ensure that validating a coupon doesn't write to the database.
+        """
+        self.client.force_authenticate(user=self.admin)
+
+        data = {
+            'order_lines': [{
+                'content_type': 'package',
+                'object_id': self.package.id,
+                'quantity': 2,
+            }, {
+                'content_type': 'timeslot',
+                'object_id': self.time_slot.id,
+                'quantity': 1,
+            }],
+            'coupon': "ABCD1234",
+        }
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('order-validate-coupon'),
+                data,
+                format='json',
+            )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK,
+            response.content,
+        )
+
+        writes = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ]
+
+        self.assertEqual(writes, [])
+
     def test_validate_coupon_full_discount(self):
         """
         Ensure that we can validate a coupon with 100% discount.
@@ -38,6 +38,7 @@ router.register('memberships', views.MembershipViewSet)
 router.register('custom_payments', views.CustomPaymentViewSet)
 router.register('coupons', views.CouponViewSet)
 router.register('coupon_uses', views.CouponUserViewSet)
+router.register('coupon_notifications', views.CouponNotificationViewSet)
 router.register('refunds', views.RefundViewSet)
 # router.register('payment_profiles', views.PaymentProfileViewSet)
 
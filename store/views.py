@@ -17,13 +17,15 @@ from blitz_api.mixins import ExportMixin
 
 from .exceptions import PaymentAPIError
 from .models import (Package, Membership, Order, OrderLine, PaymentProfile,
-                     CustomPayment, Coupon, CouponUser, Refund, )
+                     CustomPayment, Coupon, CouponUser, Refund,
+                     CouponNotification, )
 from .permissions import IsOwner
 from .resources import (MembershipResource, PackageResource, OrderResource,
                         OrderLineResource, CustomPaymentResource,
                         CouponResource, CouponUserResource, RefundResource, )
 from .services import (delete_external_card, validate_coupon_for_order,
-                       notify_for_coupon, )
+                       notify_for_coupon, queue_coupon_notification,
+                       COUPON_NOTIFICATION_SYNC_LIMIT, )
 
 from . import serializers, permissions
 
@@ -180,6 +182,24 @@ class OrderViewSet(ExportMixin, viewsets.ModelViewSet):
     serializer_class = serializers.OrderSerializer
     queryset = Order.objects.all()
     permission_classes = (permissions.IsAdminOrCreateReadOnly, IsAuthenticated)
+    filter_fields = {
+        'transaction_date': ['exact', 'gte', 'lte'],
+        'subtotal': ['exact', 'gte', 'lte'],
+        'discount': ['exact', 'gte', 'lte'],
+        'tax': ['exact', 'gte', 'lte'],
+        'total': ['exact', 'gte', 'lte'],
+        'tickets': ['exact', 'gte', 'lte'],
+        'refunded': ['exact', 'gte', 'lte'],
+    }
+    ordering_fields = (
+        'transaction_date',
+        'subtotal',
+        'discount',
+        'tax',
+        'total',
+        'tickets',
+        'refunded',
+    )
 
     export_resource = OrderResource()
 
@@ -188,10 +208,7 @@ class OrderViewSet(ExportMixin, viewsets.ModelViewSet):
     def validate_coupon(self, request, pk=None):
         """
         This validates if a coupon can be used in an order.
-        It has to create temporary objects to be able to use querysets.
-        Temporary objects are then deleted.
-
-        This is not the best way to do it and it could be improved.
+        The coupon is evaluated on unsaved order lines, nothing is written.
         """
         serializer = serializers.OrderSerializer(
             data=request.data,
@@ -204,28 +221,22 @@ class OrderViewSet(ExportMixin, viewsets.ModelViewSet):
                 'coupon': [_("This field is required.")]
             }
             return Response(error, status=status.HTTP_400_BAD_REQUEST)
-        orderlines = serializer.validated_data.pop('order_lines', None)
-        coupon = serializer.validated_data.pop('coupon', None)
-        serializer.validated_data.pop('payment_token', None)
-        serializer.validated_data.pop('single_use_token', None)
-        order = Order(
-            **serializer.validated_data,
-            transaction_date=timezone.now(),
-            user=request.user,
+        # The occurrence of a time slot rule is not a field of OrderLine
+        orderlines = [
+            OrderLine(**{
+                field: value for field, value in orderline.items()
+                if field != 'rule_occurrence'
+            })
+            for orderline in serializer.validated_data['order_lines']
+        ]
+        coupon = serializer.validated_data['coupon']
+
+        response = validate_coupon_for_order(
+            coupon,
+            request.user,
+            orderlines,
+            serializer.products,
         )
-        order.save()
-
-        orderline_list = []
-        for idx, orderline in enumerate(orderlines):
-            orderline_list.append(
-                OrderLine(
-                    **orderline,
-                    order=order,
-                )
-            )
-            orderline_list[idx].save()
-
-        response = validate_coupon_for_order(coupon, order)
         response['orderline'] = serializers.OrderLineSerializerNoOrder(
             response['orderline'],
             context={'request': request}
@@ -236,9 +247,6 @@ class OrderViewSet(ExportMixin, viewsets.ModelViewSet):
         response['orderline'].pop('coupon', None)
         response['orderline'].pop('coupon_real_value', None)
         response['orderline'].pop('cost', None)
-        order.delete()
-        for orderline in orderline_list:
-            orderline.delete()
         if response['valid_use']:
             response.pop('valid_use', None)
             response.pop('error', None)
@@ -331,6 +339,30 @@ class CouponViewSet(ExportMixin, viewsets.ModelViewSet):
 
     export_resource = CouponResource()
 
+    @action(methods=['post'], detail=False, permission_classes=[IsAdminUser])
+    def batch(self, request):
+        """
+        This custom action allows an admin to create a batch of coupons for
+        a campaign. The coupons share everything but their random code.
+
+        Parameters:
+            count: number of coupons to create.
+            Other fields are the fields of a coupon, without its code.
+        """
+        serializer = serializers.CouponBatchSerializer(
+            data=request.data,
+            context=self.get_serializer_context(),
+        )
+        serializer.is_valid(raise_exception=True)
+        coupons = serializer.save()
+
+        data = {
+            'count': len(coupons),
+            'codes': [coupon.code for coupon in coupons],
+        }
+
+        return Response(data, status=status.HTTP_201_CREATED)
+
     @action(methods=['post'], detail=True, permission_classes=[IsOwner])
     def notify(self, request, pk=None):
         """
@@ -339,6 +371,9 @@ class CouponViewSet(ExportMixin, viewsets.ModelViewSet):
 
         We're using a DRF serializer field on-the-fly here to validate the
         email list.
+
+        Lists longer than COUPON_NOTIFICATION_SYNC_LIMIT return a coupon
+        notification with the delivery of each email.
         """
         email_list_data = request.data.get('email_list', None)
 
@@ -366,14 +401,29 @@ class CouponViewSet(ExportMixin, viewsets.ModelViewSet):
                 "email_list": [str(msg) for msg in err.detail]
             })
 
-        for email in email_list:
+        coupon = self.get_object()
+
+        if len(email_list) <= COUPON_NOTIFICATION_SYNC_LIMIT:
             # Notify every user in the list
-            notify_for_coupon(
-                email,
-                self.get_object(),
-            )
+            notify_for_coupon(email_list, coupon)
 
-        return Response(status=status.HTTP_204_NO_CONTENT)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        notification = queue_coupon_notification(
+            email_list,
+            coupon,
+            request.user,
+        )
+        serializer = serializers.CouponNotificationSerializer(
+            notification,
+            context={'request': request},
+        )
+
+        return Response(
+            serializer.data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': serializer.data['url']},
+        )
 
     def get_queryset(self):
         """
@@ -413,6 +463,30 @@ class CouponUserViewSet(ExportMixin, viewsets.ModelViewSet):
         return CouponUser.objects.filter(user=self.request.user)
 
 
+class CouponNotificationViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    retrieve:
+    Return the delivery status of the given coupon notification.
+
+    list:
+    Return a list of coupon notifications with their delivery status.
+    """
+    serializer_class = serializers.CouponNotificationSerializer
+    queryset = CouponNotification.objects.all()
+    permission_classes = (IsAuthenticated, )
+    filter_fields = ('coupon', 'user', )
+    ordering = ('-created',)
+
+    def get_queryset(self):
+        """
+        This viewset should return owned coupon notifications except if
+        the currently authenticated user is an admin (is_staff).
+        """
+        if self.request.user.is_staff:
+            return CouponNotification.objects.all()
+        return CouponNotification.objects.filter(user=self.request.user)
+
+
 class RefundViewSet(ExportMixin, viewsets.GenericViewSet,
                     mixins.ListModelMixin,
                     mixins.RetrieveModelMixin, ):
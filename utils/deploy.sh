@@ -27,6 +27,8 @@ if [ "$TRAVIS_BRANCH" == "develop" ] && [ "$TRAVIS_REPO_SLUG" == "FJNR-inc/Blitz
     -e CONFIRM_SIGN_UP \
     -e FORGOT_PASSWORD \
     -e EMAIL_BACKEND \
+    -e OUTBOX_ENABLED \
+    -e OUTBOX_EMAIL_BACKEND \
     -e DEFAULT_FROM_EMAIL \
     -e PAYSAFE_BASE_URL \
     -e PAYSAFE_VAULT_URL \
@@ -51,6 +53,7 @@ if [ "$TRAVIS_BRANCH" == "develop" ] && [ "$TRAVIS_REPO_SLUG" == "FJNR-inc/Blitz
     pip install -r requirements-dev.txt && \
     zappa update dev && \
     zappa manage dev migrate && \
+    zappa manage dev createcachetable && \
     zappa manage dev \"collectstatic --noinput\""
 else
     echo "skip deploy since we are not on fjnr-inc/develop branch"
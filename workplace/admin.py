@@ -5,7 +5,8 @@ from modeltranslation.admin import TranslationAdmin
 from safedelete.admin import SafeDeleteAdmin, highlight_deleted
 from simple_history.admin import SimpleHistoryAdmin
 
-from .models import Period, Picture, Reservation, TimeSlot, Workplace
+from .models import (Period, Picture, Reservation, TimeSlot, TimeSlotRule,
+                     Workplace, WorkplaceOccupancy)
 from .resources import (PeriodResource, ReservationResource, TimeSlotResource,
                         WorkplaceResource)
 
@@ -75,6 +76,26 @@ class TimeSlotAdmin(SimpleHistoryAdmin, SafeDeleteAdmin, TranslationAdmin,
     ) + SafeDeleteAdmin.list_filter
 
 
+class TimeSlotRuleAdmin(SimpleHistoryAdmin, SafeDeleteAdmin):
+    list_display = (
+        'name',
+        'period',
+        'start_date',
+        'end_date',
+        'start_time',
+        'end_time',
+        'weekdays',
+        'price',
+        highlight_deleted,
+    ) + SafeDeleteAdmin.list_display
+    list_filter = (
+        ('period', admin.RelatedOnlyFieldListFilter),
+        ('period__workplace', admin.RelatedOnlyFieldListFilter),
+        'start_date',
+        'end_date',
+    ) + SafeDeleteAdmin.list_filter
+
+
 class ReservationAdmin(SimpleHistoryAdmin, SafeDeleteAdmin,
                        ExportActionModelAdmin):
     resource_class = ReservationResource
@@ -97,8 +118,30 @@ class ReservationAdmin(SimpleHistoryAdmin, SafeDeleteAdmin,
     ) + SafeDeleteAdmin.list_filter
 
 
+class WorkplaceOccupancyAdmin(admin.ModelAdmin):
+    list_display = (
+        'workplace',
+        'date',
+        'hour',
+        'time_slots',
+        'seats',
+        'active_reservations',
+        'present',
+        'absent',
+        'refreshed',
+    )
+    list_filter = (
+        ('workplace', admin.RelatedOnlyFieldListFilter),
+        'weekday',
+        'hour',
+        'date',
+    )
+
+
 admin.site.register(Workplace, WorkplaceAdmin)
 admin.site.register(Picture, PictureAdmin)
 admin.site.register(Period, PeriodAdmin)
 admin.site.register(TimeSlot, TimeSlotAdmin)
+admin.site.register(TimeSlotRule, TimeSlotRuleAdmin)
 admin.site.register(Reservation, ReservationAdmin)
+admin.site.register(WorkplaceOccupancy, WorkplaceOccupancyAdmin)
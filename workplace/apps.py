@@ -1,5 +1,8 @@
 from django.apps import AppConfig
 
 
-class LocationConfig(AppConfig):
-    name = 'location'
+class WorkplaceConfig(AppConfig):
+    name = 'workplace'
+
+    def ready(self):
+        from . import signals  # noqa: F401
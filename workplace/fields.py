@@ -12,3 +12,22 @@ class TimezoneField(serializers.CharField):
             return str(pytz.timezone(tz))
         except pytz.exceptions.UnknownTimeZoneError:
             raise serializers.ValidationError(_("Unknown timezone"))
+
+
+class WeekdaysField(serializers.ListField):
+    """
+    List of days of the week from 0:Monday to 6:Sunday stored as a comma
+    separated string (ie: "0,4").
+    """
+    child = serializers.IntegerField(max_value=6, min_value=0)
+
+    def to_internal_value(self, data):
+        weekdays = super().to_internal_value(data)
+        if len(weekdays) != len(set(weekdays)):
+            raise serializers.ValidationError(_(
+                "Duplicated weekdays are not authorized."
+            ))
+        return ','.join(str(day) for day in sorted(weekdays))
+
+    def to_representation(self, value):
+        return [int(day) for day in value.split(',') if day]
@@ -0,0 +1,72 @@
+import rest_framework_filters as filters
+
+from .models import Period, WorkplaceOccupancy
+
+
+class PeriodFilter(filters.FilterSet):
+    """
+    Filters on the statistics annotated by PeriodQuerySet.with_stats() in
+    addition to every field of the model.
+    """
+    reservations_count = filters.NumberFilter()
+    reservations_count__gte = filters.NumberFilter(
+        name='reservations_count',
+        lookup_expr='gte',
+    )
+    reservations_count__lte = filters.NumberFilter(
+        name='reservations_count',
+        lookup_expr='lte',
+    )
+    active_reservations_count = filters.NumberFilter()
+    active_reservations_count__gte = filters.NumberFilter(
+        name='active_reservations_count',
+        lookup_expr='gte',
+    )
+    active_reservations_count__lte = filters.NumberFilter(
+        name='active_reservations_count',
+        lookup_expr='lte',
+    )
+    time_slots_count = filters.NumberFilter()
+    time_slots_count__gte = filters.NumberFilter(
+        name='time_slots_count',
+        lookup_expr='gte',
+    )
+    time_slots_count__lte = filters.NumberFilter(
+        name='time_slots_count',
+        lookup_expr='lte',
+    )
+    first_time_slot__gte = filters.IsoDateTimeFilter(
+        name='first_time_slot',
+        lookup_expr='gte',
+    )
+    first_time_slot__lte = filters.IsoDateTimeFilter(
+        name='first_time_slot',
+        lookup_expr='lte',
+    )
+    last_time_slot__gte = filters.IsoDateTimeFilter(
+        name='last_time_slot',
+        lookup_expr='gte',
+    )
+    last_time_slot__lte = filters.IsoDateTimeFilter(
+        name='last_time_slot',
+        lookup_expr='lte',
+    )
+
+    class Meta:
+        model = Period
+        fields = '__all__'
+
+
+class WorkplaceOccupancyFilter(filters.FilterSet):
+    date__gte = filters.DateFilter(
+        name='date',
+        lookup_expr='gte',
+    )
+    date__lte = filters.DateFilter(
+        name='date',
+        lookup_expr='lte',
+    )
+
+    class Meta:
+        model = WorkplaceOccupancy
+        fields = ('workplace', 'date', 'weekday', 'hour')
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from workplace.models import WorkplaceOccupancy
+from workplace.services import refresh_workplace_occupancy
+
+
+class Command(BaseCommand):
+    help = 'Refresh the occupancy of workplaces changed since the last ' \
+           'refresh'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            dest='full',
+            help='Rebuild the occupancy of every workplace',
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if not options['full']:
+            since = WorkplaceOccupancy.objects.aggregate(
+                last_refresh=Max('refreshed'),
+            )['last_refresh']
+
+        count = refresh_workplace_occupancy(since)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} "
+            f"occupancy row(s) refreshed"))
@@ -0,0 +1,56 @@
+from django.db.models import Count, Max, Min, Q
+
+from safedelete.managers import SafeDeleteManager
+from safedelete.queryset import SafeDeleteQueryset
+
+
+class PeriodQuerySet(SafeDeleteQueryset):
+    def with_stats(self):
+        """
+        Annotates each period with statistics about its timeslots and
+        reservations so they can be read, filtered and ordered without
+        running one query per period.
+
+            reservations_count:         Reservations of the period
+            active_reservations_count:  Active reservations of the period
+            time_slots_count:           Timeslots of the period
+            first_time_slot:            Start time of the first timeslot
+            last_time_slot:             End time of the last timeslot
+        """
+        reservation_visible = Q(time_slots__reservations__deleted__isnull=True)
+        time_slot_visible = Q(time_slots__deleted__isnull=True)
+
+        return self.annotate(
+            reservations_count=Count(
+                'time_slots__reservations',
+                filter=reservation_visible,
+                distinct=True,
+            ),
+            active_reservations_count=Count(
+                'time_slots__reservations',
+                filter=reservation_visible & Q(
+                    time_slots__reservations__is_active=True
+                ),
+                distinct=True,
+            ),
+            time_slots_count=Count(
+                'time_slots',
+                filter=time_slot_visible,
+                distinct=True,
+            ),
+            first_time_slot=Min(
+                'time_slots__start_time',
+                filter=time_slot_visible,
+            ),
+            last_time_slot=Max(
+                'time_slots__end_time',
+                filter=time_slot_visible,
+            ),
+        )
+
+
+class PeriodManager(SafeDeleteManager):
+    _queryset_class = PeriodQuerySet
+
+    def with_stats(self):
+        return self.get_queryset().with_stats()
@@ -0,0 +1,17 @@
+# Generated by Django 2.0.8 on 2026-10-18 21:48
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workplace', '0023_auto_20190517_1435'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='period',
+            options={'default_manager_name': 'objects', 'verbose_name': 'Period', 'verbose_name_plural': 'Periods'},
+        ),
+    ]
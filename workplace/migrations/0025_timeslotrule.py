@@ -0,0 +1,90 @@
+# Generated by Django 2.0.8 on 2026-10-18 21:57
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import re
+import simple_history.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('workplace', '0024_period_default_manager'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoricalTimeSlotRule',
+            fields=[
+                ('id', models.IntegerField(auto_created=True, blank=True, db_index=True, verbose_name='ID')),
+                ('deleted', models.DateTimeField(editable=False, null=True)),
+                ('name', models.CharField(blank=True, max_length=253, null=True, verbose_name='Name')),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=6, null=True, verbose_name='Price')),
+                ('start_date', models.DateField(verbose_name='Start date')),
+                ('end_date', models.DateField(verbose_name='End date')),
+                ('start_time', models.TimeField(verbose_name='Start time')),
+                ('end_time', models.TimeField(verbose_name='End time')),
+                ('weekdays', models.CharField(max_length=13, validators=[django.core.validators.RegexValidator(re.compile('^\\d+(?:\\,\\d+)*\\Z'), code='invalid', message='Enter only digits separated by commas.')], verbose_name='Weekdays')),
+                ('timezone', models.CharField(blank=True, max_length=100, null=True, verbose_name='Timezone')),
+                ('history_id', models.AutoField(primary_key=True, serialize=False)),
+                ('history_date', models.DateTimeField()),
+                ('history_change_reason', models.CharField(max_length=100, null=True)),
+                ('history_type', models.CharField(choices=[('+', 'Created'), ('~', 'Changed'), ('-', 'Deleted')], max_length=1)),
+                ('history_user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('period', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='workplace.Period', verbose_name='Period')),
+            ],
+            options={
+                'verbose_name': 'historical Time slot rule',
+                'ordering': ('-history_date', '-history_id'),
+                'get_latest_by': 'history_date',
+            },
+            bases=(simple_history.models.HistoricalChanges, models.Model),
+        ),
+        migrations.CreateModel(
+            name='TimeSlotRule',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.DateTimeField(editable=False, null=True)),
+                ('name', models.CharField(blank=True, max_length=253, null=True, verbose_name='Name')),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=6, null=True, verbose_name='Price')),
+                ('start_date', models.DateField(verbose_name='Start date')),
+                ('end_date', models.DateField(verbose_name='End date')),
+                ('start_time', models.TimeField(verbose_name='Start time')),
+                ('end_time', models.TimeField(verbose_name='End time')),
+                ('weekdays', models.CharField(max_length=13, validators=[django.core.validators.RegexValidator(re.compile('^\\d+(?:\\,\\d+)*\\Z'), code='invalid', message='Enter only digits separated by commas.')], verbose_name='Weekdays')),
+                ('timezone', models.CharField(blank=True, max_length=100, null=True, verbose_name='Timezone')),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='time_slot_rules', to='workplace.Period', verbose_name='Period')),
+            ],
+            options={
+                'verbose_name': 'Time slot rule',
+                'verbose_name_plural': 'Time slot rules',
+            },
+        ),
+        migrations.AddField(
+            model_name='historicaltimeslot',
+            name='rule_occurrence',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Rule occurrence'),
+        ),
+        migrations.AddField(
+            model_name='timeslot',
+            name='rule_occurrence',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Rule occurrence'),
+        ),
+        migrations.AddField(
+            model_name='historicaltimeslot',
+            name='rule',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='workplace.TimeSlotRule', verbose_name='Rule'),
+        ),
+        migrations.AddField(
+            model_name='timeslot',
+            name='rule',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='time_slots', to='workplace.TimeSlotRule', verbose_name='Rule'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='timeslot',
+            unique_together={('rule', 'rule_occurrence')},
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.0.8 on 2026-10-18 22:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workplace', '0025_timeslotrule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkplaceOccupancy',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('weekday', models.PositiveSmallIntegerField(verbose_name='Weekday')),
+                ('hour', models.PositiveSmallIntegerField(verbose_name='Hour')),
+                ('time_slots', models.PositiveIntegerField(default=0, verbose_name='Time slots')),
+                ('seats', models.PositiveIntegerField(default=0, verbose_name='Seats')),
+                ('reservations', models.PositiveIntegerField(default=0, verbose_name='Reservations')),
+                ('active_reservations', models.PositiveIntegerField(default=0, verbose_name='Active reservations')),
+                ('canceled_by_user', models.PositiveIntegerField(default=0, verbose_name='Canceled by user')),
+                ('canceled_timeslot_deleted', models.PositiveIntegerField(default=0, verbose_name='Canceled because the time slot was deleted')),
+                ('canceled_timeslot_modified', models.PositiveIntegerField(default=0, verbose_name='Canceled because the time slot was modified')),
+                ('present', models.PositiveIntegerField(default=0, verbose_name='Present')),
+                ('absent', models.PositiveIntegerField(default=0, verbose_name='Absent')),
+                ('refreshed', models.DateTimeField(verbose_name='Refreshed')),
+                ('workplace', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancies', to='workplace.Workplace', verbose_name='Workplace')),
+            ],
+            options={
+                'verbose_name': 'Workplace occupancy',
+                'verbose_name_plural': 'Workplace occupancies',
+                'ordering': ('workplace', 'date', 'hour'),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='workplaceoccupancy',
+            unique_together={('workplace', 'date', 'hour')},
+        ),
+    ]
@@ -1,3 +1,10 @@
+from datetime import datetime
+
+import pytz
+
+from dateutil.rrule import rrule, DAILY
+
+from django.core.validators import validate_comma_separated_integer_list
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from django.utils.html import format_html
@@ -9,6 +16,8 @@ from simple_history.models import HistoricalRecords
 
 from blitz_api.models import Address
 
+from .managers import PeriodManager
+
 User = get_user_model()
 
 
@@ -96,6 +105,7 @@ class Period(SafeDeleteModel):
     class Meta:
         verbose_name = _("Period")
         verbose_name_plural = _("Periods")
+        default_manager_name = 'objects'
 
     name = models.CharField(
         verbose_name=_("Name"),
@@ -132,8 +142,13 @@ class Period(SafeDeleteModel):
         default=False,
     )
 
+    objects = PeriodManager()
+
     @property
     def total_reservations(self):
+        # Use the value annotated by PeriodQuerySet.with_stats() if available
+        if hasattr(self, 'active_reservations_count'):
+            return self.active_reservations_count
         reservations = Reservation.objects.filter(
             timeslot__period=self,
             is_active=True,
@@ -147,12 +162,145 @@ class Period(SafeDeleteModel):
         return self.name
 
 
+class TimeSlotRule(SafeDeleteModel):
+    """
+    Represents time slots repeating every week in a period. Occurrences are
+    computed on demand and only saved as TimeSlot when needed (ie: when booked
+    or edited by an admin).
+    """
+
+    class Meta:
+        verbose_name = _("Time slot rule")
+        verbose_name_plural = _("Time slot rules")
+
+    name = models.CharField(
+        verbose_name=_("Name"),
+        blank=True,
+        null=True,
+        max_length=253,
+    )
+
+    period = models.ForeignKey(
+        Period,
+        on_delete=models.CASCADE,
+        verbose_name=_("Period"),
+        related_name='time_slot_rules',
+    )
+
+    price = models.DecimalField(
+        max_digits=6,
+        decimal_places=2,
+        verbose_name=_("Price"),
+        blank=True,
+        null=True,
+    )
+
+    start_date = models.DateField(
+        verbose_name=_("Start date"),
+    )
+
+    end_date = models.DateField(
+        verbose_name=_("End date"),
+    )
+
+    start_time = models.TimeField(
+        verbose_name=_("Start time"),
+    )
+
+    end_time = models.TimeField(
+        verbose_name=_("End time"),
+    )
+
+    # Days of the week from 0:Monday to 6:Sunday (ie: "0,4")
+    weekdays = models.CharField(
+        verbose_name=_("Weekdays"),
+        max_length=13,
+        validators=[validate_comma_separated_integer_list],
+    )
+
+    timezone = models.CharField(
+        verbose_name=_("Timezone"),
+        blank=True,
+        null=True,
+        max_length=100,
+    )
+
+    history = HistoricalRecords()
+
+    def __str__(self):
+        return self.name or str(self.period)
+
+    @property
+    def weekday_list(self):
+        return [int(day) for day in self.weekdays.split(',') if day]
+
+    def get_timezone(self):
+        """
+        Use the rule's timezone if possible. Otherwise use workplace's
+        timezone or Montreal timezone.
+        """
+        workplace = self.period.workplace
+        if self.timezone:
+            return pytz.timezone(self.timezone)
+        if workplace and workplace.timezone:
+            return pytz.timezone(workplace.timezone)
+        return pytz.timezone('America/Montreal')
+
+    def get_occurrences(self, start=None, end=None):
+        """
+        Returns a generator of (start_time, end_time) tuples of timezone-aware
+        datetimes for each occurrence starting between start and end
+        (inclusive) and contained in the period.
+        """
+        tz = self.get_timezone()
+        # Naive datetimes are used to avoid problems with DST (not handled by
+        # rrule). The timezone is added back to each occurrence.
+        duration = (
+            datetime.combine(self.start_date, self.end_time) -
+            datetime.combine(self.start_date, self.start_time)
+        )
+        rule = rrule(
+            freq=DAILY,
+            dtstart=datetime.combine(self.start_date, self.start_time),
+            until=datetime.combine(self.end_date, self.start_time),
+            byweekday=self.weekday_list,
+        )
+        after = datetime.min
+        before = datetime.max
+        if start is not None:
+            after = start.astimezone(tz).replace(tzinfo=None)
+        if end is not None:
+            before = end.astimezone(tz).replace(tzinfo=None)
+
+        for naive_start in rule.between(after, before, inc=True):
+            start_time = tz.localize(naive_start)
+            end_time = tz.localize(naive_start + duration)
+            if start_time < self.period.start_date:
+                continue
+            if end_time > self.period.end_date:
+                continue
+            yield start_time, end_time
+
+    def build_time_slot(self, start_time, end_time):
+        """Returns an unsaved TimeSlot for an occurrence of the rule."""
+        return TimeSlot(
+            name=self.name,
+            period=self.period,
+            rule=self,
+            rule_occurrence=start_time,
+            price=self.price if self.price is not None else self.period.price,
+            start_time=start_time,
+            end_time=end_time,
+        )
+
+
 class TimeSlot(SafeDeleteModel):
     """Represents time slots in a day"""
 
     class Meta:
         verbose_name = _("Time slot")
         verbose_name_plural = _("Time slots")
+        unique_together = (('rule', 'rule_occurrence'),)
 
     name = models.CharField(
         verbose_name=_("Name"),
@@ -192,6 +340,24 @@ class TimeSlot(SafeDeleteModel):
         verbose_name=_("End time"),
     )
 
+    # Set when the time slot is an occurrence of a TimeSlotRule that has been
+    # saved. rule_occurrence keeps the original start time of the occurrence
+    # even if the time slot is modified afterwards.
+    rule = models.ForeignKey(
+        TimeSlotRule,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        verbose_name=_("Rule"),
+        related_name='time_slots',
+    )
+
+    rule_occurrence = models.DateTimeField(
+        verbose_name=_("Rule occurrence"),
+        blank=True,
+        null=True,
+    )
+
     # History is registered in translation.py
     # history = HistoricalRecords()
 
@@ -251,3 +417,89 @@ class Reservation(SafeDeleteModel):
 
     def __str__(self):
         return str(self.user)
+
+
+class WorkplaceOccupancy(models.Model):
+    """
+    Represents the reservations of the time slots of a workplace starting
+    within an hour, in the workplace's timezone. Rows are computed from
+    Reservation and TimeSlot by the refresh_workplace_occupancy command.
+    """
+
+    class Meta:
+        verbose_name = _("Workplace occupancy")
+        verbose_name_plural = _("Workplace occupancies")
+        unique_together = (('workplace', 'date', 'hour'),)
+        ordering = ('workplace', 'date', 'hour')
+
+    workplace = models.ForeignKey(
+        Workplace,
+        on_delete=models.CASCADE,
+        verbose_name=_("Workplace"),
+        related_name='occupancies',
+    )
+
+    date = models.DateField(
+        verbose_name=_("Date"),
+    )
+
+    # Day of the week from 0:Monday to 6:Sunday
+    weekday = models.PositiveSmallIntegerField(
+        verbose_name=_("Weekday"),
+    )
+
+    hour = models.PositiveSmallIntegerField(
+        verbose_name=_("Hour"),
+    )
+
+    time_slots = models.PositiveIntegerField(
+        verbose_name=_("Time slots"),
+        default=0,
+    )
+
+    seats = models.PositiveIntegerField(
+        verbose_name=_("Seats"),
+        default=0,
+    )
+
+    reservations = models.PositiveIntegerField(
+        verbose_name=_("Reservations"),
+        default=0,
+    )
+
+    active_reservations = models.PositiveIntegerField(
+        verbose_name=_("Active reservations"),
+        default=0,
+    )
+
+    canceled_by_user = models.PositiveIntegerField(
+        verbose_name=_("Canceled by user"),
+        default=0,
+    )
+
+    canceled_timeslot_deleted = models.PositiveIntegerField(
+        verbose_name=_("Canceled because the time slot was deleted"),
+        default=0,
+    )
+
+    canceled_timeslot_modified = models.PositiveIntegerField(
+        verbose_name=_("Canceled because the time slot was modified"),
+        default=0,
+    )
+
+    present = models.PositiveIntegerField(
+        verbose_name=_("Present"),
+        default=0,
+    )
+
+    absent = models.PositiveIntegerField(
+        verbose_name=_("Absent"),
+        default=0,
+    )
+
+    refreshed = models.DateTimeField(
+        verbose_name=_("Refreshed"),
+    )
+
+    def __str__(self):
+        return '{0} {1} {2}h'.format(self.workplace, self.date, self.hour)
@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from .services import is_workplace_volunteer
+
 
 class IsAdminOrReadOnly(permissions.BasePermission):
     """
@@ -21,12 +23,14 @@ class IsVolunteerOrUpdateReadOnly(permissions.BasePermission):
     """
 
     def has_object_permission(self, request, view, obj):
-        volunteers = obj.timeslot.period.workplace.volunteers.all()
         if request.method in permissions.SAFE_METHODS:
             return True
         if request.method in ['PATCH', ]:
             return (request.user.is_staff or
-                    request.user in volunteers)
+                    is_workplace_volunteer(
+                        request.user,
+                        obj.timeslot.period.workplace_id,
+                    ))
         return request.user.is_staff
 
 
@@ -1,6 +1,5 @@
-from copy import copy
-
-from datetime import datetime
+from collections import defaultdict
+from datetime import datetime, timedelta
 
 from dateutil.parser import parse
 from dateutil.rrule import rrule, DAILY
@@ -13,10 +12,8 @@ from rest_framework.validators import UniqueValidator
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.mail import send_mail
 from django.db import transaction
 from django.db.models import F
-from django.template.loader import render_to_string
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
@@ -25,8 +22,12 @@ from blitz_api.services import (remove_translation_fields,
                                 check_if_translated_field,
                                 getMessageTranslate,)
 
-from .models import Workplace, Picture, Period, TimeSlot, Reservation
-from .fields import TimezoneField
+from .models import (Workplace, Picture, Period, TimeSlot, TimeSlotRule,
+                     Reservation, WorkplaceOccupancy)
+from .fields import TimezoneField, WeekdaysField
+from .services import (clone_period, expand_time_slot_rules, find_overlap,
+                       get_period_timezone, notify_reservation_cancelation,
+                       reschedule_time_slots, shift_datetime)
 
 User = get_user_model()
 
@@ -191,9 +192,13 @@ class PeriodSerializer(serializers.HyperlinkedModelSerializer):
         # Forbid Period full updates if users have reserved timeslots
         action = self.context['view'].action
         if action == 'update' or action == 'partial_update':
-            reservations = TimeSlot.objects.filter(
-                period=self.instance
-            ).exclude(users=None).count()
+            # Use the value annotated by PeriodQuerySet.with_stats() if
+            # available.
+            reservations = getattr(self.instance, 'reservations_count', None)
+            if reservations is None:
+                reservations = TimeSlot.objects.filter(
+                    period=self.instance
+                ).exclude(users=None).count()
             if reservations:
                 raise serializers.ValidationError(
                     _("The period contains timeslots with user reservations."),
@@ -281,6 +286,50 @@ class PeriodSerializer(serializers.HyperlinkedModelSerializer):
         }
 
 
+class PeriodCloneSerializer(serializers.Serializer):
+    """Copies the period provided in context['period'] to a new date."""
+    start_date = serializers.DateField(
+        help_text=_("Date of the beginning of the new period."),
+    )
+    is_active = serializers.BooleanField(
+        required=False,
+        default=False,
+    )
+
+    def validate(self, attrs):
+        """Prevents overlapping active periods"""
+        period = self.context['period']
+        if attrs['is_active']:
+            tz = get_period_timezone(period)
+            start_date = period.start_date.astimezone(tz).date()
+            days = attrs['start_date'] - start_date
+            start = shift_datetime(period.start_date, days, tz)
+            end = shift_datetime(period.end_date, days, tz)
+
+            workplace_periods = Period.objects.filter(
+                workplace=period.workplace,
+                is_active=True,
+                start_date__lt=end,
+                end_date__gt=start,
+            )
+            if workplace_periods.exists():
+                raise serializers.ValidationError(
+                    _(
+                        "An active period associated to the same "
+                        "workplace overlaps with the provided start_date "
+                        "and end_date."
+                    ),
+                )
+        return attrs
+
+    def save(self, **kwargs):
+        return clone_period(
+            self.context['period'],
+            self.validated_data['start_date'],
+            self.validated_data['is_active'],
+        )
+
+
 class TimeSlotSerializer(serializers.HyperlinkedModelSerializer):
     id = serializers.ReadOnlyField()
     billing_price = serializers.ReadOnlyField()
@@ -424,6 +473,22 @@ class TimeSlotSerializer(serializers.HyperlinkedModelSerializer):
                     ),
                 })
 
+        # Occurrences of the period's rules that are not saved as timeslots
+        rule_time_slots = expand_time_slot_rules(
+            TimeSlotRule.objects.filter(period=period),
+            start - timedelta(days=1),
+            end,
+        )
+        for rule_time_slot in rule_time_slots:
+            if max(rule_time_slot.start_time, start) < \
+                    min(rule_time_slot.end_time, end):
+                raise serializers.ValidationError({
+                    'detail': _(
+                        "An existing timeslot overlaps with the provided "
+                        "start_time and end_time."
+                    ),
+                })
+
         return attrs
 
     @transaction.atomic()
@@ -445,7 +510,9 @@ class TimeSlotSerializer(serializers.HyperlinkedModelSerializer):
                     reservations__in=reservation_cancel
                 )
 
-                reservations_cancel_copy = copy(reservation_cancel)
+                reservations_cancel_copy = list(
+                    reservation_cancel.select_related('user', 'timeslot')
+                )
 
                 affected_users.update(tickets=F('tickets') + 1)
                 reservation_cancel.update(
@@ -454,27 +521,11 @@ class TimeSlotSerializer(serializers.HyperlinkedModelSerializer):
                     cancelation_date=timezone.now(),
                 )
 
-                for reservation in reservations_cancel_copy:
-                    merge_data = {
-                        'TIMESLOT_LIST': [instance],
-                        'SUPPORT_EMAIL': settings.SUPPORT_EMAIL,
-                        'CUSTOM_MESSAGE': custom_message,
-                    }
-                    plain_msg = render_to_string(
-                        "cancelation.txt",
-                        merge_data
-                    )
-                    msg_html = render_to_string(
-                        "cancelation.html",
-                        merge_data
-                    )
-                    send_mail(
-                        "Annulation d'un bloc de rédaction",
-                        plain_msg,
-                        settings.DEFAULT_FROM_EMAIL,
-                        [reservation.user.email],
-                        html_message=msg_html,
-                    )
+                # Send a single email per affected user
+                notify_reservation_cancelation(
+                    reservations_cancel_copy,
+                    custom_message,
+                )
 
         return super(TimeSlotSerializer, self).update(
             instance,
@@ -499,7 +550,7 @@ class TimeSlotSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = TimeSlot
-        exclude = ('name', 'deleted',)
+        exclude = ('name', 'deleted', 'rule', 'rule_occurrence',)
         extra_kwargs = {
             'period': {
                 'required': True,
@@ -596,7 +647,7 @@ class BatchTimeSlotSerializer(serializers.HyperlinkedModelSerializer):
 
         time_list = TimeSlot.objects.filter(
             period=validated_data['period']
-        ).values_list('start_time', 'end_time')
+        ).only('start_time', 'end_time')
 
         timeslot_data = {
             'period': validated_data['period'],
@@ -643,17 +694,20 @@ class BatchTimeSlotSerializer(serializers.HyperlinkedModelSerializer):
             new_timeslot = TimeSlot(**timeslot_data)
             timeslot_data_list.append(new_timeslot)
 
-        for duration in time_list:
-            for timeslot in timeslot_data_list:
-                start = timeslot.start_time
-                end = timeslot.end_time
-                if max(duration[0], start) < min(duration[1], end):
-                    raise serializers.ValidationError({
-                        'non_field_errors': _(
-                            "An existing timeslot overlaps with the provided "
-                            "start_time and end_time."
-                        ),
-                    })
+        # Occurrences of the period's rules that are not saved as timeslots
+        # are compared too.
+        existing_time_slots = list(time_list) + expand_time_slot_rules(
+            TimeSlotRule.objects.filter(period=period),
+            period_start_date,
+            period_end_date,
+        )
+        if find_overlap(timeslot_data_list, existing_time_slots):
+            raise serializers.ValidationError({
+                'non_field_errors': _(
+                    "An existing timeslot overlaps with the provided "
+                    "start_time and end_time."
+                ),
+            })
 
         return timeslot_data_list
 
@@ -665,7 +719,337 @@ class BatchTimeSlotSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = TimeSlot
-        exclude = ('deleted', 'price', 'users', 'name', )
+        exclude = ('deleted', 'price', 'users', 'name', 'rule',
+                   'rule_occurrence', )
+
+
+class TimeSlotRuleSerializer(serializers.HyperlinkedModelSerializer):
+    id = serializers.ReadOnlyField()
+    weekdays = WeekdaysField(
+        allow_empty=False,
+        help_text=_(
+            "Days of the week for which the time slots are repeated. Takes "
+            "a list of integer from 0:Monday to 6:Sunday."
+        ),
+    )
+    timezone = TimezoneField(
+        required=False,
+        allow_null=True,
+        help_text=_("Defaults to the timezone of the workplace."),
+    )
+
+    def validate(self, attrs):
+        """Prevents overlapping time slots and invalid start/end dates"""
+        validated_data = super(TimeSlotRuleSerializer, self).validate(attrs)
+
+        # Build the resulting rule to compute its occurrences
+        rule = TimeSlotRule(id=getattr(self.instance, 'id', None))
+        for field in ['name', 'period', 'price', 'start_date', 'end_date',
+                      'start_time', 'end_time', 'weekdays', 'timezone']:
+            setattr(rule, field, validated_data.get(
+                field,
+                getattr(self.instance, field, None),
+            ))
+        period = rule.period
+
+        if rule.start_date > rule.end_date:
+            raise serializers.ValidationError({
+                'end_date': [_("End date must be later than start_date.")],
+                'start_date': [_("Start date must be earlier than end_date.")],
+            })
+
+        if rule.start_time >= rule.end_time:
+            raise serializers.ValidationError({
+                'end_time': [_("End time must be later than start_time.")],
+                'start_time': [_("Start time must be earlier than end_time.")],
+            })
+
+        # Make sure that start_date & end_date are within the period's
+        # start_date & end_date
+        tz = rule.get_timezone()
+        if (rule.start_date < period.start_date.astimezone(tz).date() or
+                rule.start_date > period.end_date.astimezone(tz).date()):
+            raise serializers.ValidationError({
+                'start_date': [_(
+                    "Start date must be set within the period's start_date "
+                    "and end_date."
+                )],
+            })
+        if (rule.end_date < period.start_date.astimezone(tz).date() or
+                rule.end_date > period.end_date.astimezone(tz).date()):
+            raise serializers.ValidationError({
+                'end_date': [_(
+                    "End date must be set within the period's start_date "
+                    "and end_date."
+                )],
+            })
+
+        # Saved occurrences of the rule itself are not compared
+        existing_time_slots = TimeSlot.objects.filter(period=period)
+        other_rules = TimeSlotRule.objects.filter(period=period)
+        if rule.id:
+            existing_time_slots = existing_time_slots.exclude(rule_id=rule.id)
+            other_rules = other_rules.exclude(id=rule.id)
+
+        existing_time_slots = list(existing_time_slots)
+        existing_time_slots += expand_time_slot_rules(
+            other_rules,
+            period.start_date,
+            period.end_date,
+        )
+        new_time_slots = [
+            rule.build_time_slot(start_time, end_time)
+            for start_time, end_time in rule.get_occurrences()
+        ]
+
+        if find_overlap(new_time_slots, existing_time_slots):
+            raise serializers.ValidationError({
+                'non_field_errors': [_(
+                    "An existing timeslot overlaps with the provided "
+                    "start_time and end_time."
+                )],
+            })
+
+        return validated_data
+
+    class Meta:
+        model = TimeSlotRule
+        exclude = ('deleted', )
+        extra_kwargs = {
+            'period': {
+                'help_text': _("Period to which this rule applies."),
+            },
+            'price': {
+                'help_text': _(
+                    "Hourly rate applied to the time slots of this rule. "
+                    "Overrides period price."
+                )
+            },
+        }
+
+
+class TimeSlotOccurrenceSerializer(serializers.Serializer):
+    """
+    Read-only representation of time slots that may not be saved yet
+    (ie: occurrences of a TimeSlotRule).
+    """
+    id = serializers.ReadOnlyField()
+    url = serializers.SerializerMethodField()
+    period = serializers.HyperlinkedRelatedField(
+        view_name='period-detail',
+        read_only=True,
+    )
+    rule = serializers.HyperlinkedRelatedField(
+        view_name='timeslotrule-detail',
+        read_only=True,
+    )
+    rule_occurrence = serializers.DateTimeField(read_only=True)
+    billing_price = serializers.ReadOnlyField()
+    start_time = serializers.DateTimeField(read_only=True)
+    end_time = serializers.DateTimeField(read_only=True)
+    places_remaining = serializers.SerializerMethodField()
+
+    def get_url(self, obj):
+        if obj.id is None:
+            return None
+        return reverse(
+            'timeslot-detail',
+            args=[obj.id],
+            request=self.context['request'],
+        )
+
+    def get_places_remaining(self, obj):
+        if not obj.period.workplace:
+            return 0
+        # Annotated by the view for saved time slots
+        reservations = getattr(obj, 'active_reservations', 0)
+        return obj.period.workplace.seats - reservations
+
+
+class TimeSlotWindowSerializer(serializers.Serializer):
+    """Time window in which time slot occurrences are listed."""
+    start_time__gte = serializers.DateTimeField()
+    start_time__lte = serializers.DateTimeField()
+
+    def validate(self, attrs):
+        if attrs['start_time__gte'] > attrs['start_time__lte']:
+            raise serializers.ValidationError({
+                'start_time__lte': [_(
+                    "start_time__lte must be later than start_time__gte."
+                )],
+            })
+        return attrs
+
+
+class TimeSlotMaterializeSerializer(serializers.Serializer):
+    rule_occurrence = serializers.DateTimeField(
+        help_text=_("Start time of the occurrence of the rule."),
+    )
+
+
+class TimeSlotRescheduleSerializer(serializers.Serializer):
+    """
+    Moves the timeslots provided in context['time_slots'], either by an
+    offset or to a new time window on the same day.
+    """
+    offset = serializers.DurationField(
+        required=False,
+        help_text=_("Duration added to start and end times (ie: 01:00:00)."),
+    )
+    start_time = serializers.TimeField(
+        required=False,
+        help_text=_("New local start time of the timeslots."),
+    )
+    end_time = serializers.TimeField(
+        required=False,
+        help_text=_("New local end time of the timeslots."),
+    )
+    force_update = serializers.BooleanField(
+        required=False,
+    )
+    custom_message = serializers.CharField(
+        required=False,
+        allow_blank=True,
+        allow_null=True,
+        max_length=1000,
+    )
+
+    def validate(self, attrs):
+        """Prevents overlapping timeslots and invalid start/end time"""
+        time_slots = self.context['time_slots']
+        offset = attrs.get('offset')
+        start_time = attrs.get('start_time')
+        end_time = attrs.get('end_time')
+
+        if (offset is None) == (start_time is None and end_time is None):
+            raise serializers.ValidationError({
+                'non_field_errors': [_(
+                    "Provide either an offset or a start_time and an "
+                    "end_time."
+                )],
+            })
+        if offset is None and (start_time is None or end_time is None):
+            raise serializers.ValidationError({
+                'non_field_errors': [_(
+                    "Provide both start_time and end_time."
+                )],
+            })
+        if offset is None and start_time >= end_time:
+            raise serializers.ValidationError({
+                'end_time': [_("End time must be later than start_time.")],
+                'start_time': [_("Start time must be earlier than end_time.")],
+            })
+
+        new_times = dict()
+        for time_slot in time_slots:
+            period = time_slot.period
+
+            # Use workplace's timezone if possible. Otherwise use Montreal
+            # timezone
+            if period.workplace and period.workplace.timezone:
+                tz = pytz.timezone(period.workplace.timezone)
+            else:
+                tz = pytz.timezone('America/Montreal')
+
+            if offset is not None:
+                start = time_slot.start_time + offset
+                end = time_slot.end_time + offset
+            else:
+                day = time_slot.start_time.astimezone(tz).date()
+                start = tz.localize(datetime.combine(day, start_time))
+                end = tz.localize(datetime.combine(day, end_time))
+
+            if start.astimezone(tz).date() != end.astimezone(tz).date():
+                raise serializers.ValidationError({
+                    'offset': [_(
+                        "End time must be the same day as start_time."
+                    )],
+                })
+            if (start < period.start_date or end > period.end_date):
+                raise serializers.ValidationError({
+                    'non_field_errors': [_(
+                        "Start time and end time must be set within the "
+                        "period's start_date and end_date."
+                    )],
+                })
+
+            new_times[time_slot.id] = (start, end)
+
+        if new_times:
+            self.check_overlaps(time_slots, new_times)
+
+        moved_ids = [
+            time_slot.id for time_slot in time_slots
+            if new_times[time_slot.id] != (time_slot.start_time,
+                                           time_slot.end_time)
+        ]
+        reservations = Reservation.objects.filter(
+            timeslot_id__in=moved_ids,
+            is_active=True,
+        )
+        if not attrs.get('force_update') and reservations.exists():
+            raise serializers.ValidationError({
+                "non_field_errors": [_(
+                    "Trying to push an update that affects users "
+                    "without providing `force_update` field."
+                )]
+            })
+
+        attrs['new_times'] = new_times
+        return attrs
+
+    def check_overlaps(self, time_slots, new_times):
+        """
+        Checks moved timeslots against each other and against other
+        timeslots (saved or not) of their periods with a single find_overlap
+        sweep per period.
+        """
+        moved_per_period = defaultdict(list)
+        for time_slot in time_slots:
+            start, end = new_times[time_slot.id]
+            moved_per_period[time_slot.period_id].append(
+                TimeSlot(start_time=start, end_time=end)
+            )
+
+        others_per_period = defaultdict(list)
+        others = TimeSlot.objects.filter(
+            period_id__in=moved_per_period,
+        ).exclude(
+            id__in=new_times,
+        ).only('period_id', 'start_time', 'end_time')
+        rule_time_slots = expand_time_slot_rules(
+            TimeSlotRule.objects.filter(period_id__in=moved_per_period),
+            min(start for start, end in new_times.values()) -
+            timedelta(days=1),
+            max(end for start, end in new_times.values()),
+        )
+        for time_slot in list(others) + rule_time_slots:
+            others_per_period[time_slot.period_id].append(time_slot)
+
+        for period_id, moved in moved_per_period.items():
+            if find_overlap(moved, others_per_period[period_id], True):
+                raise serializers.ValidationError({
+                    'non_field_errors': [_(
+                        "An existing timeslot overlaps with the provided "
+                        "start_time and end_time."
+                    )],
+                })
+
+    def save(self, **kwargs):
+        return reschedule_time_slots(
+            self.context['time_slots'],
+            self.validated_data['new_times'],
+            offset=self.validated_data.get('offset'),
+            custom_message=self.validated_data.get('custom_message'),
+            history_user=kwargs.get('history_user'),
+        )
+
+
+class AttendanceSerializer(serializers.Serializer):
+    reservation = serializers.IntegerField(
+        help_text=_("ID of an active reservation of the timeslot."),
+    )
+    is_present = serializers.BooleanField()
 
 
 class ReservationSerializer(serializers.HyperlinkedModelSerializer):
@@ -737,3 +1121,11 @@ class ReservationSerializer(serializers.HyperlinkedModelSerializer):
                 'help_text': _("Whether the reservation is active or not."),
             },
         }
+
+
+class WorkplaceOccupancySerializer(serializers.HyperlinkedModelSerializer):
+    id = serializers.ReadOnlyField()
+
+    class Meta:
+        model = WorkplaceOccupancy
+        fields = '__all__'
@@ -0,0 +1,777 @@
+from collections import Counter, OrderedDict, defaultdict
+from datetime import datetime, time, timedelta
+from itertools import chain
+from operator import attrgetter
+
+import pytz
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import models, transaction
+from django.db.models.functions import ExtractHour, TruncDay
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from blitz_api.services import (bulk_history_update, render_notification,
+                                send_notifications)
+
+from .exceptions import BookingError
+from .models import (Period, Workplace, WorkplaceOccupancy, TimeSlot,
+                     TimeSlotRule, Reservation)
+
+User = get_user_model()
+
+# Number of objects inserted per query when cloning periods
+CLONE_BATCH_SIZE = 500
+
+# Number of rows inserted per query when refreshing workplace occupancies
+OCCUPANCY_BATCH_SIZE = 500
+
+# Counters of WorkplaceOccupancy with the reservations they count
+OCCUPANCY_COUNTERS = (
+    ('reservations', models.Q()),
+    ('active_reservations', models.Q(reservations__is_active=True)),
+    ('canceled_by_user', models.Q(
+        reservations__is_active=False,
+        reservations__cancelation_reason='U',
+    )),
+    ('canceled_timeslot_deleted', models.Q(
+        reservations__is_active=False,
+        reservations__cancelation_reason='TD',
+    )),
+    ('canceled_timeslot_modified', models.Q(
+        reservations__is_active=False,
+        reservations__cancelation_reason='TM',
+    )),
+    ('present', models.Q(
+        reservations__is_active=True,
+        reservations__is_present=True,
+    )),
+    ('absent', models.Q(
+        reservations__is_active=True,
+        reservations__is_present=False,
+    )),
+)
+
+# Name of the attribute used to cache the volunteer access of a user for the
+# duration of a request.
+VOLUNTEER_ACCESS_ATTRIBUTE = '_volunteer_workplace_ids'
+
+
+def notify_reservation_cancelation(reservations, custom_message=None):
+    """
+    This function sends one email per affected user to notify him that some
+    of his reservations have been canceled. Every canceled timeslot of a user
+    is listed in the same email and all emails are sent through a single
+    connection.
+
+    reservations:   Iterable of canceled Reservation model instances
+    custom_message: Optional message added to every email
+
+    Returns the number of successfully sent emails.
+    """
+    timeslots_per_user = OrderedDict()
+    for reservation in reservations:
+        timeslots = timeslots_per_user.setdefault(reservation.user, [])
+        if reservation.timeslot not in timeslots:
+            timeslots.append(reservation.timeslot)
+
+    if not timeslots_per_user:
+        return 0
+
+    messages = list()
+    for user, timeslots in timeslots_per_user.items():
+        merge_data = {
+            'TIMESLOT_LIST': sorted(timeslots, key=lambda t: t.start_time),
+            'SUPPORT_EMAIL': settings.SUPPORT_EMAIL,
+            'CUSTOM_MESSAGE': custom_message,
+        }
+
+        messages.append(render_notification("cancelation", merge_data))
+
+    return send_notifications(
+        "Annulation d'un bloc de rédaction",
+        messages,
+        [user.email for user in timeslots_per_user],
+    )
+
+
+def get_volunteer_workplace_ids(user):
+    """
+    This function returns the ids of all workplaces where the user is a
+    volunteer. The (volunteer, workplace) pairs are read directly from the
+    indexed volunteers table, without joining the workplaces, and the result
+    is cached on the user instance for the rest of the request.
+
+    user:   User model instance
+
+    Returns a frozenset of workplace ids.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+
+    workplace_ids = getattr(user, VOLUNTEER_ACCESS_ATTRIBUTE, None)
+    if workplace_ids is None:
+        workplace_ids = frozenset(
+            Workplace.volunteers.through.objects.filter(
+                user_id=user.pk,
+            ).values_list('workplace_id', flat=True)
+        )
+        setattr(user, VOLUNTEER_ACCESS_ATTRIBUTE, workplace_ids)
+    return workplace_ids
+
+
+def is_workplace_volunteer(user, workplace_id):
+    """
+    This function checks if the user is a volunteer of the given workplace.
+
+    user:           User model instance
+    workplace_id:   Primary key of a workplace
+
+    Returns True if the user is a volunteer of the workplace.
+    """
+    return workplace_id in get_volunteer_workplace_ids(user)
+
+
+def clear_volunteer_access(user):
+    """
+    This function drops the cached volunteer access of a user so that it is
+    read again on next use.
+
+    user:   User model instance
+    """
+    user.__dict__.pop(VOLUNTEER_ACCESS_ATTRIBUTE, None)
+
+
+def expand_time_slot_rules(rules, start, end):
+    """
+    This function computes the occurrences of time slot rules starting within
+    a time window. Occurrences that have already been saved as TimeSlot
+    (even if deleted afterwards) are skipped.
+
+    rules:  Iterable of TimeSlotRule model instances
+    start:  Timezone-aware datetime, beginning of the window
+    end:    Timezone-aware datetime, end of the window
+
+    Returns a list of unsaved TimeSlot instances sorted by start_time.
+    """
+    rules = list(rules)
+    if not rules:
+        return list()
+
+    saved_occurrences = set(
+        TimeSlot.all_objects.filter(
+            rule__in=rules,
+            rule_occurrence__gte=start,
+            rule_occurrence__lte=end,
+        ).values_list('rule_id', 'rule_occurrence')
+    )
+
+    time_slots = list()
+    for rule in rules:
+        for start_time, end_time in rule.get_occurrences(start, end):
+            if (rule.id, start_time) not in saved_occurrences:
+                time_slots.append(rule.build_time_slot(start_time, end_time))
+
+    return sorted(time_slots, key=attrgetter('start_time'))
+
+
+def materialize_time_slot(rule, rule_occurrence):
+    """
+    This function saves an occurrence of a time slot rule as a TimeSlot so
+    that it can be booked or modified like any other time slot. Nothing is
+    created if the occurrence has already been saved.
+
+    rule:               TimeSlotRule model instance
+    rule_occurrence:    Timezone-aware start time of the occurrence
+
+    Returns the TimeSlot instance or None if rule_occurrence is not an
+    occurrence of the rule or if its time slot has been deleted.
+    """
+    occurrences = dict(rule.get_occurrences(rule_occurrence, rule_occurrence))
+    if rule_occurrence not in occurrences:
+        return None
+
+    time_slot = rule.build_time_slot(
+        rule_occurrence,
+        occurrences[rule_occurrence],
+    )
+    # The unique constraint on (rule, rule_occurrence) prevents duplicates
+    # when an occurrence is saved concurrently.
+    time_slot, created = TimeSlot.all_objects.get_or_create(
+        rule=rule,
+        rule_occurrence=rule_occurrence,
+        defaults={
+            'name': time_slot.name,
+            'period': time_slot.period,
+            'price': time_slot.price,
+            'start_time': time_slot.start_time,
+            'end_time': time_slot.end_time,
+        },
+    )
+
+    if time_slot.deleted:
+        return None
+    return time_slot
+
+
+def find_overlap(time_slots, other_time_slots, exclusive=False):
+    """
+    This function looks for a time slot overlapping a time slot of another
+    list. Overlaps between time slots of other_time_slots are ignored, as
+    well as overlaps between time_slots unless exclusive is set.
+
+    time_slots:         Iterable of objects with start_time and end_time
+    other_time_slots:   Iterable of objects with start_time and end_time
+    exclusive:          Also look for overlaps between time_slots
+
+    Returns a tuple of both overlapping time slots or None.
+    """
+    tagged = sorted(
+        [(time_slot, 0) for time_slot in time_slots] +
+        [(time_slot, 1) for time_slot in other_time_slots],
+        key=lambda item: item[0].start_time,
+    )
+
+    # Sweep in start_time order while keeping the time slot ending last
+    latest = None
+    for time_slot, tag in tagged:
+        if latest is not None and time_slot.start_time < latest[0].end_time:
+            if tag != latest[1] or exclusive and tag == 0:
+                return latest[0], time_slot
+        if latest is None or time_slot.end_time > latest[0].end_time:
+            latest = (time_slot, tag)
+
+    return None
+
+
+def book_time_slots(user, time_slot_ids):
+    """
+    This function reserves time slots for a user with one ticket per time
+    slot. Requested time slots with their workplace, their active
+    reservations count and the active reservations of the user are loaded
+    in three queries, then overlaps are found with a single sweep over all
+    time slots sorted by start time (see find_overlap). Reservations are
+    inserted in bulk.
+    Must be called inside a transaction since the user is saved once
+    everything is validated.
+
+    user:           User model instance
+    time_slot_ids:  Iterable of TimeSlot ids, checked in that order
+
+    Raises BookingError if a time slot can't be booked.
+    Returns the list of created reservations.
+    """
+    time_slot_ids = list(time_slot_ids)
+    time_slots = TimeSlot.objects.filter(
+        pk__in=time_slot_ids,
+    ).select_related('period__workplace').in_bulk()
+    reserved = dict(
+        Reservation.objects.filter(
+            timeslot_id__in=time_slot_ids,
+            is_active=True,
+        ).values('timeslot_id').annotate(
+            count=models.Count('id'),
+        ).values_list('timeslot_id', 'count')
+    )
+    existing_time_slots = [
+        reservation.timeslot for reservation in Reservation.objects.filter(
+            user=user,
+            is_active=True,
+        ).select_related('timeslot')
+    ]
+    booked_ids = set(time_slot.id for time_slot in existing_time_slots)
+
+    requested_time_slots = list()
+    tickets = user.tickets
+    for time_slot_id in time_slot_ids:
+        time_slot = time_slots.get(time_slot_id)
+        if time_slot is None:
+            raise BookingError(_("The requested timeslot does not exist."))
+        if time_slot.billing_price > tickets:
+            raise BookingError(_(
+                "You don't have enough tickets to make this reservation."
+            ))
+        # A time slot requested twice is rejected like an existing
+        # reservation.
+        if time_slot.id in booked_ids:
+            raise BookingError(_(
+                "You already are registered to this timeslot: {0}."
+            ).format(str(time_slot)))
+        booked_ids.add(time_slot.id)
+        workplace = time_slot.period.workplace
+        if not (workplace and workplace.seats - reserved.get(
+                time_slot.id, 0) > 0):
+            raise BookingError(_(
+                "There are no places left in the requested timeslot."
+            ))
+        # OrderLine's quantity and TimeSlot's price will be used in the
+        # future if we want to allow multiple reservations of the same
+        # timeslot.
+        tickets -= 1
+        requested_time_slots.append(time_slot)
+
+    # Overlaps between existing reservations are ignored
+    if find_overlap(requested_time_slots, existing_time_slots, True):
+        raise BookingError(_(
+            "This reservation overlaps with another active "
+            "reservations for this user."
+        ))
+
+    reservations = Reservation.objects.bulk_create([
+        Reservation(user=user, timeslot=time_slot, is_active=True)
+        for time_slot in requested_time_slots
+    ])
+
+    # Primary keys are not set by bulk_create on every database, so the new
+    # reservations are read back to create their history.
+    created_reservations = list(
+        Reservation.objects.filter(
+            user=user,
+            timeslot_id__in=time_slot_ids,
+            is_active=True,
+        )
+    )
+    for reservation in created_reservations:
+        reservation._history_user = user
+    Reservation.history.bulk_history_create(created_reservations)
+
+    user.tickets = tickets
+    user.save()
+
+    return reservations
+
+
+def update_attendance(reservations, attendances, history_user=None):
+    """
+    This function marks users as present or absent for their reservations.
+    Only reservations whose attendance changes are updated, with one UPDATE
+    per value of is_present and one bulk insert of history records.
+
+    reservations:   Iterable of Reservation model instances
+    attendances:    Dict of is_present values by reservation id
+    history_user:   User that made the changes
+
+    Returns the list of modified reservations.
+    """
+    changed_reservations = [
+        reservation for reservation in reservations
+        if reservation.is_present != attendances[reservation.id]
+    ]
+
+    with transaction.atomic():
+        for is_present in (True, False):
+            reservation_ids = [
+                reservation.id for reservation in changed_reservations
+                if attendances[reservation.id] == is_present
+            ]
+            if reservation_ids:
+                Reservation.objects.filter(
+                    id__in=reservation_ids,
+                ).update(is_present=is_present)
+
+        for reservation in changed_reservations:
+            reservation.is_present = attendances[reservation.id]
+
+        bulk_history_update(changed_reservations, history_user)
+
+    return changed_reservations
+
+
+def cancel_reservations(reservations, cancelation_reason, history_user=None):
+    """
+    This function cancels reservations and refunds one ticket per canceled
+    reservation to its user. Reservations are canceled with a single UPDATE
+    and users with the same number of refunded tickets are updated together.
+
+    reservations:       Iterable of Reservation model instances
+    cancelation_reason: One of Reservation.CANCELATION_REASON
+    history_user:       User that made the changes
+
+    Returns the list of canceled reservations.
+    """
+    reservations = [
+        reservation for reservation in reservations if reservation.is_active
+    ]
+    if not reservations:
+        return reservations
+
+    cancelation_date = timezone.now()
+
+    tickets_per_user = Counter(
+        reservation.user_id for reservation in reservations
+    )
+    users_per_refund = defaultdict(list)
+    for user_id, tickets in tickets_per_user.items():
+        users_per_refund[tickets].append(user_id)
+
+    with transaction.atomic():
+        Reservation.objects.filter(
+            id__in=[reservation.id for reservation in reservations],
+        ).update(
+            is_active=False,
+            cancelation_reason=cancelation_reason,
+            cancelation_date=cancelation_date,
+        )
+
+        for tickets, user_ids in users_per_refund.items():
+            User.objects.filter(
+                id__in=user_ids,
+            ).update(tickets=models.F('tickets') + tickets)
+
+        for reservation in reservations:
+            reservation.is_active = False
+            reservation.cancelation_reason = cancelation_reason
+            reservation.cancelation_date = cancelation_date
+
+        bulk_history_update(reservations, history_user)
+
+    return reservations
+
+
+def reschedule_time_slots(time_slots, new_times, offset=None,
+                          custom_message=None, history_user=None):
+    """
+    This function moves multiple time slots at once. Active reservations of
+    moved time slots are canceled, their tickets refunded and a single email
+    is sent to each affected user.
+
+    time_slots:     Iterable of TimeSlot model instances
+    new_times:      Dict of (start_time, end_time) tuples by time slot id
+    offset:         Timedelta applied to every time slot, if the time slots
+                    are shifted (new_times must match)
+    custom_message: Optional message added to every email
+    history_user:   User that made the changes
+
+    Returns the list of canceled reservations.
+    """
+    time_slots = [
+        time_slot for time_slot in time_slots
+        if new_times[time_slot.id] != (time_slot.start_time,
+                                       time_slot.end_time)
+    ]
+    if not time_slots:
+        return list()
+
+    time_slot_ids = [time_slot.id for time_slot in time_slots]
+
+    with transaction.atomic():
+        # Reservations are loaded before the update so that emails list the
+        # canceled times.
+        reservations = list(Reservation.objects.filter(
+            timeslot_id__in=time_slot_ids,
+            is_active=True,
+        ).select_related('user', 'timeslot'))
+
+        queryset = TimeSlot.objects.filter(id__in=time_slot_ids)
+        if offset is not None:
+            queryset.update(
+                start_time=models.F('start_time') + offset,
+                end_time=models.F('end_time') + offset,
+            )
+        else:
+            queryset.update(**{
+                field: models.Case(
+                    *[
+                        models.When(
+                            id=time_slot_id,
+                            then=models.Value(times[index]),
+                        )
+                        for time_slot_id, times in new_times.items()
+                        if time_slot_id in time_slot_ids
+                    ],
+                    output_field=models.DateTimeField(),
+                )
+                for index, field in enumerate(['start_time', 'end_time'])
+            })
+
+        for time_slot in time_slots:
+            time_slot.start_time, time_slot.end_time = new_times[time_slot.id]
+
+        bulk_history_update(time_slots, history_user)
+
+        cancel_reservations(reservations, 'TM', history_user)
+
+    # Send a single email per affected user
+    notify_reservation_cancelation(reservations, custom_message)
+
+    return reservations
+
+
+def copy_field_values(instance, exclude=()):
+    """
+    This function returns the values of the concrete fields of an instance,
+    translations included, to create a copy of it.
+
+    instance:   Model instance to copy
+    exclude:    Names of the fields that must not be copied
+
+    Returns a dict of values by field attname (ie: period_id).
+    """
+    return {
+        field.attname: instance.__dict__[field.attname]
+        for field in instance._meta.concrete_fields
+        if not field.primary_key and field.name not in exclude
+    }
+
+
+def get_workplace_timezone(workplace):
+    """
+    Use workplace's timezone if possible. Otherwise use Montreal timezone.
+    """
+    if workplace and workplace.timezone:
+        return pytz.timezone(workplace.timezone)
+    return pytz.timezone('America/Montreal')
+
+
+def get_period_timezone(period):
+    """
+    Use workplace's timezone if possible. Otherwise use Montreal timezone.
+    """
+    return get_workplace_timezone(period.workplace)
+
+
+def shift_datetime(value, days, tz):
+    """
+    This function shifts a datetime by whole days while keeping its local
+    time in the given timezone, even across DST changes.
+
+    value:  Timezone-aware datetime
+    days:   Timedelta of whole days
+    tz:     pytz timezone in which the local time is kept
+
+    Returns a timezone-aware datetime.
+    """
+    local_value = value.astimezone(tz).replace(tzinfo=None)
+    return tz.localize(local_value + days)
+
+
+def clone_period(period, start_date, is_active=False):
+    """
+    This function copies a period with its timeslots and timeslot rules to a
+    new start date. Everything is shifted by whole days in the workplace's
+    timezone so that local times are kept across DST changes. Timeslots
+    saved from a rule are not copied since the copied rule provides them.
+
+    period:     Period model instance to copy
+    start_date: Date of the beginning of the new period
+    is_active:  Activation of the new period
+
+    Returns the new Period model instance.
+    """
+    tz = get_period_timezone(period)
+    days = start_date - period.start_date.astimezone(tz).date()
+
+    with transaction.atomic():
+        new_period = type(period)(**copy_field_values(period, ('deleted', )))
+        new_period.start_date = shift_datetime(period.start_date, days, tz)
+        new_period.end_date = shift_datetime(period.end_date, days, tz)
+        new_period.is_active = is_active
+        new_period.save()
+
+        time_slots = [
+            TimeSlot(**dict(
+                copy_field_values(
+                    time_slot,
+                    ('deleted', 'period', 'rule', 'rule_occurrence'),
+                ),
+                period_id=new_period.id,
+                start_time=shift_datetime(time_slot.start_time, days, tz),
+                end_time=shift_datetime(time_slot.end_time, days, tz),
+            ))
+            for time_slot in period.time_slots.filter(rule__isnull=True)
+        ]
+        TimeSlot.objects.bulk_create(time_slots, batch_size=CLONE_BATCH_SIZE)
+
+        rules = [
+            TimeSlotRule(**dict(
+                copy_field_values(rule, ('deleted', 'period')),
+                period_id=new_period.id,
+                start_date=rule.start_date + days,
+                end_date=rule.end_date + days,
+            ))
+            for rule in period.time_slot_rules.all()
+        ]
+        TimeSlotRule.objects.bulk_create(rules, batch_size=CLONE_BATCH_SIZE)
+
+        # Primary keys are not set by bulk_create on every database, so the
+        # new objects are read back to create their history.
+        for model in (TimeSlot, TimeSlotRule):
+            model.history.bulk_history_create(
+                model.objects.filter(period=new_period),
+                batch_size=CLONE_BATCH_SIZE,
+            )
+
+    return new_period
+
+
+def get_occupancy_changes(since):
+    """
+    This function finds the occupancies that may have changed since a date
+    from the history of reservations and time slots. Both the previous and
+    the new start time of a modified time slot are considered.
+
+    since:  Datetime of the previous refresh
+
+    Returns a dict of sets of local dates by Workplace model instance.
+    """
+    time_slot_ids = set(
+        Reservation.history.filter(
+            history_date__gt=since,
+        ).values_list('timeslot_id', flat=True)
+    )
+    time_slot_ids.update(
+        TimeSlot.history.filter(
+            history_date__gt=since,
+        ).values_list('id', flat=True)
+    )
+    if not time_slot_ids:
+        return dict()
+
+    # The state of each time slot at the previous refresh
+    previous_states = TimeSlot.history.filter(
+        id__in=time_slot_ids,
+        history_date__lte=since,
+    ).values('id').annotate(
+        last_history_id=models.Max('history_id'),
+    ).values_list('last_history_id', flat=True)
+
+    states = chain(
+        TimeSlot.all_objects.filter(
+            id__in=time_slot_ids,
+        ).values_list('period_id', 'start_time'),
+        TimeSlot.history.filter(
+            models.Q(history_date__gt=since) |
+            models.Q(history_id__in=previous_states),
+            id__in=time_slot_ids,
+        ).values_list('period_id', 'start_time'),
+    )
+
+    states = list(states)
+    periods = Period.all_objects.filter(
+        id__in=set(period_id for period_id, start_time in states),
+        workplace__isnull=False,
+    ).select_related('workplace').in_bulk()
+
+    changes = defaultdict(set)
+    for period_id, start_time in states:
+        period = periods.get(period_id)
+        if period is None:
+            continue
+        tz = get_workplace_timezone(period.workplace)
+        changes[period.workplace].add(start_time.astimezone(tz).date())
+
+    return dict(changes)
+
+
+def compute_workplace_occupancy(workplace, dates=None, refreshed=None):
+    """
+    This function aggregates the reservations of the time slots of a
+    workplace per local date and hour of their start time, in one query.
+
+    workplace:  Workplace model instance
+    dates:      Optional iterable of local dates to compute, defaults to all
+    refreshed:  Date of the refresh, defaults to now
+
+    Returns a list of unsaved WorkplaceOccupancy model instances.
+    """
+    tz = get_workplace_timezone(workplace)
+    refreshed = refreshed or timezone.now()
+
+    time_slots = TimeSlot.all_objects.filter(period__workplace=workplace)
+    if dates is not None:
+        dates = set(dates)
+        time_slots = time_slots.filter(
+            start_time__gte=tz.localize(
+                datetime.combine(min(dates), time())
+            ),
+            start_time__lt=tz.localize(
+                datetime.combine(max(dates) + timedelta(days=1), time())
+            ),
+        )
+
+    counters = {
+        name + '_count': models.Count(
+            'reservations',
+            filter=models.Q(reservations__deleted__isnull=True) & condition,
+        )
+        for name, condition in OCCUPANCY_COUNTERS
+    }
+    rows = time_slots.annotate(
+        day=TruncDay('start_time', tzinfo=tz),
+        hour=ExtractHour('start_time', tzinfo=tz),
+    ).values('day', 'hour').annotate(
+        time_slots_count=models.Count(
+            'id',
+            distinct=True,
+            filter=models.Q(deleted__isnull=True),
+        ),
+        **counters
+    ).order_by('day', 'hour')
+
+    occupancies = list()
+    for row in rows:
+        date = row['day'].date()
+        if dates is not None and date not in dates:
+            continue
+        occupancies.append(WorkplaceOccupancy(
+            workplace=workplace,
+            date=date,
+            weekday=date.weekday(),
+            hour=row['hour'],
+            time_slots=row['time_slots_count'],
+            seats=row['time_slots_count'] * workplace.seats,
+            refreshed=refreshed,
+            **{
+                name: row[name + '_count']
+                for name, condition in OCCUPANCY_COUNTERS
+            }
+        ))
+
+    return occupancies
+
+
+def refresh_workplace_occupancy(since=None):
+    """
+    This function rebuilds the occupancies that may have changed since the
+    previous refresh. Every occupancy is rebuilt when no date is provided.
+
+    since:  Optional datetime of the previous refresh
+
+    Returns the number of occupancies written.
+    """
+    # Taken before reading the history so that concurrent changes are picked
+    # up by the next refresh.
+    refreshed = timezone.now()
+
+    if since is None:
+        changes = {
+            workplace: None for workplace in Workplace.all_objects.all()
+        }
+    else:
+        changes = get_occupancy_changes(since)
+        if not changes:
+            return 0
+
+    count = 0
+    with transaction.atomic():
+        for workplace, dates in changes.items():
+            occupancies = WorkplaceOccupancy.objects.filter(
+                workplace=workplace,
+            )
+            if dates is not None:
+                occupancies = occupancies.filter(date__in=dates)
+            occupancies.delete()
+
+            new_occupancies = compute_workplace_occupancy(
+                workplace,
+                dates,
+                refreshed,
+            )
+            WorkplaceOccupancy.objects.bulk_create(
+                new_occupancies,
+                batch_size=OCCUPANCY_BATCH_SIZE,
+            )
+            count += len(new_occupancies)
+
+    return count
@@ -0,0 +1,17 @@
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from .models import Workplace
+from .services import clear_volunteer_access
+
+
+@receiver(m2m_changed, sender=Workplace.volunteers.through)
+def refresh_volunteer_access(sender, instance, action, reverse, **kwargs):
+    """
+    Drops the cached volunteer access of a user whose workplaces are modified
+    through the reverse relation (ie: user.workplaces.add(workplace)).
+    Instances modified from the workplace side are reloaded from the database
+    by each request and don't need any refresh.
+    """
+    if reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        clear_volunteer_access(instance)
@@ -5,7 +5,9 @@ from rest_framework.test import APITestCase
 from django.test import override_settings
 from django.utils import timezone
 
-from ..models import Workplace, Period
+from blitz_api.factories import UserFactory
+
+from ..models import Workplace, Period, TimeSlot, Reservation
 
 
 class PictureTests(APITestCase):
@@ -37,3 +39,48 @@ class PictureTests(APITestCase):
         )
 
         self.assertEqual(period.__str__(), "random_period")
+
+    def test_with_stats(self):
+        """
+        Ensure that periods are annotated with their statistics.
+        """
+        user = UserFactory()
+        period = Period.objects.create(
+            name="random_period",
+            workplace=self.workplace,
+            start_date=timezone.now(),
+            end_date=timezone.now() + timedelta(weeks=4),
+            price=3,
+            is_active=True,
+        )
+        time_slot = TimeSlot.objects.create(
+            period=period,
+            price=3,
+            start_time=timezone.now() + timedelta(days=1),
+            end_time=timezone.now() + timedelta(days=1, hours=4),
+        )
+        time_slot_2 = TimeSlot.objects.create(
+            period=period,
+            price=3,
+            start_time=timezone.now() + timedelta(days=2),
+            end_time=timezone.now() + timedelta(days=2, hours=4),
+        )
+        Reservation.objects.create(
+            user=user,
+            timeslot=time_slot,
+            is_active=True,
+        )
+        Reservation.objects.create(
+            user=user,
+            timeslot=time_slot_2,
+            is_active=False,
+        )
+
+        period = Period.objects.with_stats().get(pk=period.pk)
+
+        self.assertEqual(period.reservations_count, 2)
+        self.assertEqual(period.active_reservations_count, 1)
+        self.assertEqual(period.total_reservations, 1)
+        self.assertEqual(period.time_slots_count, 2)
+        self.assertEqual(period.first_time_slot, time_slot.start_time)
+        self.assertEqual(period.last_time_slot, time_slot_2.end_time)
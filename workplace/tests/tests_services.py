@@ -0,0 +1,254 @@
+import pytz
+
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core import mail
+from django.utils import timezone
+
+from rest_framework.test import APITestCase
+
+from blitz_api.factories import UserFactory
+
+from ..exceptions import BookingError
+from ..models import Workplace, Period, TimeSlot, Reservation
+from ..services import (book_time_slots, get_volunteer_workplace_ids,
+                        is_workplace_volunteer,
+                        notify_reservation_cancelation)
+
+LOCAL_TIMEZONE = pytz.timezone(settings.TIME_ZONE)
+
+
+class ServicesTests(APITestCase):
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.user2 = UserFactory()
+        self.workplace = Workplace.objects.create(
+            name="Blitz",
+            seats=40,
+            details="short_description",
+            address_line1="123 random street",
+            postal_code="123 456",
+            state_province="Random state",
+            country="Random country",
+        )
+        self.period = Period.objects.create(
+            name="random_period",
+            workplace=self.workplace,
+            start_date=timezone.now(),
+            end_date=timezone.now() + timedelta(weeks=4),
+            price=3,
+            is_active=True,
+        )
+        self.time_slot = TimeSlot.objects.create(
+            period=self.period,
+            price=3,
+            start_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 8)),
+            end_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 12)),
+        )
+        self.time_slot2 = TimeSlot.objects.create(
+            period=self.period,
+            price=3,
+            start_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 16, 8)),
+            end_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 16, 12)),
+        )
+
+    def test_notify_reservation_cancelation(self):
+        """
+        Ensure that a single email is sent to each affected user and that it
+        lists every canceled timeslot of that user.
+        """
+        reservations = [
+            Reservation.objects.create(
+                user=self.user,
+                timeslot=self.time_slot,
+                is_active=False,
+            ),
+            Reservation.objects.create(
+                user=self.user,
+                timeslot=self.time_slot2,
+                is_active=False,
+            ),
+            Reservation.objects.create(
+                user=self.user2,
+                timeslot=self.time_slot2,
+                is_active=False,
+            ),
+        ]
+
+        sent = notify_reservation_cancelation(reservations, "Sorry")
+
+        self.assertEqual(sent, 2)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[0].to, [self.user.email])
+        self.assertEqual(mail.outbox[1].to, [self.user2.email])
+        # Both canceled timeslots are listed in the first user's email
+        self.assertEqual(mail.outbox[0].body.count("Heure de début"), 2)
+        self.assertEqual(mail.outbox[1].body.count("Heure de début"), 1)
+        self.assertIn("Sorry", mail.outbox[0].body)
+        self.assertEqual(
+            mail.outbox[0].alternatives[0][1],
+            "text/html",
+        )
+
+    def test_notify_reservation_cancelation_empty(self):
+        """
+        Ensure that nothing is sent when there are no canceled reservations.
+        """
+        sent = notify_reservation_cancelation([])
+
+        self.assertEqual(sent, 0)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_get_volunteer_workplace_ids(self):
+        """
+        Ensure that the workplaces of a volunteer are listed and cached on the
+        user instance.
+        """
+        self.workplace.volunteers.add(self.user)
+
+        self.assertEqual(
+            get_volunteer_workplace_ids(self.user),
+            frozenset([self.workplace.id]),
+        )
+
+        with self.assertNumQueries(0):
+            self.assertTrue(
+                is_workplace_volunteer(self.user, self.workplace.id)
+            )
+            self.assertFalse(
+                is_workplace_volunteer(self.user, self.workplace.id + 1)
+            )
+
+    def test_get_volunteer_workplace_ids_refresh(self):
+        """
+        Ensure that the cached workplaces of a volunteer are refreshed when
+        its workplaces change.
+        """
+        self.assertEqual(get_volunteer_workplace_ids(self.user), frozenset())
+
+        self.user.workplaces.add(self.workplace)
+
+        self.assertEqual(
+            get_volunteer_workplace_ids(self.user),
+            frozenset([self.workplace.id]),
+        )
+
+        self.user.workplaces.clear()
+
+        self.assertEqual(get_volunteer_workplace_ids(self.user), frozenset())
+
+    def test_book_time_slots(self):
+        """
+        Ensure that time slots are booked with one ticket each after being
+        validated in three queries.
+        """
+        self.user.tickets = 10
+        self.user.save()
+
+        with self.assertNumQueries(3):
+            with self.assertRaises(BookingError):
+                book_time_slots(
+                    self.user,
+                    [self.time_slot.id, self.time_slot2.id, 0],
+                )
+
+        reservations = book_time_slots(
+            self.user,
+            [self.time_slot.id, self.time_slot2.id],
+        )
+
+        self.assertEqual(len(reservations), 2)
+        self.assertEqual(
+            set(
+                Reservation.objects.filter(
+                    user=self.user,
+                    is_active=True,
+                ).values_list('timeslot_id', flat=True)
+            ),
+            {self.time_slot.id, self.time_slot2.id},
+        )
+        self.assertEqual(
+            Reservation.history.filter(
+                user_id=self.user.id,
+                history_user=self.user,
+            ).count(),
+            2,
+        )
+
+        self.user.refresh_from_db()
+
+        self.assertEqual(self.user.tickets, 8)
+
+    def test_book_time_slots_overlap(self):
+        """
+        Ensure that time slots overlapping each other or an active
+        reservation of the user are not booked.
+        """
+        self.user.tickets = 10
+        self.user.save()
+        time_slot = TimeSlot.objects.create(
+            period=self.period,
+            price=3,
+            start_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 11)),
+            end_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 14)),
+        )
+
+        with self.assertRaises(BookingError):
+            book_time_slots(self.user, [self.time_slot.id, time_slot.id])
+
+        Reservation.objects.create(
+            user=self.user,
+            timeslot=self.time_slot,
+            is_active=True,
+        )
+
+        with self.assertRaises(BookingError):
+            book_time_slots(self.user, [self.time_slot2.id, time_slot.id])
+
+        self.user.refresh_from_db()
+
+        self.assertEqual(self.user.tickets, 10)
+        self.assertFalse(
+            Reservation.objects.filter(timeslot=self.time_slot2).exists()
+        )
+
+    def test_book_time_slots_duplicated(self):
+        """
+        Ensure that a time slot requested twice is rejected as already
+        registered.
+        """
+        self.user.tickets = 10
+        self.user.save()
+
+        with self.assertRaises(BookingError) as context:
+            book_time_slots(self.user, [self.time_slot.id, self.time_slot.id])
+
+        self.assertTrue(str(context.exception).startswith(
+            "You already are registered to this timeslot:"
+        ))
+        self.assertFalse(
+            Reservation.objects.filter(user=self.user).exists()
+        )
+
+    def test_book_time_slots_no_place_left(self):
+        """
+        Ensure that time slots without remaining seats are not booked.
+        """
+        self.user.tickets = 10
+        self.user.save()
+        self.workplace.seats = 1
+        self.workplace.save()
+        Reservation.objects.create(
+            user=self.user2,
+            timeslot=self.time_slot2,
+            is_active=True,
+        )
+
+        with self.assertRaises(BookingError):
+            book_time_slots(self.user, [self.time_slot.id, self.time_slot2.id])
+
+        self.assertFalse(
+            Reservation.objects.filter(user=self.user).exists()
+        )
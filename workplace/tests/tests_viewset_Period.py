@@ -589,7 +589,8 @@ class PeriodTests(APITestCase):
         self.assertFalse(self.reservation.is_active)
         self.assertEqual(self.reservation.cancelation_reason, 'TD')
         self.assertTrue(self.reservation.cancelation_date)
-        self.assertEqual(len(mail.outbox), 2)
+        # A single email is sent to the user for both reservations
+        self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(self.user.tickets, 3)
         self.assertEqual(self.admin.tickets, 1)
 
@@ -849,3 +850,146 @@ class PeriodTests(APITestCase):
         self.assertEqual(json.loads(response.content), content)
 
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_filter_stats(self):
+        """
+        Ensure we can filter periods on their reservations statistics.
+        """
+        self.client.force_authenticate(user=self.admin)
+
+        response = self.client.get(
+            reverse('period-list'),
+            {'active_reservations_count__gte': 1},
+            format='json',
+        )
+
+        data = json.loads(response.content)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['results'][0]['id'], self.period_active.id)
+        self.assertEqual(data['results'][0]['total_reservations'], 1)
+
+    def test_list_ordering_stats(self):
+        """
+        Ensure we can order periods on their timeslots statistics.
+        """
+        self.client.force_authenticate(user=self.admin)
+
+        response = self.client.get(
+            reverse('period-list'),
+            {'ordering': '-time_slots_count'},
+            format='json',
+        )
+
+        data = json.loads(response.content)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [period['id'] for period in data['results']],
+            [self.period_active.id, self.period.id],
+        )
+
+    def test_clone(self):
+        """
+        Ensure that an admin can copy a period with its timeslots to a new
+        start date, keeping local times across DST and translations.
+        """
+        period = Period.objects.create(
+            name_fr="Période d'hiver",
+            name_en="Winter period",
+            workplace=self.workplace,
+            start_date=LOCAL_TIMEZONE.localize(datetime(2130, 1, 1)),
+            end_date=LOCAL_TIMEZONE.localize(datetime(2130, 3, 1)),
+            price=3,
+            is_active=False,
+        )
+        TimeSlot.objects.bulk_create([
+            TimeSlot(
+                name_fr="Matin",
+                name_en="Morning",
+                period=period,
+                price=2,
+                start_time=LOCAL_TIMEZONE.localize(
+                    datetime(2130, 1, 1, 8) + timedelta(days=day)
+                ),
+                end_time=LOCAL_TIMEZONE.localize(
+                    datetime(2130, 1, 1, 12) + timedelta(days=day)
+                ),
+            )
+            for day in range(59)
+        ])
+
+        self.client.force_authenticate(user=self.admin)
+
+        response = self.client.post(
+            reverse('period-clone', args=[period.id]),
+            {'start_date': '2130-06-01'},
+            format='json',
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_201_CREATED,
+            response.content,
+        )
+
+        new_period = Period.objects.get(id=json.loads(response.content)['id'])
+        new_time_slots = new_period.time_slots.order_by('start_time')
+
+        self.assertEqual(new_period.name_fr, "Période d'hiver")
+        self.assertEqual(new_period.name_en, "Winter period")
+        self.assertFalse(new_period.is_active)
+        self.assertEqual(
+            new_period.start_date,
+            LOCAL_TIMEZONE.localize(datetime(2130, 6, 1)),
+        )
+        self.assertEqual(new_time_slots.count(), 59)
+        self.assertEqual(new_time_slots[0].name_en, "Morning")
+        self.assertEqual(new_time_slots[0].price, 2)
+        for time_slot in new_time_slots:
+            local_start = time_slot.start_time.astimezone(LOCAL_TIMEZONE)
+            local_end = time_slot.end_time.astimezone(LOCAL_TIMEZONE)
+            self.assertEqual(local_start.hour, 8)
+            self.assertEqual(local_end.hour, 12)
+        self.assertEqual(
+            new_time_slots[0].start_time,
+            LOCAL_TIMEZONE.localize(datetime(2130, 6, 1, 8)),
+        )
+        self.assertEqual(new_time_slots[0].history.count(), 1)
+
+    def test_clone_overlapping_active_period(self):
+        """
+        Ensure that an active copy can't overlap another active period of the
+        same workplace.
+        """
+        self.client.force_authenticate(user=self.admin)
+
+        response = self.client.post(
+            reverse('period-clone', args=[self.period.id]),
+            {
+                'start_date': self.period_active.start_date.date(),
+                'is_active': True,
+            },
+            format='json',
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_400_BAD_REQUEST,
+            response.content,
+        )
+
+    def test_clone_without_permission(self):
+        """
+        Ensure that a user can't copy a period.
+        """
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.post(
+            reverse('period-clone', args=[self.period_active.id]),
+            {'start_date': '2130-06-01'},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -13,7 +13,7 @@ from rest_framework.test import APIClient, APITestCase
 
 from blitz_api.factories import UserFactory, AdminFactory
 from blitz_api.services import remove_translation_fields
-from ..models import Period, TimeSlot, Workplace, Reservation
+from ..models import Period, TimeSlot, TimeSlotRule, Workplace, Reservation
 
 User = get_user_model()
 
@@ -883,7 +883,10 @@ class TimeSlotTests(APITestCase):
             "EMAIL_SERVICE": True,
         }
     )
-    @mock.patch('blitz_api.services.EmailMessage.send', return_value=0)
+    @mock.patch(
+        'django.core.mail.backends.locmem.EmailBackend.send_messages',
+        return_value=0,
+    )
     def test_update_timeslot_failed_emails(self, send):
         """
         Ensure we can partially update a timeslot, even if we were unable to
@@ -1025,7 +1028,8 @@ class TimeSlotTests(APITestCase):
         self.assertFalse(self.reservation.is_active)
         self.assertEqual(self.reservation.cancelation_reason, 'TD')
         self.assertTrue(self.reservation.cancelation_date)
-        self.assertEqual(len(mail.outbox), 3)
+        # A single email is sent to each affected user
+        self.assertEqual(len(mail.outbox), 2)
         self.assertEqual(self.user.tickets, 3)
         self.assertEqual(self.admin.tickets, 2)
 
@@ -1717,6 +1721,50 @@ class TimeSlotTests(APITestCase):
 
         self.assertEqual(json.loads(response.content), content)
 
+    def test_batch_create_overlapping_rule(self):
+        """
+        Ensure that an admin can't batch create timeslots overlapping
+        occurrences of a rule that are not saved as timeslots.
+        """
+        self.client.force_authenticate(user=self.admin)
+
+        TimeSlotRule.objects.create(
+            period=self.period_active,
+            start_date=date(2130, 3, 1),
+            end_date=date(2130, 3, 31),
+            start_time=time(8),
+            end_time=time(12),
+            weekdays="0",
+        )
+
+        data = {
+            "period": reverse(
+                'period-detail', args=[self.period_active.id]
+            ),
+            "name": "test",
+            "start_date": "2130-03-06",
+            "end_date": "2130-03-06",
+            "start_time": "11:00:00",
+            "end_time": "13:00:00",
+            "weekdays": [0],
+        }
+
+        response = self.client.post(
+            reverse('timeslot-batch-create'),
+            data,
+            format='json',
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_400_BAD_REQUEST,
+            response.content,
+        )
+        self.assertFalse(TimeSlot.objects.filter(
+            period=self.period_active,
+            start_time__date=date(2130, 3, 6),
+        ).exists())
+
     def test_batch_create_bad_dates(self):
         """
         Ensure that an admin can't batch create when dates do not respect
@@ -1752,3 +1800,322 @@ class TimeSlotTests(APITestCase):
         self.assertEqual(json.loads(response.content), content)
 
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_attendance(self):
+        """
+        Ensure that a volunteer can mark attendance of multiple reservations
+        of a timeslot at once.
+        """
+        volunteer = UserFactory()
+        self.workplace2.volunteers.add(volunteer)
+        reservation = Reservation.objects.create(
+            user=self.user,
+            timeslot=self.time_slot_active,
+            is_active=True,
+        )
+        reservation_present = Reservation.objects.create(
+            user=self.admin,
+            timeslot=self.time_slot_active,
+            is_active=True,
+            is_present=True,
+        )
+
+        self.client.force_authenticate(user=volunteer)
+
+        data = [
+            {'reservation': reservation.id, 'is_present': True},
+            {'reservation': reservation_present.id, 'is_present': False},
+        ]
+
+        response = self.client.post(
+            reverse('timeslot-attendance', args=[self.time_slot_active.id]),
+            data,
+            format='json',
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK,
+            response.content,
+        )
+        self.assertEqual(json.loads(response.content), data)
+
+        reservation.refresh_from_db()
+        reservation_present.refresh_from_db()
+
+        self.assertTrue(reservation.is_present)
+        self.assertFalse(reservation_present.is_present)
+
+        history = reservation.history.first()
+
+        self.assertEqual(history.history_type, '~')
+        self.assertEqual(history.history_user, volunteer)
+        self.assertTrue(history.is_present)
+
+    def test_attendance_unknown_reservation(self):
+        """
+        Ensure that attendance can only be marked for active reservations of
+        the timeslot.
+        """
+        reservation = Reservation.objects.create(
+            user=self.user,
+            timeslot=self.time_slot_active,
+            is_active=False,
+        )
+
+        self.client.force_authenticate(user=self.admin)
+
+        data = [
+            {'reservation': reservation.id, 'is_present': True},
+            {'reservation': self.reservation.id, 'is_present': True},
+        ]
+
+        response = self.client.post(
+            reverse('timeslot-attendance', args=[self.time_slot_active.id]),
+            data,
+            format='json',
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_400_BAD_REQUEST,
+            response.content,
+        )
+
+        content = {
+            'reservation': [
+                'No active reservation of this timeslot matches the '
+                'following IDs: {0}, {1}.'.format(
+                    *sorted([reservation.id, self.reservation.id])
+                )
+            ]
+        }
+
+        self.assertEqual(json.loads(response.content), content)
+        self.assertFalse(
+            Reservation.objects.filter(is_present=True).exists()
+        )
+
+    def test_attendance_not_volunteer(self):
+        """
+        Ensure that a user that is not a volunteer of the workplace can't mark
+        attendance.
+        """
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.post(
+            reverse('timeslot-attendance', args=[self.time_slot_active.id]),
+            [],
+            format='json',
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_403_FORBIDDEN,
+            response.content,
+        )
+
+    def test_reschedule_offset(self):
+        """
+        Ensure that an admin can shift timeslots, canceling and refunding
+        affected reservations with one email per user.
+        """
+        self.client.force_authenticate(user=self.admin)
+
+        tickets = User.objects.get(id=self.user.id).tickets
+
+        data = {
+            'offset': '01:00:00',
+            'force_update': True,
+        }
+
+        response = self.client.post(
+            reverse('timeslot-reschedule') + '?period=' + str(self.period.id),
+            data,
+            format='json',
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK,
+            response.content,
+        )
+        self.assertEqual(
+            json.loads(response.content),
+            {'time_slots': 1, 'reservations_canceled': 2},
+        )
+
+        self.time_slot.refresh_from_db()
+        self.reservation.refresh_from_db()
+
+        self.assertEqual(
+            self.time_slot.start_time,
+            LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 9)),
+        )
+        self.assertEqual(
+            self.time_slot.end_time,
+            LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 13)),
+        )
+        self.assertFalse(self.reservation.is_active)
+        self.assertEqual(self.reservation.cancelation_reason, 'TM')
+        self.assertEqual(
+            User.objects.get(id=self.user.id).tickets,
+            tickets + 1,
+        )
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_reschedule_window(self):
+        """
+        Ensure that an admin can move timeslots to a new local time window.
+        """
+        self.client.force_authenticate(user=self.admin)
+
+        data = {
+            'start_time': '13:00:00',
+            'end_time': '17:00:00',
+        }
+
+        response = self.client.post(
+            reverse('timeslot-reschedule') +
+            '?period=' + str(self.period_active.id),
+            data,
+            format='json',
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK,
+            response.content,
+        )
+
+        self.time_slot_active.refresh_from_db()
+
+        self.assertEqual(
+            self.time_slot_active.start_time,
+            LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 13)),
+        )
+        self.assertEqual(
+            self.time_slot_active.end_time,
+            LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 17)),
+        )
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_reschedule_without_force_update(self):
+        """
+        Ensure that force_update is required to move timeslots with active
+        reservations.
+        """
+        self.client.force_authenticate(user=self.admin)
+
+        response = self.client.post(
+            reverse('timeslot-reschedule') + '?period=' + str(self.period.id),
+            {'offset': '01:00:00'},
+            format='json',
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_400_BAD_REQUEST,
+            response.content,
+        )
+
+        self.time_slot.refresh_from_db()
+
+        self.assertEqual(
+            self.time_slot.start_time,
+            LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 8)),
+        )
+
+    def test_reschedule_overlapping(self):
+        """
+        Ensure that moved timeslots can't overlap other timeslots.
+        """
+        TimeSlot.objects.create(
+            period=self.period_active,
+            price=3,
+            start_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 8)),
+            end_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 12)),
+        )
+
+        self.client.force_authenticate(user=self.admin)
+
+        response = self.client.post(
+            reverse('timeslot-reschedule') +
+            '?start_time__gte=' + LOCAL_TIMEZONE.localize(
+                datetime(2130, 1, 15, 18)
+            ).isoformat().replace('+', '%2B'),
+            {'start_time': '11:00:00', 'end_time': '13:00:00'},
+            format='json',
+        )
+
+        content = {
+            'non_field_errors': [
+                'An existing timeslot overlaps with the provided start_time '
+                'and end_time.'
+            ]
+        }
+
+        self.assertEqual(json.loads(response.content), content)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_reschedule_overlapping_moved(self):
+        """
+        Ensure that moved timeslots can't overlap each other.
+        """
+        TimeSlot.objects.create(
+            period=self.period_active,
+            price=3,
+            start_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 6)),
+            end_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 7)),
+        )
+
+        self.client.force_authenticate(user=self.admin)
+
+        response = self.client.post(
+            reverse('timeslot-reschedule') +
+            '?period=' + str(self.period_active.id),
+            {'start_time': '13:00:00', 'end_time': '17:00:00'},
+            format='json',
+        )
+
+        content = {
+            'non_field_errors': [
+                'An existing timeslot overlaps with the provided start_time '
+                'and end_time.'
+            ]
+        }
+
+        self.assertEqual(json.loads(response.content), content)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_reschedule_without_filter(self):
+        """
+        Ensure that timeslots to move must be filtered.
+        """
+        self.client.force_authenticate(user=self.admin)
+
+        response = self.client.post(
+            reverse('timeslot-reschedule'),
+            {'offset': '01:00:00'},
+            format='json',
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_400_BAD_REQUEST,
+            response.content,
+        )
+
+    def test_reschedule_without_permission(self):
+        """
+        Ensure that a user can't move timeslots.
+        """
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.post(
+            reverse('timeslot-reschedule') + '?period=' + str(self.period.id),
+            {'offset': '01:00:00'},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,302 @@
+import json
+from datetime import datetime, date, time
+
+import pytz
+from django.conf import settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from blitz_api.factories import UserFactory, AdminFactory
+from ..models import Period, TimeSlot, TimeSlotRule, Workplace
+
+LOCAL_TIMEZONE = pytz.timezone(settings.TIME_ZONE)
+
+
+class TimeSlotRuleTests(APITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TimeSlotRuleTests, cls).setUpClass()
+        cls.client = APIClient()
+        cls.user = UserFactory()
+        cls.admin = AdminFactory()
+        cls.workplace = Workplace.objects.create(
+            name="Blitz",
+            seats=40,
+            details="short_description",
+            address_line1="123 random street",
+            postal_code="123 456",
+            state_province="Random state",
+            country="Random country",
+            timezone="America/Montreal",
+        )
+        cls.period = Period.objects.create(
+            name="random_period",
+            workplace=cls.workplace,
+            start_date=LOCAL_TIMEZONE.localize(datetime(2130, 1, 1, 1)),
+            end_date=LOCAL_TIMEZONE.localize(datetime(2130, 12, 12, 12)),
+            price=3,
+            is_active=True,
+        )
+        # Every Monday and Wednesday of March 2130
+        cls.rule = TimeSlotRule.objects.create(
+            name="morning",
+            period=cls.period,
+            start_date=date(2130, 3, 1),
+            end_date=date(2130, 3, 31),
+            start_time=time(8),
+            end_time=time(12),
+            weekdays="0,2",
+        )
+        cls.time_slot = TimeSlot.objects.create(
+            period=cls.period,
+            price=3,
+            start_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 8)),
+            end_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 12)),
+        )
+
+    def setUp(self) -> None:
+        self.maxDiff = None
+
+    def test_get_occurrences(self):
+        """
+        Ensure that occurrences keep the same local time across DST.
+        """
+        occurrences = list(self.rule.get_occurrences())
+
+        self.assertEqual(len(occurrences), 9)
+
+        for start_time, end_time in occurrences:
+            local_start = start_time.astimezone(LOCAL_TIMEZONE)
+            local_end = end_time.astimezone(LOCAL_TIMEZONE)
+            self.assertIn(local_start.weekday(), [0, 2])
+            self.assertEqual(local_start.time(), time(8))
+            self.assertEqual(local_end.time(), time(12))
+
+    def test_create(self):
+        """
+        Ensure that an admin can create a rule without creating timeslots.
+        """
+        self.client.force_authenticate(user=self.admin)
+
+        data = {
+            'period': reverse('period-detail', args=[self.period.id]),
+            'name': "evening",
+            'start_date': "2130-03-01",
+            'end_date': "2130-03-31",
+            'start_time': "18:00:00",
+            'end_time': "22:00:00",
+            'weekdays': [4, 0],
+        }
+
+        response = self.client.post(
+            reverse('timeslotrule-list'),
+            data,
+            format='json',
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_201_CREATED,
+            response.content,
+        )
+
+        content = json.loads(response.content)
+
+        self.assertEqual(content['weekdays'], [0, 4])
+        self.assertEqual(
+            TimeSlot.objects.filter(period=self.period).count(),
+            1,
+        )
+
+    def test_create_overlapping(self):
+        """
+        Ensure that a rule can't overlap occurrences of another rule.
+        """
+        self.client.force_authenticate(user=self.admin)
+
+        data = {
+            'period': reverse('period-detail', args=[self.period.id]),
+            'start_date': "2130-03-20",
+            'end_date': "2130-04-30",
+            'start_time': "11:00:00",
+            'end_time': "13:00:00",
+            'weekdays': [2],
+        }
+
+        response = self.client.post(
+            reverse('timeslotrule-list'),
+            data,
+            format='json',
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_400_BAD_REQUEST,
+            response.content,
+        )
+
+    def test_create_without_permission(self):
+        """
+        Ensure that a user can't create a rule.
+        """
+        self.client.force_authenticate(user=self.user)
+
+        data = {
+            'period': reverse('period-detail', args=[self.period.id]),
+            'start_date': "2130-04-01",
+            'end_date': "2130-04-30",
+            'start_time': "08:00:00",
+            'end_time': "12:00:00",
+            'weekdays': [0],
+        }
+
+        response = self.client.post(
+            reverse('timeslotrule-list'),
+            data,
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_list_occurrences(self):
+        """
+        Ensure that saved timeslots and occurrences of rules are listed
+        together within the requested window.
+        """
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(
+            reverse('timeslot-occurrences'),
+            {
+                'start_time__gte': LOCAL_TIMEZONE.localize(
+                    datetime(2130, 1, 1)
+                ).isoformat(),
+                'start_time__lte': LOCAL_TIMEZONE.localize(
+                    datetime(2130, 3, 8)
+                ).isoformat(),
+            },
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK,
+            response.content,
+        )
+
+        content = json.loads(response.content)
+
+        # The saved timeslot, Wednesday 1st, Monday 6th
+        self.assertEqual(len(content), 3)
+        self.assertEqual(content[0]['id'], self.time_slot.id)
+        self.assertEqual(content[0]['rule'], None)
+        self.assertEqual(content[1]['id'], None)
+        self.assertEqual(content[1]['url'], None)
+        self.assertEqual(
+            content[1]['rule'],
+            'http://testserver/time_slot_rules/' + str(self.rule.id),
+        )
+        self.assertEqual(content[1]['billing_price'], 3.0)
+        self.assertEqual(content[1]['places_remaining'], 40)
+
+    def test_list_occurrences_without_window(self):
+        """
+        Ensure that a window is required to list occurrences.
+        """
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(reverse('timeslot-occurrences'))
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_400_BAD_REQUEST,
+            response.content,
+        )
+
+    def test_materialize(self):
+        """
+        Ensure that an occurrence is saved only once and is not listed as an
+        occurrence of the rule afterwards.
+        """
+        self.client.force_authenticate(user=self.admin)
+
+        rule_occurrence = LOCAL_TIMEZONE.localize(datetime(2130, 3, 6, 8))
+
+        for _ in range(2):
+            response = self.client.post(
+                reverse('timeslotrule-materialize', args=[self.rule.id]),
+                {'rule_occurrence': rule_occurrence.isoformat()},
+                format='json',
+            )
+
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_201_CREATED,
+                response.content,
+            )
+
+        time_slot = TimeSlot.objects.get(rule=self.rule)
+
+        self.assertEqual(json.loads(response.content)['id'], time_slot.id)
+        self.assertEqual(time_slot.start_time, rule_occurrence)
+        self.assertEqual(time_slot.price, self.period.price)
+
+        response = self.client.get(
+            reverse('timeslot-occurrences'),
+            {
+                'start_time__gte': rule_occurrence.isoformat(),
+                'start_time__lte': rule_occurrence.isoformat(),
+            },
+        )
+
+        content = json.loads(response.content)
+
+        self.assertEqual(len(content), 1)
+        self.assertEqual(content[0]['id'], time_slot.id)
+
+    def test_materialize_invalid_occurrence(self):
+        """
+        Ensure that only occurrences of the rule can be saved.
+        """
+        self.client.force_authenticate(user=self.admin)
+
+        response = self.client.post(
+            reverse('timeslotrule-materialize', args=[self.rule.id]),
+            {
+                'rule_occurrence': LOCAL_TIMEZONE.localize(
+                    datetime(2130, 3, 4, 8)
+                ).isoformat(),
+            },
+            format='json',
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_400_BAD_REQUEST,
+            response.content,
+        )
+        self.assertFalse(TimeSlot.objects.filter(rule=self.rule).exists())
+
+    def test_materialize_as_user(self):
+        """
+        Ensure that a user can't save an occurrence without booking it.
+        """
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.post(
+            reverse('timeslotrule-materialize', args=[self.rule.id]),
+            {
+                'rule_occurrence': LOCAL_TIMEZONE.localize(
+                    datetime(2130, 3, 6, 8)
+                ).isoformat(),
+            },
+            format='json',
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_403_FORBIDDEN,
+            response.content,
+        )
+        self.assertFalse(TimeSlot.objects.filter(rule=self.rule).exists())
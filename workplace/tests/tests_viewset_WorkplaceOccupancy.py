@@ -0,0 +1,191 @@
+import json
+from datetime import date, datetime
+from io import StringIO
+
+import pytz
+from django.conf import settings
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from blitz_api.factories import UserFactory, AdminFactory
+from ..models import (Period, Reservation, TimeSlot, Workplace,
+                      WorkplaceOccupancy)
+from ..services import refresh_workplace_occupancy
+
+LOCAL_TIMEZONE = pytz.timezone(settings.TIME_ZONE)
+
+
+class WorkplaceOccupancyTests(APITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(WorkplaceOccupancyTests, cls).setUpClass()
+        cls.client = APIClient()
+        cls.user = UserFactory()
+        cls.user2 = UserFactory()
+        cls.user3 = UserFactory()
+        cls.admin = AdminFactory()
+        cls.workplace = Workplace.objects.create(
+            name="Blitz",
+            seats=40,
+            details="short_description",
+            address_line1="123 random street",
+            postal_code="123 456",
+            state_province="Random state",
+            country="Random country",
+            timezone="America/Montreal",
+        )
+        cls.period = Period.objects.create(
+            name="random_period",
+            workplace=cls.workplace,
+            start_date=LOCAL_TIMEZONE.localize(datetime(2130, 1, 1)),
+            end_date=LOCAL_TIMEZONE.localize(datetime(2130, 12, 31)),
+            price=3,
+            is_active=True,
+        )
+
+    def setUp(self):
+        self.time_slot = TimeSlot.objects.create(
+            period=self.period,
+            price=3,
+            start_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 8)),
+            end_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 12)),
+        )
+        self.time_slot2 = TimeSlot.objects.create(
+            period=self.period,
+            price=3,
+            start_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 8, 30)),
+            end_time=LOCAL_TIMEZONE.localize(datetime(2130, 1, 15, 12)),
+        )
+        Reservation.objects.create(
+            user=self.user,
+            timeslot=self.time_slot,
+            is_active=True,
+            is_present=True,
+        )
+        Reservation.objects.create(
+            user=self.user2,
+            timeslot=self.time_slot,
+            is_active=True,
+        )
+        Reservation.objects.create(
+            user=self.user3,
+            timeslot=self.time_slot2,
+            is_active=False,
+            cancelation_reason='U',
+        )
+
+    def test_refresh(self):
+        """
+        Ensure that reservations are counted per workplace, local date and
+        hour.
+        """
+        out = StringIO()
+        call_command('refresh_workplace_occupancy', '--full', stdout=out)
+
+        self.assertIn('1 occupancy row(s) refreshed', out.getvalue())
+
+        occupancy = WorkplaceOccupancy.objects.get()
+
+        self.assertEqual(occupancy.workplace, self.workplace)
+        self.assertEqual(occupancy.date, date(2130, 1, 15))
+        self.assertEqual(occupancy.weekday, 6)
+        self.assertEqual(occupancy.hour, 8)
+        self.assertEqual(occupancy.time_slots, 2)
+        self.assertEqual(occupancy.seats, 80)
+        self.assertEqual(occupancy.reservations, 3)
+        self.assertEqual(occupancy.active_reservations, 2)
+        self.assertEqual(occupancy.canceled_by_user, 1)
+        self.assertEqual(occupancy.canceled_timeslot_deleted, 0)
+        self.assertEqual(occupancy.canceled_timeslot_modified, 0)
+        self.assertEqual(occupancy.present, 1)
+        self.assertEqual(occupancy.absent, 1)
+
+    def test_refresh_incremental(self):
+        """
+        Ensure that only occupancies affected by changes since the previous
+        refresh are rebuilt, including the previous hour of a moved timeslot.
+        """
+        refresh_workplace_occupancy()
+        since = WorkplaceOccupancy.objects.get().refreshed
+
+        self.time_slot.start_time = LOCAL_TIMEZONE.localize(
+            datetime(2130, 1, 16, 14)
+        )
+        self.time_slot.end_time = LOCAL_TIMEZONE.localize(
+            datetime(2130, 1, 16, 16)
+        )
+        self.time_slot.save()
+
+        self.assertEqual(refresh_workplace_occupancy(since), 2)
+
+        occupancies = WorkplaceOccupancy.objects.all()
+
+        self.assertEqual(
+            [
+                (occupancy.date, occupancy.hour, occupancy.reservations)
+                for occupancy in occupancies
+            ],
+            [(date(2130, 1, 15), 8, 1), (date(2130, 1, 16), 14, 2)],
+        )
+
+        since = max(occupancy.refreshed for occupancy in occupancies)
+
+        with self.assertNumQueries(2):
+            self.assertEqual(refresh_workplace_occupancy(since), 0)
+
+    def test_list(self):
+        """
+        Ensure that an admin can list occupancies filtered by date.
+        """
+        refresh_workplace_occupancy()
+        occupancy = WorkplaceOccupancy.objects.get()
+
+        self.client.force_authenticate(user=self.admin)
+
+        response = self.client.get(
+            reverse('workplaceoccupancy-list'),
+            {
+                'workplace': self.workplace.id,
+                'date__gte': '2130-01-15',
+                'date__lte': '2130-01-15',
+            },
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK,
+            response.content,
+        )
+
+        content = json.loads(response.content)
+
+        self.assertEqual(content['count'], 1)
+        self.assertEqual(
+            content['results'][0]['url'],
+            'http://testserver/workplace_occupancies/' + str(occupancy.id),
+        )
+        self.assertEqual(
+            content['results'][0]['workplace'],
+            'http://testserver/workplaces/' + str(self.workplace.id),
+        )
+        self.assertEqual(content['results'][0]['present'], 1)
+
+        response = self.client.get(
+            reverse('workplaceoccupancy-list'),
+            {'date__gte': '2130-01-16'},
+        )
+
+        self.assertEqual(json.loads(response.content)['count'], 0)
+
+    def test_list_without_permission(self):
+        """
+        Ensure that a user can't list occupancies.
+        """
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(reverse('workplaceoccupancy-list'))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
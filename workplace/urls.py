@@ -35,7 +35,9 @@ router.register('workplaces', views.WorkplaceViewSet)
 router.register('pictures', views.PictureViewSet)
 router.register('periods', views.PeriodViewSet)
 router.register('time_slots', views.TimeSlotViewSet)
+router.register('time_slot_rules', views.TimeSlotRuleViewSet)
 router.register('reservations', views.ReservationViewSet)
+router.register('workplace_occupancies', views.WorkplaceOccupancyViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),  # includes router generated URL
@@ -1,7 +1,5 @@
 import pytz
 
-from copy import copy
-
 from datetime import datetime
 
 from dateutil.parser import parse
@@ -15,21 +13,25 @@ from rest_framework.permissions import IsAuthenticated, IsAdminUser
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.mail import send_mail as django_send_mail
 from django.db import transaction
-from django.db.models import F, Q
+from django.db.models import Count, F, Q
 from django.http import HttpResponse
-from django.template.loader import render_to_string
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from blitz_api.exceptions import MailServiceError
 from blitz_api.mixins import ExportMixin
 
-from .models import Workplace, Picture, Period, TimeSlot, Reservation
+from .filters import PeriodFilter, WorkplaceOccupancyFilter
+from .models import (Workplace, Picture, Period, TimeSlot, TimeSlotRule,
+                     Reservation, WorkplaceOccupancy)
 from .resources import (WorkplaceResource, PeriodResource, TimeSlotResource,
                         ReservationResource)
 
+from .services import (expand_time_slot_rules, get_volunteer_workplace_ids,
+                       is_workplace_volunteer, materialize_time_slot,
+                       notify_reservation_cancelation, update_attendance)
+
 from . import serializers, permissions
 
 User = get_user_model()
@@ -93,7 +95,20 @@ class PeriodViewSet(ExportMixin, viewsets.ModelViewSet):
     serializer_class = serializers.PeriodSerializer
     queryset = Period.objects.all()
     permission_classes = (permissions.IsAdminOrReadOnly,)
-    filter_fields = '__all__'
+    filter_class = PeriodFilter
+    ordering_fields = (
+        'name',
+        'workplace',
+        'price',
+        'start_date',
+        'end_date',
+        'is_active',
+        'reservations_count',
+        'active_reservations_count',
+        'time_slots_count',
+        'first_time_slot',
+        'last_time_slot',
+    )
     ordering = ('name',)
 
     export_resource = PeriodResource()
@@ -102,10 +117,39 @@ class PeriodViewSet(ExportMixin, viewsets.ModelViewSet):
         """
         This viewset should return active periods except if
         the currently authenticated user is an admin (is_staff).
+        Periods are annotated with their reservations and timeslots
+        statistics.
         """
         if self.request.user.is_staff:
-            return Period.objects.all()
-        return Period.objects.filter(is_active=True)
+            return Period.objects.with_stats()
+        return Period.objects.with_stats().filter(is_active=True)
+
+    @action(methods=['post'], detail=True, permission_classes=[IsAdminUser])
+    def clone(self, request, pk=None):
+        """
+        This custom action allows an admin to copy a period with all its
+        timeslots and timeslot rules to a new start date. Local times are
+        kept in the workplace's timezone.
+
+        Parameters:
+            start_date: date of the beginning of the new period.
+            is_active: activation of the new period, defaults to False.
+        """
+        period = self.get_object()
+
+        serializer = serializers.PeriodCloneSerializer(
+            data=request.data,
+            context={'period': period},
+        )
+        serializer.is_valid(raise_exception=True)
+        new_period = serializer.save()
+
+        data = serializers.PeriodSerializer(
+            Period.objects.with_stats().get(pk=new_period.pk),
+            context=self.get_serializer_context(),
+        ).data
+
+        return Response(data, status=status.HTTP_201_CREATED)
 
     def destroy(self, request, *args, **kwargs):
         """
@@ -149,7 +193,9 @@ class PeriodViewSet(ExportMixin, viewsets.ModelViewSet):
         )
 
         with transaction.atomic():
-            reservations_cancel_copy = copy(reservation_cancel)
+            reservations_cancel_copy = list(
+                reservation_cancel.select_related('user', 'timeslot')
+            )
 
             # The sequence is important here because the Queryset are
             # dynamically changing when doing update(). If the
@@ -172,27 +218,11 @@ class PeriodViewSet(ExportMixin, viewsets.ModelViewSet):
             )
             instance.delete()
 
-            for reservation in reservations_cancel_copy:
-                merge_data = {
-                    'TIMESLOT_LIST': [reservation.timeslot],
-                    'SUPPORT_EMAIL': settings.SUPPORT_EMAIL,
-                    'CUSTOM_MESSAGE': custom_message,
-                }
-                plain_msg = render_to_string(
-                    "cancelation.txt",
-                    merge_data
-                )
-                msg_html = render_to_string(
-                    "cancelation.html",
-                    merge_data
-                )
-                django_send_mail(
-                    "Annulation d'un bloc de rédaction",
-                    plain_msg,
-                    settings.DEFAULT_FROM_EMAIL,
-                    [reservation.user.email],
-                    html_message=msg_html,
-                )
+            # Send a single email per affected user
+            notify_reservation_cancelation(
+                reservations_cancel_copy,
+                custom_message,
+            )
 
             instance.time_slots.all().delete()
 
@@ -289,6 +319,165 @@ class TimeSlotViewSet(ExportMixin, viewsets.ModelViewSet):
 
         return Response(status=status.HTTP_201_CREATED)
 
+    @action(methods=['get'], detail=False)
+    def occurrences(self, request):
+        """
+        This custom action lists saved timeslots and occurrences of timeslot
+        rules starting within a time window, sorted by start time.
+        Occurrences of rules are computed on the fly: they have no `id` nor
+        `url` until they are booked (ie: an order line with the `timeslotrule`
+        content type, the rule as `object_id` and the `rule_occurrence`) or
+        saved by an admin through `time_slot_rules/{id}/materialize`.
+
+        Parameters:
+            start_time__gte: beginning of the window (isoformat), required.
+            start_time__lte: end of the window (isoformat), required.
+            period: optional period filter.
+            period__workplace: optional workplace filter.
+        """
+        window = serializers.TimeSlotWindowSerializer(
+            data=request.query_params,
+        )
+        window.is_valid(raise_exception=True)
+
+        time_slots = self.filter_queryset(
+            self.get_queryset()
+        ).select_related('period__workplace').annotate(
+            active_reservations=Count(
+                'reservations',
+                filter=Q(
+                    reservations__is_active=True,
+                    reservations__deleted__isnull=True,
+                ),
+            ),
+        ).order_by('start_time')
+
+        rules = TimeSlotRule.objects.filter(
+            period__deleted__isnull=True,
+        ).select_related('period__workplace')
+        if not request.user.is_staff:
+            rules = rules.filter(period__is_active=True)
+        for field in ['period', 'period__workplace']:
+            if request.query_params.get(field):
+                rules = rules.filter(**{field: request.query_params[field]})
+
+        occurrences = sorted(
+            list(time_slots) + expand_time_slot_rules(
+                rules,
+                window.validated_data['start_time__gte'],
+                window.validated_data['start_time__lte'],
+            ),
+            key=lambda time_slot: time_slot.start_time,
+        )
+
+        data = serializers.TimeSlotOccurrenceSerializer(
+            occurrences,
+            many=True,
+            context={'request': request},
+        ).data
+
+        return Response(data)
+
+    @action(methods=['post'], detail=False, permission_classes=[IsAdminUser])
+    def reschedule(self, request):
+        """
+        This custom action allows an admin to move multiple timeslots at
+        once. Timeslots are selected with the same query parameters as the
+        list (ie: `?period=1&start_time__gte=2019-11-25T00:00:00`), at least
+        one is required.
+
+        Parameters:
+            offset: duration added to start and end times (ie: '01:00:00').
+            OR
+            start_time & end_time: new local times (ie: '08:00:00') applied
+                to each timeslot on its own day.
+            force_update: required if active reservations are affected.
+                Those reservations are canceled and refunded.
+            custom_message: optional message sent to affected users.
+        """
+        filters = set()
+        for field, lookups in self.filter_fields.items():
+            filters.update(
+                field if lookup == 'exact' else field + '__' + lookup
+                for lookup in lookups
+            )
+        if not filters.intersection(request.query_params):
+            raise rest_framework.serializers.ValidationError({
+                'non_field_errors': [_(
+                    "At least one filter must be provided to select "
+                    "timeslots."
+                )],
+            })
+
+        time_slots = list(self.filter_queryset(
+            self.get_queryset()
+        ).select_related('period__workplace'))
+
+        serializer = serializers.TimeSlotRescheduleSerializer(
+            data=request.data,
+            context={'time_slots': time_slots},
+        )
+        serializer.is_valid(raise_exception=True)
+        reservations = serializer.save(history_user=request.user)
+
+        return Response({
+            'time_slots': len(time_slots),
+            'reservations_canceled': len(reservations),
+        })
+
+    @action(methods=['post'], detail=True,
+            permission_classes=[IsAuthenticated])
+    def attendance(self, request, pk=None):
+        """
+        This custom action allows an admin or a volunteer of the workplace to
+        mark users as present or absent for multiple reservations of the
+        timeslot at once.
+
+        Parameters: a list of
+            reservation: ID of an active reservation of the timeslot.
+            is_present: boolean.
+
+        ie:
+            [
+                {'reservation': 1, 'is_present': True},
+                {'reservation': 2, 'is_present': False}
+            ]
+        """
+        time_slot = self.get_object()
+
+        if not (request.user.is_staff or is_workplace_volunteer(
+                request.user, time_slot.period.workplace_id)):
+            self.permission_denied(request)
+
+        serializer = serializers.AttendanceSerializer(
+            data=request.data,
+            many=True,
+        )
+        serializer.is_valid(raise_exception=True)
+
+        attendances = {
+            attendance['reservation']: attendance['is_present']
+            for attendance in serializer.validated_data
+        }
+
+        reservations = list(time_slot.reservations.filter(
+            id__in=attendances,
+            is_active=True,
+        ))
+
+        unknown_ids = set(attendances) - {r.id for r in reservations}
+        if unknown_ids:
+            raise rest_framework.serializers.ValidationError({
+                'reservation': [_(
+                    "No active reservation of this timeslot matches the "
+                    "following IDs: {ids}."
+                ).format(ids=', '.join(map(str, sorted(unknown_ids))))],
+            })
+
+        update_attendance(reservations, attendances, request.user)
+
+        return Response(serializer.data)
+
     def filter_queryset(self, queryset):
         """
         This viewset should return active timeslots except if
@@ -340,7 +529,9 @@ class TimeSlotViewSet(ExportMixin, viewsets.ModelViewSet):
         )
 
         with transaction.atomic():
-            reservations_cancel_copy = copy(reservation_cancel)
+            reservations_cancel_copy = list(
+                reservation_cancel.select_related('user', 'timeslot')
+            )
 
             # The sequence is important here because the Queryset are
             # dynamically changing when doing update(). If the
@@ -364,31 +555,84 @@ class TimeSlotViewSet(ExportMixin, viewsets.ModelViewSet):
             )
             instance.delete()
 
-            for reservation in reservations_cancel_copy:
-                merge_data = {
-                    'TIMESLOT_LIST': [instance],
-                    'SUPPORT_EMAIL': settings.SUPPORT_EMAIL,
-                    'CUSTOM_MESSAGE': custom_message,
-                }
-                plain_msg = render_to_string(
-                    "cancelation.txt",
-                    merge_data
-                )
-                msg_html = render_to_string(
-                    "cancelation.html",
-                    merge_data
-                )
-                django_send_mail(
-                    "Annulation d'un bloc de rédaction",
-                    plain_msg,
-                    settings.DEFAULT_FROM_EMAIL,
-                    [reservation.user.email],
-                    html_message=msg_html,
-                )
+            # Send a single email per affected user
+            notify_reservation_cancelation(
+                reservations_cancel_copy,
+                custom_message,
+            )
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class TimeSlotRuleViewSet(viewsets.ModelViewSet):
+    """
+    retrieve:
+    Return the given time slot rule.
+
+    list:
+    Return a list of all the existing time slot rules.
+
+    create:
+    Create a new time slot rule instance. Its time slots are not created, see
+    `time_slots/occurrences`.
+    """
+    serializer_class = serializers.TimeSlotRuleSerializer
+    queryset = TimeSlotRule.objects.all()
+    permission_classes = (permissions.IsAdminOrReadOnly, )
+    filter_fields = {
+        'period__workplace': ['exact'],
+        'period__is_active': ['exact'],
+        'period': ['exact'],
+    }
+
+    @action(methods=['post'], detail=True, permission_classes=[IsAdminUser])
+    def materialize(self, request, pk=None):
+        """
+        This custom action allows an admin to save an occurrence of the rule
+        as a timeslot so that it can be modified (ie: a custom price) like
+        any other timeslot. The existing timeslot is returned if the
+        occurrence has already been saved. Occurrences are also saved when
+        they are booked.
+
+        Parameters:
+            rule_occurrence: start time of the occurrence (isoformat).
+        """
+        rule = self.get_object()
+
+        serializer = serializers.TimeSlotMaterializeSerializer(
+            data=request.data,
+        )
+        serializer.is_valid(raise_exception=True)
+
+        time_slot = materialize_time_slot(
+            rule,
+            serializer.validated_data['rule_occurrence'],
+        )
+        if time_slot is None:
+            raise rest_framework.serializers.ValidationError({
+                'rule_occurrence': [_(
+                    "This is not an available occurrence of the rule."
+                )],
+            })
+
+        data = serializers.TimeSlotSerializer(
+            time_slot,
+            context=self.get_serializer_context(),
+        ).data
+
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    def filter_queryset(self, queryset):
+        """
+        This viewset should return rules of active periods except if
+        the currently authenticated user is an admin (is_staff).
+        """
+        queryset = super(TimeSlotRuleViewSet, self).filter_queryset(queryset)
+        if self.request.user.is_staff:
+            return queryset
+        return queryset.filter(period__is_active=True)
+
+
 class ReservationViewSet(ExportMixin, viewsets.ModelViewSet):
     """
     retrieve:
@@ -425,10 +669,19 @@ class ReservationViewSet(ExportMixin, viewsets.ModelViewSet):
         user = self.request.user
         if user.is_staff:
             return Reservation.objects.all()
-        return Reservation.objects.filter(
-            Q(user=user) |
-            Q(timeslot__period__workplace__volunteers=user, is_active=True)
-        )
+
+        workplace_ids = get_volunteer_workplace_ids(user)
+        if not workplace_ids:
+            return Reservation.objects.filter(user=user)
+
+        # Two indexed queries combined with UNION instead of a single OR
+        # across the volunteers join.
+        owned = Reservation.objects.filter(user=user).values('pk')
+        volunteered = Reservation.objects.filter(
+            timeslot__period__workplace_id__in=workplace_ids,
+            is_active=True,
+        ).values('pk')
+        return Reservation.objects.filter(pk__in=owned.union(volunteered))
 
     def get_permissions(self):
         """
@@ -470,3 +723,20 @@ class ReservationViewSet(ExportMixin, viewsets.ModelViewSet):
             instance.cancelation_date = timezone.now()
             instance.save()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class WorkplaceOccupancyViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    retrieve:
+    Return the given workplace occupancy.
+
+    list:
+    Return the reservations of the time slots of workplaces per local date
+    and hour of their start time. Rows are refreshed periodically by the
+    `refresh_workplace_occupancy` management command.
+    """
+    serializer_class = serializers.WorkplaceOccupancySerializer
+    queryset = WorkplaceOccupancy.objects.all()
+    permission_classes = (IsAdminUser, )
+    filter_class = WorkplaceOccupancyFilter
+    ordering_fields = ('date', 'weekday', 'hour')